@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Times join_flv.concat_flv() on synthetic parts.
+
+Usage: [python3] join_flv.py [--parts N] [--tags N] [--body BYTES]
+
+Every part holds `tags` tags alternating between video and audio, with
+video bodies of `body` bytes and audio bodies of a tenth of that. The
+defaults make about 2 GB of input.
+"""
+
+import getopt
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from you_get.processor import join_flv
+
+def tag(previous_tag_size, data_type, timestamp, body):
+    return struct.pack('>IBHBHBBHB', previous_tag_size, data_type,
+                       len(body) >> 8, len(body) & 0xff,
+                       timestamp >> 8 & 0xffff, timestamp & 0xff,
+                       timestamp >> 24 & 0xff, 0, 0) + body
+
+def make_flv(path, tags, body_size):
+    """Writes an FLV with `tags` tags, 40 ms apart, and a keyframe in every
+    50 video tags."""
+    meta = join_flv.ECMAObject(1)
+    meta.put('duration', tags / 2 * 0.04)
+    meta_body = join_flv.BytesIO()
+    join_flv.write_amf(meta_body, 'onMetaData')
+    join_flv.write_amf(meta_body, meta)
+    meta_body = meta_body.getvalue()
+
+    keyframe = b'\x17' + b'\x00' * (body_size - 1)
+    interframe = b'\x27' + b'\x00' * (body_size - 1)
+    audio = b'\xaf' + b'\x00' * (body_size // 10 - 1)
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(b'FLV\x01\x05\x00\x00\x00\x09')
+        f.write(tag(0, join_flv.TAG_TYPE_METADATA, 0, meta_body))
+        previous = 11 + len(meta_body)
+        for i in range(tags):
+            if i % 2:
+                body = audio
+                data_type = 8
+            else:
+                body = interframe if i % 100 else keyframe
+                data_type = 9
+            f.write(tag(previous, data_type, i // 2 * 40, body))
+            previous = 11 + len(body)
+        f.write(struct.pack('>I', previous))
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], '', ['parts=', 'tags=', 'body='])
+    opts = dict(opts)
+    parts = int(opts.get('--parts', 4))
+    tags = int(opts.get('--tags', 200000))
+    body_size = int(opts.get('--body', 4500))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [os.path.join(tmp, '%d.flv' % i) for i in range(parts)]
+        for f in files:
+            make_flv(f, tags, body_size)
+        size = sum(map(os.path.getsize, files))
+        output = os.path.join(tmp, 'output.flv')
+
+        start = time.perf_counter()
+        join_flv.concat_flv(files, output)
+        elapsed = time.perf_counter() - start
+
+    print('%d parts x %d tags (%.2f GB): %.2f s' % (parts, tags, size / 1024 ** 3, elapsed))
+
+if __name__ == '__main__':
+    main()
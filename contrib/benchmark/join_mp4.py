@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Times join_mp4.merge_mp4s() on synthetic parts with large sample tables.
+
+Usage: [python3] join_mp4.py [--parts N] [--samples N] [--memory]
+
+The parts hold one video and one AAC track with tiny samples, so the run
+time is spent on the sample tables rather than on copying media data.
+"""
+
+import getopt
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from you_get.processor import join_mp4
+
+def atom(type, *payloads):
+    body = b''.join(payloads)
+    return struct.pack('>I', 8 + len(body)) + type + body
+
+def uints(*values):
+    return struct.pack('>%dI' % len(values), *values)
+
+def table(type, entries, width=1, prefix=b''):
+    flat = [x for entry in entries for x in entry] if width > 1 else list(entries)
+    return atom(type, uints(0), prefix, uints(len(entries)), uints(*flat))
+
+def trak(track_id, handler, duration, sample_entry, sizes, offsets, per_chunk, sync=None, ctts=None):
+    media_header = atom(b'vmhd', uints(1), b'\x00' * 8) if handler == b'vide' \
+        else atom(b'smhd', uints(0), b'\x00' * 4)
+    stbl = [atom(b'stsd', uints(0, 1), sample_entry),
+            table(b'stts', [(len(sizes), 1000)], 2)]
+    if sync is not None:
+        stbl.append(table(b'stss', sync))
+    stbl += [table(b'stsc', [(1, per_chunk, 1)], 3),
+             atom(b'stsz', uints(0, 0, len(sizes)), uints(*sizes)),
+             table(b'stco', offsets)]
+    if ctts is not None:
+        stbl.append(table(b'ctts', ctts, 2))
+    return atom(b'trak',
+        atom(b'tkhd', uints(3, 0, 0, track_id, 0, duration), b'\x00' * 8,
+             b'\x00' * 8, b'\x00' * 36, uints(0, 0)),
+        atom(b'mdia',
+             atom(b'mdhd', uints(0, 0, 0, 1000, duration), b'\x00' * 4),
+             atom(b'hdlr', uints(0, 0), handler, b'\x00' * 12, b'\x00'),
+             atom(b'minf', media_header,
+                  atom(b'dinf', atom(b'dref', uints(0, 1), atom(b'url ', uints(1)))),
+                  atom(b'stbl', *stbl))))
+
+avc1 = atom(b'avc1', b'\x00' * 6, struct.pack('>H', 1), b'\x00' * 16,
+            struct.pack('>HH', 640, 360), uints(0x480000, 0x480000, 0),
+            struct.pack('>H', 1), b'\x00' * 32, struct.pack('>H', 24), b'\xff\xff',
+            atom(b'avcC', b'\x01\x64\x00\x1f\xff\xe0\x00'))
+mp4a = atom(b'mp4a', b'\x00' * 6, struct.pack('>H', 1), b'\x00' * 8,
+            struct.pack('>HH', 2, 16), b'\x00' * 4, struct.pack('>H', 44100), b'\x00' * 2,
+            atom(b'esds', uints(0), b'\x03\x19\x00\x00\x00'))
+
+def make_mp4(path, samples):
+    """Writes an MP4 with `samples` video and as many audio samples."""
+    video_sizes = [1 + i % 7 for i in range(samples)]
+    audio_sizes = [1 + i % 5 for i in range(samples)]
+    # one video chunk of 2 samples, then one audio chunk of 2 samples
+    chunks = samples // 2
+    ftyp = atom(b'ftyp', b'isom', uints(512), b'isomiso2avc1mp41')
+
+    def moov(video_offsets, audio_offsets):
+        return atom(b'moov',
+            atom(b'mvhd', uints(0, 0, 0, 1000, samples * 1000, 0x10000),
+                 struct.pack('>H', 0x100), b'\x00' * 10, b'\x00' * 36,
+                 b'\x00' * 24, uints(3)),
+            trak(1, b'vide', samples * 1000, avc1, video_sizes, video_offsets, 2,
+                 sync=range(1, samples + 1, 25), ctts=[(1, 2000)] * samples),
+            trak(2, b'soun', samples * 1000, mp4a, audio_sizes, audio_offsets, 2))
+
+    start = len(ftyp) + len(moov([0] * chunks, [0] * chunks)) + 8
+    video_offsets, audio_offsets = [], []
+    offset = start
+    for i in range(chunks):
+        video_offsets.append(offset)
+        offset += video_sizes[2 * i] + video_sizes[2 * i + 1]
+        audio_offsets.append(offset)
+        offset += audio_sizes[2 * i] + audio_sizes[2 * i + 1]
+    mdat = atom(b'mdat', b'\x00' * (offset - start))
+    with open(path, 'wb') as f:
+        f.write(ftyp + moov(video_offsets, audio_offsets) + mdat)
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], '', ['parts=', 'samples=', 'memory'])
+    opts = dict(opts)
+    parts = int(opts.get('--parts', 8))
+    samples = int(opts.get('--samples', 200000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [os.path.join(tmp, '%d.mp4' % i) for i in range(parts)]
+        for f in files:
+            make_mp4(f, samples)
+        output = os.path.join(tmp, 'output.mp4')
+
+        if '--memory' in opts:
+            # slows the run down, time it separately
+            tracemalloc.start()
+        start = time.perf_counter()
+        join_mp4.merge_mp4s(files, output)
+        elapsed = time.perf_counter() - start
+
+    print('%d parts x %d samples: %.2f s' % (parts, samples, elapsed))
+    if '--memory' in opts:
+        peak = tracemalloc.get_traced_memory()[1]
+        print('peak memory: %.1f MB' % (peak / 1024 / 1024))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Times the start-up of you-get, in fresh interpreters.
+
+Usage: [python3] startup.py [--runs N] [URL]
+
+Reports the median wall time of importing you_get.common, of resolving URL
+(a YouTube video by default) to its extractor, and of importing every
+extractor.
+"""
+
+import getopt
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src')
+
+def run(code, runs):
+    env = dict(os.environ, PYTHONPATH=src)
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], '', ['runs='])
+    runs = int(dict(opts).get('--runs', 20))
+    url = args[0] if args else 'https://www.youtube.com/watch?v=jNQXAC9IVRw'
+
+    cases = [
+        ('python', 'pass'),
+        ('import you_get.common', 'import you_get.common'),
+        ('url_to_module', 'from you_get.common import url_to_module; '
+                          'url_to_module(%r)' % url),
+        ('all extractors', 'from you_get.extractors import *'),
+    ]
+    for name, code in cases:
+        print('%-22s %6.1f ms' % (name, run(code, runs) * 1000))
+
+if __name__ == '__main__':
+    main()
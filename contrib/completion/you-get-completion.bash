@@ -8,10 +8,18 @@ _you-get () {
     opts_without_arg=(
         -V --version -h --help -i --info -u --url --json -n --no-merge
         --no-caption -f --force --no-proxy -d --debug
+        --http-cache
+        --incremental-merge
     )
     opts_with_arg=(
         -F --format -O --output-filename -o --output-dir -p --player
         -c --cookies -x --http-proxy -y --extractor-proxy -t --timeout
+        --site-jobs
+        --batch-jobs
+        --progress
+        --limit-rate
+        --connections
+        -j --jobs
     )
 
     # Do not complete non option names
@@ -20,4 +20,12 @@ complete -c you-get -s x -l http-proxy -x -d 'use the specified HTTP proxy for d
 complete -c you-get -s y -l extractor-proxy -x -d 'use the specified HTTP proxy for extraction only'
 complete -c you-get -l no-proxy -d 'do not use a proxy'
 complete -c you-get -s t -l timeout -x -d 'set socket timeout'
+complete -c you-get -s j -l jobs -x -d 'download up to N video parts at once'
+complete -c you-get -l connections -x -d 'download a file over N connections'
+complete -c you-get -l limit-rate -x -d 'Limit download speed'
+complete -c you-get -l progress -x -d 'Progress display (bar, json, none)'
+complete -c you-get -l incremental-merge -d 'Merge video parts as they are downloaded'
+complete -c you-get -l http-cache -d 'Cache web pages and API responses on disk'
+complete -c you-get -l batch-jobs -x -d 'Download up to N of the URLs at once'
+complete -c you-get -l site-jobs -x -d 'Download up to N URLs from one site at once'
 complete -c you-get -s d -l debug -d 'show traceback and other debug info'
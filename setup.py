@@ -35,6 +35,7 @@ setup(
 
     test_suite = 'tests',
 
+    python_requires = '>=3.7',
     platforms = 'any',
     zip_safe = True,
     include_package_data = True,
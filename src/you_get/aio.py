@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+
+"""An asyncio download engine.
+
+Awaitable counterparts of get_content(), post_content(), url_info(),
+url_save() and download_urls() in common, for running many downloads on a
+single event loop. HTTP/1.1 connections are kept alive and shared per host
+within a Session.
+
+The blocking functions in common remain the ones used by the extractors;
+run() drives any of the coroutines here from synchronous code:
+
+    run(download_urls(urls, title, 'flv', None, output_dir='.'))
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import socket
+import ssl
+from http.client import parse_headers
+from io import BytesIO
+from urllib import parse, request
+
+from . import common
+from .common import fake_headers, match1, tr, ungzip, undeflate
+from .util.ratelimit import limiter
+from .util.strings import get_filename
+
+class HTTPError(Exception):
+    def __init__(self, url, status, reason, headers):
+        Exception.__init__(self, 'HTTP Error %s: %s (%s)' % (status, reason, url))
+        self.url = url
+        self.code = status
+        self.reason = reason
+        self.headers = headers
+
+class Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+class Response:
+    """The status, headers and body stream of an HTTP response."""
+
+    def __init__(self, session, conn, method, url, status, reason, headers):
+        self.session = session
+        self.conn = conn
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.will_close = (headers.get('connection', '').lower() == 'close')
+        self.chunked = (headers.get('transfer-encoding', '').lower() == 'chunked')
+        self.chunk_left = None
+        length = headers.get('content-length')
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self.length = 0
+        elif self.chunked:
+            self.length = None
+        elif length is not None:
+            self.length = int(length)
+        else:
+            # delimited by the end of the connection
+            self.length = None
+            self.will_close = True
+        if self.length == 0:
+            self._done()
+
+    def info(self):
+        # for cookiejar.extract_cookies()
+        return self.headers
+
+    def _done(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            self.session.release(conn, not self.will_close)
+
+    def close(self):
+        """Drops the rest of the body, and the connection with it."""
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            self.session.release(conn, False)
+
+    async def _readline(self):
+        return await self.session.wait(self.conn.reader.readline())
+
+    async def read(self, n=-1):
+        """Reads up to n bytes of the body (all of it if n < 0); b'' at the end."""
+        if self.conn is None:
+            return b''
+        if n < 0:
+            chunks = []
+            while True:
+                data = await self.read(1024 * 256)
+                if not data:
+                    return b''.join(chunks)
+                chunks.append(data)
+
+        reader = self.conn.reader
+        if self.chunked:
+            if not self.chunk_left:
+                if self.chunk_left is not None:
+                    await self.session.wait(reader.readexactly(2))
+                line = await self._readline()
+                self.chunk_left = int(line.split(b';')[0].strip(), 16)
+                if self.chunk_left == 0:
+                    # skip trailers
+                    while (await self._readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._done()
+                    return b''
+            data = await self.session.wait(reader.read(min(n, self.chunk_left)))
+            if not data:
+                self.close()
+                raise ConnectionError('connection closed in the middle of a chunk')
+            self.chunk_left -= len(data)
+            return data
+
+        if self.length is not None:
+            n = min(n, self.length)
+        data = await self.session.wait(reader.read(n))
+        if self.length is not None:
+            if not data:
+                self.close()
+                raise ConnectionError('connection closed with %s bytes left' % self.length)
+            self.length -= len(data)
+            if self.length == 0:
+                self._done()
+        elif not data:
+            self._done()
+        return data
+
+def get_proxy(scheme, host):
+    """Returns the HTTP proxy of the current download context for a host,
+    as (host, port, credentials), or None to connect directly.
+
+    Like the urllib openers, a context without a proxy of its own uses the
+    system settings (the *_proxy variables, and no_proxy).
+    """
+    proxy = common.get_context().proxy
+    if proxy is None:
+        if request.proxy_bypass(host):
+            return None
+        proxy = request.getproxies().get(scheme)
+    if not proxy:
+        return None
+    if '//' not in proxy:
+        proxy = '//' + proxy
+    o = parse.urlsplit(proxy)
+    credentials = None
+    if o.username is not None:
+        user_pass = '%s:%s' % (parse.unquote(o.username),
+                               parse.unquote(o.password or ''))
+        credentials = base64.b64encode(user_pass.encode('utf-8')).decode('ascii')
+    return o.hostname, o.port or 8080, credentials
+
+class Session:
+    """A pool of keep-alive connections, and the requests sent over them.
+
+    At most `max_idle` idle connections are kept per host. `timeout` bounds
+    every connect and read; if None, the timeout of the current download
+    context, or else the socket default, is used. Requests go through the
+    HTTP proxy of the context (see get_proxy()), tunnelled with CONNECT for
+    https.
+    """
+
+    def __init__(self, max_idle=4, timeout=None):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = {}
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        timeout = common.get_context().timeout
+        return timeout if timeout is not None else socket.getdefaulttimeout()
+
+    async def wait(self, aw):
+        timeout = self.get_timeout()
+        if timeout is None:
+            return await aw
+        return await asyncio.wait_for(aw, timeout)
+
+    async def connect(self, key):
+        scheme, host, port, proxy = key
+        if scheme == 'https':
+            context = ssl.create_default_context()
+        else:
+            context = None
+        if proxy is None:
+            reader, writer = await self.wait(asyncio.open_connection(host, port, ssl=context))
+        elif context is None:
+            # plain http goes to the proxy, with absolute URLs
+            reader, writer = await self.wait(asyncio.open_connection(proxy[0], proxy[1]))
+        else:
+            sock = await self.wait(self.tunnel(proxy, host, port))
+            reader, writer = await self.wait(asyncio.open_connection(
+                sock=sock, ssl=context, server_hostname=host))
+        return Connection(key, reader, writer)
+
+    async def tunnel(self, proxy, host, port):
+        """Returns a socket to host:port through a CONNECT request to proxy."""
+        loop = asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(proxy[0], proxy[1], type=socket.SOCK_STREAM)
+        family, type, proto, _, address = infos[0]
+        sock = socket.socket(family, type, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+            lines = ['CONNECT %s:%s HTTP/1.1' % (host, port), 'Host: %s:%s' % (host, port)]
+            if proxy[2]:
+                lines.append('Proxy-Authorization: Basic %s' % proxy[2])
+            await loop.sock_sendall(sock, ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            # the proxy sends nothing after its headers until we speak TLS
+            head = b''
+            while b'\r\n\r\n' not in head:
+                data = await loop.sock_recv(sock, 4096)
+                if not data:
+                    raise ConnectionResetError('connection closed by proxy')
+                head += data
+            status_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+            status = (status_line.split(' ', 2) + [''])[1]
+            if status != '200':
+                raise ConnectionRefusedError('proxy refused CONNECT to %s:%s: %s' % (host, port, status_line))
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def release(self, conn, reusable):
+        idle = self.idle.setdefault(conn.key, [])
+        if reusable and len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    async def _send(self, conn, method, selector, headers, data):
+        lines = ['%s %s HTTP/1.1' % (method, selector)]
+        lines += ['%s: %s' % (k, v) for k, v in headers.items()]
+        conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if data:
+            conn.writer.write(data)
+        await self.wait(conn.writer.drain())
+
+        status_line = await self.wait(conn.reader.readline())
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        header_lines = []
+        while True:
+            line = await self.wait(conn.reader.readline())
+            header_lines.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        return int(status), reason, parse_headers(BytesIO(b''.join(header_lines)))
+
+    async def request(self, method, url, headers={}, data=None, redirects=10):
+        """Sends a request and returns the Response, with its body unread.
+
+        Redirects are followed, and the cookies of the current download context
+        are sent.
+        Raises HTTPError for status codes of 400 and above.
+        """
+        logging.debug('aio.request: %s %s' % (method, url))
+        o = parse.urlsplit(url)
+        port = o.port or (443 if o.scheme == 'https' else 80)
+        proxy = get_proxy(o.scheme, o.hostname)
+        key = (o.scheme, o.hostname, port, proxy)
+        if proxy is not None and o.scheme == 'http':
+            selector = parse.urlunsplit((o.scheme, o.netloc, o.path or '/', o.query, ''))
+        else:
+            selector = parse.urlunsplit(('', '', o.path or '/', o.query, ''))
+
+        req = request.Request(url, headers=headers)
+        cookies = common.get_context().cookies
+        if cookies:
+            cookies.add_cookie_header(req)
+        all_headers = {'Host': o.netloc, 'Accept-Encoding': 'identity'}
+        all_headers.update((k.title(), v) for k, v in req.header_items())
+        if data is not None:
+            all_headers['Content-Length'] = str(len(data))
+        if proxy is not None and o.scheme == 'http' and proxy[2]:
+            all_headers['Proxy-Authorization'] = 'Basic %s' % proxy[2]
+
+        idle = self.idle.get(key)
+        conn = idle.pop() if idle else None
+        while True:
+            reused = conn is not None
+            if not reused:
+                conn = await self.connect(key)
+            try:
+                status, reason, response_headers = await self._send(conn, method, selector, all_headers, data)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if not reused:
+                    raise
+                # the server dropped an idle connection, retry on a new one
+                conn = None
+            except:
+                conn.close()
+                raise
+
+        response = Response(self, conn, method, url, status, reason, response_headers)
+        if cookies:
+            cookies.extract_cookies(response, req)
+
+        location = response_headers.get('location')
+        if status in (301, 302, 303, 307, 308) and location and redirects > 0:
+            response.close()
+            if status == 303 or (status in (301, 302) and method == 'POST'):
+                method, data = 'GET', None
+            return await self.request(method, parse.urljoin(url, location),
+                                      headers=headers, data=data,
+                                      redirects=redirects - 1)
+        if status >= 400:
+            response.close()
+            raise HTTPError(url, status, reason, response_headers)
+        return response
+
+_sessions = {}
+
+def get_session():
+    """Returns the Session shared by the coroutines on the running loop."""
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None:
+        session = _sessions[loop] = Session()
+    return session
+
+def run(coro):
+    """Runs a coroutine of this module to completion, on a new event loop."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            session = _sessions.pop(asyncio.get_event_loop(), None)
+            if session is not None:
+                session.close()
+    return asyncio.run(main())
+
+def _decode(response, data, decoded):
+    content_encoding = response.headers.get('Content-Encoding')
+    if content_encoding == 'gzip':
+        data = ungzip(data)
+    elif content_encoding == 'deflate':
+        data = undeflate(data)
+
+    if decoded:
+        charset = match1(response.headers.get('Content-Type', ''), r'charset=([\w-]+)')
+        if charset is not None:
+            data = data.decode(charset)
+        else:
+            data = data.decode('utf-8', 'ignore')
+    return data
+
+async def get_content(url, headers={}, decoded=True, session=None):
+    """Gets the content of a URL via sending a HTTP GET request."""
+    session = session or get_session()
+    response = await session.request('GET', url, headers=headers)
+    return _decode(response, await response.read(), decoded)
+
+async def post_content(url, headers={}, post_data={}, decoded=True, session=None):
+    """Post the content of a URL via sending a HTTP POST request."""
+    session = session or get_session()
+    headers = dict(headers)
+    headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+    post_data_enc = bytes(parse.urlencode(post_data), 'utf-8')
+    response = await session.request('POST', url, headers=headers, data=post_data_enc)
+    return _decode(response, await response.read(), decoded)
+
+async def url_info(url, faker=False, headers={}, session=None):
+    session = session or get_session()
+    if faker:
+        headers = fake_headers
+    try:
+        response = await session.request('HEAD', url, headers=headers)
+    except HTTPError:
+        response = None
+    if response is None or response.headers['content-length'] is None:
+        response = await session.request('GET', url, headers=headers)
+        response.close()
+    return common.headers_info(response.headers)
+
+async def url_size(url, faker=False, headers={}, session=None):
+    _, _, size = await url_info(url, faker=faker, headers=headers, session=session)
+    return size if size is not None else float('inf')
+
+async def url_save(url, filepath, bar, refer=None, is_part=False, faker=False, headers={}, file_size=None, session=None, **kwargs):
+    """Saves a URL to a file, resuming a previous .download file if any."""
+    session = session or get_session()
+    if faker:
+        headers = dict(fake_headers)
+    else:
+        headers = dict(headers)
+    if refer is not None:
+        headers['Referer'] = refer
+
+    def skip():
+        if not is_part:
+            if bar:
+                bar.done()
+            print('Skipping %s: file already exists' % tr(os.path.basename(filepath)))
+        elif bar:
+            bar.update_received(file_size)
+
+    force = common.get_context().force
+    if not force and file_size and os.path.exists(filepath) and \
+            file_size == os.path.getsize(filepath):
+        skip()
+        return
+
+    temp_filepath = filepath + '.download'
+    received = 0
+    if not force and os.path.exists(temp_filepath) and \
+            not os.path.exists(temp_filepath + '.ranges'):
+        received = os.path.getsize(temp_filepath)
+
+    async def open_from(start):
+        headers['Range'] = 'bytes=%s-' % start
+        return await session.request('GET', url, headers=headers)
+
+    try:
+        response = await open_from(received)
+    except HTTPError as e:
+        if e.code != 416 or not received:
+            raise
+        total = match1(e.headers.get('content-range', ''), r'/(\d+)$')
+        if total and int(total) == received:
+            response = None
+        else:
+            received = 0
+            response = await open_from(0)
+
+    if response is None:
+        range_start = file_size = received
+    elif response.status == 206 and response.headers['content-range']:
+        content_range = response.headers['content-range'][6:]
+        range_start = int(content_range.split('/')[0].split('-')[0])
+        total = content_range.split('/')[1]
+        file_size = int(total) if total != '*' else float('inf')
+    else: # Range ignored
+        range_start = 0
+        file_size = response.length if response.length is not None else float('inf')
+
+    if os.path.exists(filepath):
+        if not force and file_size == os.path.getsize(filepath):
+            if response:
+                response.close()
+            skip()
+            return
+        elif not is_part:
+            if bar:
+                bar.done()
+            print('Overwriting %s' % tr(os.path.basename(filepath)), '...')
+    elif not os.path.exists(os.path.dirname(filepath)):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    if range_start == received:
+        open_mode = 'ab'
+    else:
+        received = 0
+        open_mode = 'wb'
+    if bar and received:
+        bar.update_received(received)
+
+    if response:
+        host = parse.urlsplit(url).hostname
+        with open(temp_filepath, open_mode) as output:
+            while True:
+                buffer = await response.read(limiter.read_size(host, 1024 * 256))
+                if not buffer:
+                    if received == file_size or file_size == float('inf'):
+                        break
+                    # Unexpected termination. Retry request
+                    response = await open_from(received)
+                    continue
+                output.write(buffer)
+                received += len(buffer)
+                if bar:
+                    bar.update_received(len(buffer))
+                delay = limiter.reserve(host, len(buffer))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    assert received == os.path.getsize(temp_filepath), '%s == %s == %s' % (received, os.path.getsize(temp_filepath), temp_filepath)
+
+    if os.access(filepath, os.W_OK):
+        os.remove(filepath) # on Windows rename could fail if destination filepath exists
+    os.rename(temp_filepath, filepath)
+
+async def download_urls(urls, title, ext, total_size, output_dir='.', refer=None, merge=True, faker=False, headers={}, session=None, jobs=None, **kwargs):
+    """Downloads the parts of a video, up to `jobs` (the jobs of the current
+    download context by default) at once, and merges them in a worker thread."""
+    assert urls
+    session = session or get_session()
+    ctx = common.get_context()
+    if ctx.json_output or ctx.dry_run or ctx.player:
+        # nothing to transfer
+        return common.download_urls(urls, title, ext, total_size, output_dir=output_dir,
+                                    refer=refer, merge=merge, faker=faker, headers=headers, **kwargs)
+
+    file_sizes = None
+    if not total_size:
+        file_sizes = await asyncio.gather(*[url_size(url, faker=faker, headers=headers, session=session)
+                                            for url in urls])
+        total_size = sum(file_sizes)
+    elif len(urls) == 1:
+        file_sizes = [total_size]
+    file_sizes = file_sizes or [None] * len(urls)
+
+    title = tr(get_filename(title))
+    output_filename = common.get_output_filename(urls, title, ext, output_dir, merge)
+    output_filepath = os.path.join(output_dir, output_filename)
+
+    if total_size:
+        if not ctx.force and os.path.exists(output_filepath) and os.path.getsize(output_filepath) >= total_size * 0.9:
+            print('Skipping %s: file already exists' % output_filepath)
+            print()
+            return
+        bar = common.SimpleProgressBar(total_size, len(urls), title=output_filename)
+    else:
+        bar = common.PiecesProgressBar(total_size, len(urls), title=output_filename)
+
+    if len(urls) == 1:
+        print('Downloading %s ...' % tr(output_filename))
+        bar.update()
+        await url_save(urls[0], output_filepath, bar, refer=refer, faker=faker, headers=headers,
+                       file_size=file_sizes[0], session=session)
+        bar.done()
+        print()
+        return
+
+    parts = [os.path.join(output_dir, '%s[%02d].%s' % (title, i, ext)) for i in range(len(urls))]
+    print('Downloading %s.%s ...' % (tr(title), ext))
+    bar.update()
+    semaphore = asyncio.Semaphore(jobs or ctx.jobs)
+    async def save_part(i):
+        async with semaphore:
+            await url_save(urls[i], parts[i], bar, refer=refer, is_part=True, faker=faker,
+                           headers=headers, file_size=file_sizes[i], session=session)
+            bar.update_piece(i + 1)
+    await asyncio.gather(*[save_part(i) for i in range(len(urls))])
+    bar.done()
+
+    if merge:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, lambda: common.merge_parts(parts, output_filepath, ext, av=kwargs.get('av')))
+    print()
@@ -1,102 +1,6 @@
 #!/usr/bin/env python
 
-SITES = {
-    '163'              : 'netease',
-    '56'               : 'w56',
-    'acfun'            : 'acfun',
-    'archive'          : 'archive',
-    'baidu'            : 'baidu',
-    'bandcamp'         : 'bandcamp',
-    'baomihua'         : 'baomihua',
-    'bigthink'         : 'bigthink',
-    'bilibili'         : 'bilibili',
-    'cctv'             : 'cntv',
-    'cntv'             : 'cntv',
-    'cbs'              : 'cbs',
-    'dailymotion'      : 'dailymotion',
-    'dilidili'         : 'dilidili',
-    'douban'           : 'douban',
-    'douyu'            : 'douyutv',
-    'ehow'             : 'ehow',
-    'facebook'         : 'facebook',
-    'fc2'              : 'fc2video',
-    'flickr'           : 'flickr',
-    'freesound'        : 'freesound',
-    'fun'              : 'funshion',
-    'google'           : 'google',
-    'heavy-music'      : 'heavymusic',
-    'huaban'           : 'huaban',
-    'huomao'           : 'huomaotv',
-    'iask'             : 'sina',
-    'icourses'         : 'icourses',
-    'ifeng'            : 'ifeng',
-    'imgur'            : 'imgur',
-    'in'               : 'alive',
-    'infoq'            : 'infoq',
-    'instagram'        : 'instagram',
-    'interest'         : 'interest',
-    'iqilu'            : 'iqilu',
-    'iqiyi'            : 'iqiyi',
-    'isuntv'           : 'suntv',
-    'joy'              : 'joy',
-    'kankanews'        : 'bilibili',
-    'khanacademy'      : 'khan',
-    'ku6'              : 'ku6',
-    'kugou'            : 'kugou',
-    'kuwo'             : 'kuwo',
-    'le'               : 'le',
-    'letv'             : 'le',
-    'lizhi'            : 'lizhi',
-    'magisto'          : 'magisto',
-    'metacafe'         : 'metacafe',
-    'mgtv'             : 'mgtv',
-    'miomio'           : 'miomio',
-    'mixcloud'         : 'mixcloud',
-    'mtv81'            : 'mtv81',
-    'musicplayon'      : 'musicplayon',
-    'naver'            : 'naver',
-    '7gogo'            : 'nanagogo',
-    'nicovideo'        : 'nicovideo',
-    'panda'            : 'panda',
-    'pinterest'        : 'pinterest',
-    'pixnet'           : 'pixnet',
-    'pptv'             : 'pptv',
-    'qq'               : 'qq',
-    'quanmin'          : 'quanmin',
-    'showroom-live'    : 'showroom',
-    'sina'             : 'sina',
-    'smgbb'            : 'bilibili',
-    'sohu'             : 'sohu',
-    'soundcloud'       : 'soundcloud',
-    'ted'              : 'ted',
-    'theplatform'      : 'theplatform',
-    'tucao'            : 'tucao',
-    'tudou'            : 'tudou',
-    'tumblr'           : 'tumblr',
-    'twimg'            : 'twitter',
-    'twitter'          : 'twitter',
-    'ucas'             : 'ucas',
-    'videomega'        : 'videomega',
-    'vidto'            : 'vidto',
-    'vimeo'            : 'vimeo',
-    'wanmen'           : 'wanmen',
-    'weibo'            : 'miaopai',
-    'veoh'             : 'veoh',
-    'vine'             : 'vine',
-    'vk'               : 'vk',
-    'xiami'            : 'xiami',
-    'xiaokaxiu'        : 'yixia',
-    'xiaojiadianvideo' : 'fc2video',
-    'ximalaya'         : 'ximalaya',
-    'yinyuetai'        : 'yinyuetai',
-    'miaopai'          : 'yixia',
-    'yizhibo'          : 'yizhibo',
-    'youku'            : 'youku',
-    'youtu'            : 'youtube',
-    'youtube'          : 'youtube',
-    'zhanqi'           : 'zhanqi',
-}
-
+import contextvars
 import getopt
 import json
 import locale
@@ -106,16 +10,22 @@ import platform
 import re
 import socket
 import sys
+import threading
 import time
+from contextlib import contextmanager
 from urllib import request, parse, error
 from http import cookiejar
 from importlib import import_module
 
 from .version import __version__
-from .util import log, term
+from .util import log, term, keepalive, ratelimit, cache, httpcache, batch
 from .util.git import get_version
 from .util.strings import get_filename, unescape_html
 from . import json_output as json_output_
+from .extractors import registry as _extractors, index as _index
+
+# second-level domain label ('youku' for v.youku.com): extractor name
+SITES = {site: x.name for x in _extractors.values() for site in x.sites}
 
 dry_run = False
 json_output = False
@@ -124,6 +34,17 @@ player = None
 extractor_proxy = None
 cookies = None
 output_filename = None
+jobs = 1
+connections = 1
+incremental_merge = False
+http_cache = False
+probe_jobs = 8
+
+# redirects of unknown hosts are remembered for a day
+redirect_ttl = 24 * 60 * 60
+redirect_timeout = 10
+max_redirects = 5
+_redirects = None
 
 fake_headers = {
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -133,6 +54,164 @@ fake_headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64; rv:51.0) Gecko/20100101 Firefox/51.0'
 }
 
+def build_opener(*handlers):
+    """Builds a urllib opener that reuses keep-alive connections."""
+    return request.build_opener(*(list(handlers) + keepalive.handlers()))
+
+request.install_opener(build_opener())
+
+def copy_opener(opener):
+    """Returns an opener with copies of the handlers of opener, which can be
+    changed (with add_handler()) without changing opener."""
+    import copy
+    new = request.OpenerDirector()
+    new.addheaders = list(opener.addheaders)
+    for handler in opener.handlers:
+        if isinstance(handler, request.ProxyHandler):
+            # its methods are bound to the handler at construction
+            handler = request.ProxyHandler(handler.proxies)
+        else:
+            handler = copy.copy(handler)
+        new.add_handler(handler)
+    return new
+
+class DownloadContext:
+    """Options and network state of a download job.
+
+    Code run under a context (see activate()) takes its options, cookie jar
+    and urllib opener (with the proxy in it) from the context rather than
+    from the module globals, so jobs under different contexts can run in
+    parallel in one process.
+
+    Args:
+        proxy: 'HOST:PORT' of an HTTP proxy; '' for no proxy; None to use the
+            system default.
+        timeout: Socket timeout, in seconds; None for the socket default.
+        incremental_merge: Merge parts into the output as they are
+            downloaded (in order), removing each part right away.
+        http_cache: Cache the responses of get_content() and post_content()
+            on disk (see util.httpcache).
+    """
+
+    def __init__(self, force=False, dry_run=False, json_output=False,
+                 player=None, cookies=None, output_filename=None,
+                 extractor_proxy=None, proxy=None, timeout=None, jobs=1,
+                 connections=1, incremental_merge=False, http_cache=False):
+        self.force = force
+        self.dry_run = dry_run
+        self.json_output = json_output
+        self.player = player
+        self.cookies = cookies
+        self.output_filename = output_filename
+        self.extractor_proxy = extractor_proxy
+        self.proxy = proxy
+        self.timeout = timeout
+        self.jobs = jobs
+        self.connections = connections
+        self.incremental_merge = incremental_merge
+        self.http_cache = http_cache
+
+        handlers = []
+        if proxy == '': # Don't use any proxy
+            handlers.append(request.ProxyHandler({}))
+        elif proxy is not None:
+            handlers.append(request.ProxyHandler({'http': proxy, 'https': proxy}))
+        if cookies is not None:
+            handlers.append(request.HTTPCookieProcessor(cookies))
+        self.opener = build_opener(*handlers)
+
+    def copy(self, **kwargs):
+        """Returns a new context with some of the options changed.
+
+        Unless the proxy or the cookies change, the copy starts with a copy
+        of the opener, which keeps any proxy installed with set_proxy() or
+        install_opener()."""
+        options = dict(force=self.force, dry_run=self.dry_run,
+                       json_output=self.json_output, player=self.player,
+                       cookies=self.cookies,
+                       output_filename=self.output_filename,
+                       extractor_proxy=self.extractor_proxy, proxy=self.proxy,
+                       timeout=self.timeout, jobs=self.jobs,
+                       connections=self.connections,
+                       incremental_merge=self.incremental_merge,
+                       http_cache=self.http_cache)
+        options.update(kwargs)
+        ctx = DownloadContext(**options)
+        if self.opener is not None and 'proxy' not in kwargs and 'cookies' not in kwargs:
+            ctx.opener = copy_opener(self.opener)
+        return ctx
+
+    def urlopen(self, *args, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        return self.opener.open(*args, **kwargs)
+
+    @contextmanager
+    def activate(self):
+        """Makes this the current context, within a with block."""
+        token = _current_context.set(self)
+        try:
+            yield self
+        finally:
+            _current_context.reset(token)
+
+class GlobalContext(DownloadContext):
+    """The context of code not run under any other: the module globals and
+    the installed urllib opener."""
+
+    def __init__(self):
+        pass
+
+    force = property(lambda self: force)
+    dry_run = property(lambda self: dry_run)
+    json_output = property(lambda self: json_output)
+    player = property(lambda self: player)
+    cookies = property(lambda self: cookies)
+    output_filename = property(lambda self: output_filename)
+    extractor_proxy = property(lambda self: extractor_proxy)
+    proxy = None
+    timeout = None
+    jobs = property(lambda self: jobs)
+    connections = property(lambda self: connections)
+    incremental_merge = property(lambda self: incremental_merge)
+    http_cache = property(lambda self: http_cache)
+    opener = property(lambda self: request._opener)
+
+    def urlopen(self, *args, **kwargs):
+        return request.urlopen(*args, **kwargs)
+
+_current_context = contextvars.ContextVar('download_context', default=None)
+global_context = GlobalContext()
+
+def get_context():
+    """Returns the DownloadContext of the running job."""
+    return _current_context.get() or global_context
+
+def submit(executor, fn, *args, **kwargs):
+    """Submits fn to an executor, to be run under the current context."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def run_in_context(ctx, fn, *args, **kwargs):
+    """Calls fn under ctx."""
+    with ctx.activate():
+        return fn(*args, **kwargs)
+
+def get_opener():
+    """Returns the urllib opener of the current context."""
+    opener = get_context().opener
+    if opener is None:
+        opener = build_opener()
+        request.install_opener(opener)
+    return opener
+
+def install_opener(opener):
+    """Replaces the urllib opener of the current context."""
+    ctx = get_context()
+    if isinstance(ctx, GlobalContext):
+        request.install_opener(opener)
+    else:
+        ctx.opener = opener
+
 if sys.stdout.isatty():
     default_encoding = sys.stdout.encoding.lower()
 else:
@@ -261,14 +340,15 @@ def get_response(url, faker = False):
     logging.debug('get_response: %s' % url)
 
     # install cookies
-    if cookies:
-        opener = request.build_opener(request.HTTPCookieProcessor(cookies))
-        request.install_opener(opener)
-
+    ctx = get_context()
     if faker:
-        response = request.urlopen(request.Request(url, headers = fake_headers), None)
+        req = request.Request(url, headers = fake_headers)
     else:
-        response = request.urlopen(url)
+        req = request.Request(url)
+    if ctx.cookies:
+        ctx.cookies.add_cookie_header(req)
+
+    response = ctx.urlopen(req)
 
     data = response.read()
     if response.info().get('Content-Encoding') == 'gzip':
@@ -296,7 +376,7 @@ def get_decoded_html(url, faker = False):
 def get_location(url):
     logging.debug('get_location: %s' % url)
 
-    response = request.urlopen(url)
+    response = get_context().urlopen(url)
     # urllib will follow redirections and it's too much code to tell urllib
     # not to do that
     return response.geturl()
@@ -304,10 +384,76 @@ def get_location(url):
 def urlopen_with_retry(*args, **kwargs):
     for i in range(10):
         try:
-            return request.urlopen(*args, **kwargs)
+            return get_context().urlopen(*args, **kwargs)
         except socket.timeout:
             logging.debug('request attempt %s timeout' % str(i + 1))
 
+def sent_headers(req):
+    """Returns the headers req is sent with, including the cookies that
+    cookie handlers of the opener add to it."""
+    headers = dict(req.headers)
+    headers.update(req.unredirected_hdrs)
+    for handler in get_opener().handlers:
+        if isinstance(handler, request.HTTPCookieProcessor):
+            probe = request.Request(req.full_url)
+            handler.cookiejar.add_cookie_header(probe)
+            cookie = probe.get_header('Cookie')
+            if cookie and cookie != headers.get('Cookie'):
+                headers['Cookie'] = '; '.join(filter(None, (headers.get('Cookie'), cookie)))
+    return headers
+
+def read_content(req, data=None):
+    """Sends a request, and returns the response body, decompressed, and
+    its Content-Type.
+
+    With the http_cache option, fresh responses are answered from the cache
+    (see util.httpcache), and stale ones are revalidated where possible.
+    """
+    host = parse.urlsplit(req.full_url).hostname or ''
+    key = entry = None
+    if get_context().http_cache and httpcache.ttl(host):
+        # cookies are part of the key, so that responses to other users
+        # (or to nobody) aren't mixed up
+        key = httpcache.key('GET' if data is None else 'POST', req.full_url,
+                            sent_headers(req), data)
+        entry = httpcache.load(key)
+    if entry:
+        meta, body = entry
+        if httpcache.fresh(meta, host):
+            logging.debug('cached: %s' % req.full_url)
+            return body, meta['type']
+        if meta['etag']:
+            req.add_header('If-None-Match', meta['etag'])
+        if meta['modified']:
+            req.add_header('If-Modified-Since', meta['modified'])
+
+    try:
+        response = urlopen_with_retry(req, data=data)
+    except error.HTTPError as e:
+        if entry and e.code == 304:
+            meta['time'] = time.time()
+            httpcache.store(key, meta, body)
+            return body, meta['type']
+        raise
+    body = response.read()
+
+    # Handle HTTP compression for gzip and deflate (zlib)
+    content_encoding = response.getheader('Content-Encoding')
+    if content_encoding == 'gzip':
+        body = ungzip(body)
+    elif content_encoding == 'deflate':
+        body = undeflate(body)
+
+    content_type = response.getheader('Content-Type')
+    if key and response.status == 200 and \
+            'no-store' not in (response.getheader('Cache-Control') or ''):
+        httpcache.store(key, {'url': req.full_url, 'time': time.time(),
+                              'type': content_type,
+                              'etag': response.getheader('ETag'),
+                              'modified': response.getheader('Last-Modified')},
+                        body)
+    return body, content_type
+
 def get_content(url, headers={}, decoded=True):
     """Gets the content of a URL via sending a HTTP GET request.
 
@@ -323,23 +469,16 @@ def get_content(url, headers={}, decoded=True):
     logging.debug('get_content: %s' % url)
 
     req = request.Request(url, headers=headers)
+    cookies = get_context().cookies
     if cookies:
         cookies.add_cookie_header(req)
         req.headers.update(req.unredirected_hdrs)
 
-    response = urlopen_with_retry(req)
-    data = response.read()
-
-    # Handle HTTP compression for gzip and deflate (zlib)
-    content_encoding = response.getheader('Content-Encoding')
-    if content_encoding == 'gzip':
-        data = ungzip(data)
-    elif content_encoding == 'deflate':
-        data = undeflate(data)
+    data, content_type = read_content(req)
 
     # Decode the response body
     if decoded:
-        charset = match1(response.getheader('Content-Type'), r'charset=([\w-]+)')
+        charset = match1(content_type, r'charset=([\w-]+)')
         if charset is not None:
             data = data.decode(charset)
         else:
@@ -362,23 +501,16 @@ def post_content(url, headers={}, post_data={}, decoded=True):
     logging.debug('post_content: %s \n post_data: %s' % (url, post_data))
 
     req = request.Request(url, headers=headers)
+    cookies = get_context().cookies
     if cookies:
         cookies.add_cookie_header(req)
         req.headers.update(req.unredirected_hdrs)
     post_data_enc = bytes(parse.urlencode(post_data), 'utf-8')
-    response = urlopen_with_retry(req, data=post_data_enc)
-    data = response.read()
-
-    # Handle HTTP compression for gzip and deflate (zlib)
-    content_encoding = response.getheader('Content-Encoding')
-    if content_encoding == 'gzip':
-        data = ungzip(data)
-    elif content_encoding == 'deflate':
-        data = undeflate(data)
+    data, content_type = read_content(req, data=post_data_enc)
 
     # Decode the response body
     if decoded:
-        charset = match1(response.getheader('Content-Type'), r'charset=([\w-]+)')
+        charset = match1(content_type, r'charset=([\w-]+)')
         if charset is not None:
             data = data.decode(charset)
         else:
@@ -386,19 +518,53 @@ def post_content(url, headers={}, post_data={}, decoded=True):
 
     return data
 
-def url_size(url, faker = False, headers = {}):
+def url_head(url, faker = False, headers = {}):
+    """Gets the response headers of a URL.
+
+    A HEAD request is sent first; servers that reject it, or that do not tell
+    the Content-Length in reply, are asked again with a GET whose body is
+    left unread.
+    """
     if faker:
-        response = urlopen_with_retry(request.Request(url, headers=fake_headers))
-    elif headers:
-        response = urlopen_with_retry(request.Request(url, headers=headers))
-    else:
-        response = urlopen_with_retry(url)
+        headers = fake_headers
+    try:
+        response = urlopen_with_retry(request.Request(url, headers=headers, method='HEAD'))
+        if response.headers['content-length'] is not None:
+            return response.headers
+    except error.HTTPError:
+        pass
+    response = urlopen_with_retry(request.Request(url, headers=headers))
+    response.close()
+    return response.headers
 
-    size = response.headers['content-length']
+def url_size(url, faker = False, headers = {}):
+    size = url_head(url, faker=faker, headers=headers)['content-length']
     return int(size) if size!=None else float('inf')
 
+def map_urls(func, urls, ignore_errors = False, **kwargs):
+    """Calls func(url, **kwargs) for each URL, up to probe_jobs at once.
+
+    Returns:
+        A list of the results, in the order of the URLs. With ignore_errors,
+        the result is None for each URL on which func raised.
+    """
+    def call(url):
+        try:
+            return func(url, **kwargs)
+        except:
+            if not ignore_errors:
+                raise
+            logging.debug('map_urls: %s failed' % url, exc_info=True)
+
+    if len(urls) <= 1:
+        return [call(url) for url in urls]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(probe_jobs, len(urls))) as executor:
+        futures = [submit(executor, call, url) for url in urls]
+        return [future.result() for future in futures]
+
 def urls_size(urls, faker = False, headers = {}):
-    return sum([url_size(url, faker=faker, headers=headers) for url in urls])
+    return sum(map_urls(url_size, urls, faker=faker, headers=headers))
 
 def get_head(url, headers = {}, get_method = 'HEAD'):
     logging.debug('get_head: %s' % url)
@@ -414,15 +580,10 @@ def get_head(url, headers = {}, get_method = 'HEAD'):
 def url_info(url, faker = False, headers = {}):
     logging.debug('url_info: %s' % url)
 
-    if faker:
-        response = urlopen_with_retry(request.Request(url, headers=fake_headers))
-    elif headers:
-        response = urlopen_with_retry(request.Request(url, headers=headers))
-    else:
-        response = urlopen_with_retry(request.Request(url))
-
-    headers = response.headers
+    return headers_info(url_head(url, faker=faker, headers=headers))
 
+def headers_info(headers):
+    """Gets the (type, ext, size) of a response from its headers."""
     type = headers['content-type']
     if type == 'image/jpg; charset=UTF-8' or type == 'image/jpg' : type = 'audio/mpeg'    #fix for netease
     mapping = {
@@ -464,6 +625,10 @@ def url_info(url, faker = False, headers = {}):
 
     return type, ext, size
 
+def urls_info(urls, faker = False, headers = {}, ignore_errors = False):
+    """Gets url_info() of several URLs concurrently, in the order given."""
+    return map_urls(url_info, urls, ignore_errors=ignore_errors, faker=faker, headers=headers)
+
 def url_locations(urls, faker = False, headers = {}):
     locations = []
     for url in urls:
@@ -479,21 +644,83 @@ def url_locations(urls, faker = False, headers = {}):
         locations.append(response.url)
     return locations
 
-def url_save(url, filepath, bar, refer = None, is_part = False, faker = False, headers = {}, timeout = None, **kwargs):
+def url_save(url, filepath, bar, refer = None, is_part = False, faker = False, headers = {}, timeout = None, file_size = None, **kwargs):
+    """Saves a URL to a file, resuming a previous .download file if any.
+
+    The size of the file and whether a resume is possible are taken from the
+    response of the transfer request itself; pass `file_size` when it is
+    already known, so that an existing complete file is skipped without any
+    request at all.
+    """
+    # copy headers, as parts may be saved concurrently with the same dict
+    if faker:
+        headers = dict(fake_headers)
+    else:
+        headers = dict(headers)
 #When a referer specified with param refer, the key must be 'Referer' for the hack here
     if refer is not None:
         headers['Referer'] = refer
-    file_size = url_size(url, faker = faker, headers = headers)
+
+    def skip():
+        if not is_part:
+            if bar:
+                bar.done()
+            print('Skipping %s: file already exists' % tr(os.path.basename(filepath)))
+        else:
+            if bar:
+                bar.update_received(file_size)
+
+    ctx = get_context()
+    if not ctx.force and file_size and os.path.exists(filepath) and \
+            file_size == os.path.getsize(filepath):
+        skip()
+        return
+
+    temp_filepath = filepath + '.download'
+    # present while a ranged download is writing into a preallocated file
+    ranges_filepath = temp_filepath + '.ranges'
+    received = 0
+    if not ctx.force and not os.path.exists(ranges_filepath) and os.path.exists(temp_filepath):
+        received = os.path.getsize(temp_filepath)
+
+    def open_from(start):
+        headers['Range'] = 'bytes=' + str(start) + '-'
+        if timeout:
+            return urlopen_with_retry(request.Request(url, headers=headers), timeout=timeout)
+        else:
+            return urlopen_with_retry(request.Request(url, headers=headers))
+
+    try:
+        response = open_from(received)
+    except error.HTTPError as e:
+        if e.code != 416 or not received:
+            raise
+        # the .download file may already hold the whole content
+        total = match1(e.headers['content-range'] or '', r'/(\d+)$')
+        if total and int(total) == received:
+            response = None
+        else:
+            received = 0
+            response = open_from(0)
+
+    if response is None:
+        range_start = received
+        file_size = received
+    elif response.status == 206 and response.headers['content-range']:
+        content_range = response.headers['content-range'][6:]
+        range_start = int(content_range.split('/')[0].split('-')[0])
+        total = content_range.split('/')[1]
+        file_size = int(total) if total != '*' else float('inf')
+    else: # Range ignored
+        range_start = 0
+        content_length = response.headers['content-length']
+        file_size = int(content_length) if content_length != None else float('inf')
 
     if os.path.exists(filepath):
-        if not force and file_size == os.path.getsize(filepath):
-            if not is_part:
-                if bar:
-                    bar.done()
-                print('Skipping %s: file already exists' % tr(os.path.basename(filepath)))
-            else:
-                if bar:
-                    bar.update_received(file_size)
+        if not ctx.force and file_size == os.path.getsize(filepath):
+            if response:
+                response.close()
+            skip()
             return
         else:
             if not is_part:
@@ -501,62 +728,32 @@ def url_save(url, filepath, bar, refer = None, is_part = False, faker = False, h
                     bar.done()
                 print('Overwriting %s' % tr(os.path.basename(filepath)), '...')
     elif not os.path.exists(os.path.dirname(filepath)):
-        os.mkdir(os.path.dirname(filepath))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
-    temp_filepath = filepath + '.download' if file_size!=float('inf') else filepath
-    received = 0
-    if not force:
+    if received and range_start == received:
         open_mode = 'ab'
-
-        if os.path.exists(temp_filepath):
-            received += os.path.getsize(temp_filepath)
-            if bar:
-                bar.update_received(os.path.getsize(temp_filepath))
     else:
+        # a fresh start, even over a .download file that is not resumed
+        received = 0
         open_mode = 'wb'
-
-    if received < file_size:
-        if faker:
-            headers = fake_headers
-        elif headers:
-            headers = headers
-        else:
-            headers = {}
-        headers['Range'] = 'bytes=' + str(received) + '-'
-        if refer:
-            headers['Referer'] = refer
-
-        if timeout:
-            response = urlopen_with_retry(request.Request(url, headers=headers), timeout=timeout)
-        else:
-            response = urlopen_with_retry(request.Request(url, headers=headers))
-        try:
-            range_start = int(response.headers['content-range'][6:].split('/')[0].split('-')[0])
-            end_length = int(response.headers['content-range'][6:].split('/')[1])
-            range_length = end_length - range_start
-        except:
-            content_length = response.headers['content-length']
-            range_length = int(content_length) if content_length!=None else float('inf')
-
-        if file_size != received + range_length:
-            received = 0
-            if bar:
-                bar.received = 0
-            open_mode = 'wb'
-
+    if bar and received:
+        bar.update_received(received)
+
+    if response and received == 0 and response.status == 206 and \
+            file_size != float('inf') and min(ctx.connections, file_size // min_range_size) > 1:
+        url_save_ranged(url, temp_filepath, file_size, bar, response, headers = headers, timeout = timeout)
+        received = file_size
+    elif response:
+        host = parse.urlsplit(url).hostname
         with open(temp_filepath, open_mode) as output:
+            if os.path.exists(ranges_filepath):
+                os.remove(ranges_filepath)
             while True:
-                buffer = response.read(1024 * 256)
-                if not buffer:
-                    if received == file_size: # Download finished
-                        break
-                    else: # Unexpected termination. Retry request
-                        headers['Range'] = 'bytes=' + str(received) + '-'
-                        response = urlopen_with_retry(request.Request(url, headers=headers))
-                output.write(buffer)
-                received += len(buffer)
-                if bar:
-                    bar.update_received(len(buffer))
+                received += read_response(response, output, bar, host)
+                if received == file_size or file_size == float('inf'): # Download finished
+                    break
+                else: # Unexpected termination. Retry request
+                    response = open_from(received)
 
     assert received == os.path.getsize(temp_filepath), '%s == %s == %s' % (received, os.path.getsize(temp_filepath), temp_filepath)
 
@@ -564,11 +761,95 @@ def url_save(url, filepath, bar, refer = None, is_part = False, faker = False, h
         os.remove(filepath) # on Windows rename could fail if destination filepath exists
     os.rename(temp_filepath, filepath)
 
+min_range_size = 1024 * 1024
+min_chunk_size = 64 * 1024
+max_chunk_size = 8 * 1024 * 1024
+
+def read_response(response, output, bar = None, host = None, size = float('inf')):
+    """Copies up to `size` bytes of a response body to a file, till the end
+    of the body by default. Returns the number of bytes copied.
+
+    Chunks are read into one reused buffer. The chunk size starts at
+    min_chunk_size and doubles while chunks arrive quickly (up to
+    max_chunk_size), so fast links take few reads per second.
+    """
+    chunk_size = min_chunk_size
+    view = memoryview(bytearray(chunk_size))
+    received = 0
+    while received < size:
+        n = min(chunk_size, ratelimit.limiter.read_size(host, chunk_size), size - received)
+        start = time.time()
+        n = response.readinto(view[:n])
+        elapsed = time.time() - start
+        if not n:
+            break
+        output.write(view[:n])
+        received += n
+        if bar:
+            bar.update_received(n)
+        ratelimit.limiter.consume(host, n)
+
+        if n == chunk_size and elapsed < 0.05 and chunk_size < max_chunk_size:
+            chunk_size *= 2
+            view = memoryview(bytearray(chunk_size))
+        elif elapsed > 0.5 and chunk_size > min_chunk_size:
+            chunk_size //= 2
+    return received
+
+def url_save_ranged(url, temp_filepath, file_size, bar, response, headers = {}, timeout = None):
+    """Downloads a file over several connections, one byte range each.
+
+    The ranges are written at their offsets into a preallocated temp file.
+    `response` is an open 'Range: bytes=0-' response, used for the first range.
+    """
+    n = min(get_context().connections, file_size // min_range_size)
+    range_size = -(-file_size // n)
+    ranges = [(start, min(start + range_size, file_size) - 1)
+              for start in range(0, file_size, range_size)]
+
+    def open_range(start, end):
+        range_headers = dict(headers)
+        range_headers['Range'] = 'bytes=%s-%s' % (start, end)
+        if timeout:
+            return urlopen_with_retry(request.Request(url, headers=range_headers), timeout=timeout)
+        else:
+            return urlopen_with_retry(request.Request(url, headers=range_headers))
+
+    ranges_filepath = temp_filepath + '.ranges'
+    open(ranges_filepath, 'w').close()
+    with open(temp_filepath, 'wb') as output:
+        output.truncate(file_size)
+
+    host = parse.urlsplit(url).hostname
+    def save_range(start, end, response=None):
+        if response is None:
+            response = open_range(start, end)
+        with open(temp_filepath, 'r+b') as output:
+            output.seek(start)
+            while True:
+                start += read_response(response, output, bar, host, end + 1 - start)
+                if start > end:
+                    break
+                # Unexpected termination. Retry request
+                response = open_range(start, end)
+        response.close()
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [submit(executor, save_range, ranges[0][0], ranges[0][1], response)]
+        futures += [submit(executor, save_range, start, end)
+                    for start, end in ranges[1:]]
+        for future in futures:
+            future.result()
+
+    os.remove(ranges_filepath)
+
 def url_save_chunked(url, filepath, bar, dyn_callback=None, chunk_size=0, ignore_range=False, refer=None, is_part=False, faker=False, headers={}):
     def dyn_update_url(received):
         if callable(dyn_callback):
             logging.debug('Calling callback %s for new URL from %s' % (dyn_callback.__name__, received))
             return dyn_callback(received)
+    force = get_context().force
     if os.path.exists(filepath):
         if not force:
             if not is_part:
@@ -617,11 +898,13 @@ def url_save_chunked(url, filepath, bar, dyn_callback=None, chunk_size=0, ignore
     with open(temp_filepath, open_mode) as output:
         this_chunk = received
         while True:
-            buffer = response.read(1024 * 256)
+            host = parse.urlsplit(url).hostname
+            buffer = response.read(ratelimit.limiter.read_size(host, 1024 * 256))
             if not buffer:
                 break
             output.write(buffer)
             received += len(buffer)
+            ratelimit.limiter.consume(host, len(buffer))
             if chunk_size and (received - this_chunk) >= chunk_size:
                 url = dyn_callback(received)
                 this_chunk = received
@@ -635,17 +918,137 @@ def url_save_chunked(url, filepath, bar, dyn_callback=None, chunk_size=0, ignore
         os.remove(filepath) # on Windows rename could fail if destination filepath exists
     os.rename(temp_filepath, filepath)
 
+def url_save_parts(urls, filepaths, bar, file_sizes = None, on_saved = None, **kwargs):
+    """Saves each URL to the part file of the same index.
+
+    Up to `jobs` parts are downloaded concurrently; the part files keep
+    their names, so the merge order is unaffected. on_saved(filepath) is
+    called for each part in order, once it and the parts before it are
+    saved.
+    """
+    if not file_sizes:
+        file_sizes = [None] * len(urls)
+    jobs = get_context().jobs
+    if jobs <= 1 or len(urls) == 1:
+        for i, (url, filepath, file_size) in enumerate(zip(urls, filepaths, file_sizes)):
+            #print 'Downloading %s [%s/%s]...' % (tr(filename), i + 1, len(urls))
+            bar.update_piece(i + 1)
+            url_save(url, filepath, bar, is_part = True, file_size = file_size, **kwargs)
+            if on_saved:
+                on_saved(filepath)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(jobs, len(urls))) as executor:
+        futures = [submit(executor, url_save, url, filepath, bar, is_part = True, file_size = file_size, **kwargs)
+                   for url, filepath, file_size in zip(urls, filepaths, file_sizes)]
+        try:
+            for i, future in enumerate(futures):
+                future.result()
+                bar.update_piece(i + 1)
+                if on_saved:
+                    on_saved(filepaths[i])
+        except:
+            for future in futures:
+                future.cancel()
+            raise
+
+class ProgressDisplay:
+    """Draws the progress bars of all transfers in the process.
+
+    Bars report bytes as they arrive; the display redraws at most once per
+    `interval` seconds, with one line per running bar. With format 'json',
+    a JSON object per bar is written to stderr instead (once a second by
+    default); with 'none', nothing is shown.
+    """
+
+    def __init__(self, format='bar', interval=0.1):
+        self.lock = threading.Lock()
+        self.bars = []
+        self.lines = 0
+        self.last_drawn = 0
+        self.configure(format, interval)
+
+    def configure(self, format='bar', interval=None):
+        assert format in ('bar', 'json', 'none')
+        self.format = format
+        if interval is None:
+            interval = 1 if format == 'json' else 0.1
+        self.interval = interval
+
+    def draw(self, bar, force=True):
+        now = time.time()
+        if not force and now - self.last_drawn < self.interval:
+            return
+        with self.lock:
+            if bar not in self.bars:
+                self.bars.append(bar)
+            self.last_drawn = now
+            if force and self.format == 'json':
+                # a single bar changed, don't repeat the others
+                self._draw([bar])
+            else:
+                self._draw(self.bars)
+
+    def done(self, bar):
+        with self.lock:
+            if bar not in self.bars:
+                return
+            # draw the finished bar first, then leave its line behind
+            self.bars.remove(bar)
+            if self.format == 'json':
+                self._draw([bar], done=[bar])
+            else:
+                self._draw([bar] + self.bars, done=[bar])
+            if self.format == 'bar' and not self.bars:
+                print()
+                self.lines = 0
+
+    def _draw(self, bars, done=()):
+        if self.format == 'json':
+            for bar in bars:
+                status = bar.status()
+                status['event'] = 'done' if bar in done else 'progress'
+                sys.stderr.write(json.dumps(status) + '\n')
+            sys.stderr.flush()
+        elif self.format == 'bar':
+            lines = [bar.render() for bar in bars]
+            if len(lines) == 1 and self.lines <= 1:
+                sys.stdout.write('\r' + lines[0])
+            else:
+                if self.lines > 1:
+                    # back to the first line of the bars
+                    sys.stdout.write('\x1b[%dA' % (self.lines - 1))
+                sys.stdout.write('\r' + '\x1b[K\n'.join(lines) + '\x1b[K')
+            sys.stdout.flush()
+            # the first line is left behind when a bar is done
+            self.lines = len(bars) - len(done)
+
+progress = ProgressDisplay()
+
+def format_speed(bytes_ps):
+    if bytes_ps >= 1024 ** 3:
+        return '{:4.0f} GB/s'.format(bytes_ps / 1024 ** 3)
+    elif bytes_ps >= 1024 ** 2:
+        return '{:4.0f} MB/s'.format(bytes_ps / 1024 ** 2)
+    elif bytes_ps >= 1024:
+        return '{:4.0f} kB/s'.format(bytes_ps / 1024)
+    else:
+        return '{:4.0f}  B/s'.format(bytes_ps)
+
 class SimpleProgressBar:
     term_size = term.get_terminal_size()[1]
 
-    def __init__(self, total_size, total_pieces = 1):
-        self.displayed = False
+    def __init__(self, total_size, total_pieces = 1, title = None):
+        self.lock = threading.Lock()
+        self.title = title
         self.total_size = total_size
         self.total_pieces = total_pieces
         self.current_piece = 1
         self.received = 0
-        self.speed = ''
+        self.bytes_ps = 0
         self.last_updated = time.time()
+        self.last_received = 0
 
         total_pieces_len = len(str(total_pieces))
         # 38 is the size of all statically known size in self.bar
@@ -655,8 +1058,17 @@ class SimpleProgressBar:
         self.bar = '{:>4}%% ({:>%s}/%sMB) ├{:─<%s}┤[{:>%s}/{:>%s}] {}' % (
             total_str_width, total_str, self.bar_size, total_pieces_len, total_pieces_len)
 
-    def update(self):
-        self.displayed = True
+    def update_speed(self):
+        now = time.time()
+        time_diff = now - self.last_updated
+        if time_diff >= progress.interval or not self.bytes_ps:
+            received = self.received
+            self.bytes_ps = (received - self.last_received) / time_diff if time_diff else 0
+            self.last_updated = now
+            self.last_received = received
+
+    def render(self):
+        self.update_speed()
         bar_size = self.bar_size
         percent = round(self.received * 100 / self.total_size, 1)
         if percent >= 100:
@@ -670,58 +1082,43 @@ class SimpleProgressBar:
         else:
             plus = ''
         bar = '█' * dots + plus
-        bar = self.bar.format(percent, round(self.received / 1048576, 1), bar, self.current_piece, self.total_pieces, self.speed)
-        sys.stdout.write('\r' + bar)
-        sys.stdout.flush()
+        speed = format_speed(self.bytes_ps) if self.received else ''
+        return self.bar.format(percent, round(self.received / 1048576, 1), bar, self.current_piece, self.total_pieces, speed)
+
+    def status(self):
+        self.update_speed()
+        return {'title': self.title, 'received': self.received,
+                'total': self.total_size, 'piece': self.current_piece,
+                'pieces': self.total_pieces, 'speed': int(self.bytes_ps)}
+
+    def update(self):
+        progress.draw(self)
 
     def update_received(self, n):
-        self.received += n
-        time_diff = time.time() - self.last_updated
-        bytes_ps = n / time_diff if time_diff else 0
-        if bytes_ps >= 1024 ** 3:
-            self.speed = '{:4.0f} GB/s'.format(bytes_ps / 1024 ** 3)
-        elif bytes_ps >= 1024 ** 2:
-            self.speed = '{:4.0f} MB/s'.format(bytes_ps / 1024 ** 2)
-        elif bytes_ps >= 1024:
-            self.speed = '{:4.0f} kB/s'.format(bytes_ps / 1024)
-        else:
-            self.speed = '{:4.0f}  B/s'.format(bytes_ps)
-        self.last_updated = time.time()
-        self.update()
+        with self.lock:
+            self.received += n
+        progress.draw(self, force=False)
 
     def update_piece(self, n):
         self.current_piece = n
 
     def done(self):
-        if self.displayed:
-            print()
-            self.displayed = False
+        progress.done(self)
 
-class PiecesProgressBar:
-    def __init__(self, total_size, total_pieces = 1):
-        self.displayed = False
+class PiecesProgressBar(SimpleProgressBar):
+    def __init__(self, total_size, total_pieces = 1, title = None):
+        self.lock = threading.Lock()
+        self.title = title
         self.total_size = total_size
         self.total_pieces = total_pieces
         self.current_piece = 1
         self.received = 0
+        self.bytes_ps = 0
+        self.last_updated = time.time()
+        self.last_received = 0
 
-    def update(self):
-        self.displayed = True
-        bar = '{0:>5}%[{1:<40}] {2}/{3}'.format('', '=' * 40, self.current_piece, self.total_pieces)
-        sys.stdout.write('\r' + bar)
-        sys.stdout.flush()
-
-    def update_received(self, n):
-        self.received += n
-        self.update()
-
-    def update_piece(self, n):
-        self.current_piece = n
-
-    def done(self):
-        if self.displayed:
-            print()
-            self.displayed = False
+    def render(self):
+        return '{0:>5}%[{1:<40}] {2}/{3}'.format('', '=' * 40, self.current_piece, self.total_pieces)
 
 class DummyProgressBar:
     def __init__(self, *args):
@@ -735,68 +1132,158 @@ class DummyProgressBar:
 
 def get_output_filename(urls, title, ext, output_dir, merge):
     # lame hack for the --output-filename option
-    global output_filename
+    output_filename = get_context().output_filename
     if output_filename:
         if ext:
             return output_filename + '.' + ext
         return output_filename
 
     merged_ext = ext
-    if (len(urls) > 1) and merge:
+    if (len(urls) > 1) and merge and not get_context().incremental_merge:
         from .processor.ffmpeg import has_ffmpeg_installed
         if ext in ['flv', 'f4v']:
-            if has_ffmpeg_installed():
+            if has_ffmpeg_installed('mp4'):
                 merged_ext = 'mp4'
             else:
                 merged_ext = 'flv'
         elif ext == 'mp4':
             merged_ext = 'mp4'
         elif ext == 'ts':
-            if has_ffmpeg_installed():
+            if has_ffmpeg_installed('matroska'):
                 merged_ext = 'mkv'
             else:
                 merged_ext = 'ts'
     return '%s.%s' % (title, merged_ext)
 
-def download_urls(urls, title, ext, total_size, output_dir='.', refer=None, merge=True, faker=False, headers = {}, **kwargs):
+def merge_parts(parts, output_filepath, ext, av=False):
+    """Merges downloaded parts into output_filepath, removing the parts on success."""
+    output_filename = os.path.basename(output_filepath)
+    if av:
+        from .processor.ffmpeg import has_ffmpeg_installed
+        if has_ffmpeg_installed():
+            from .processor.ffmpeg import ffmpeg_concat_av
+            ret = ffmpeg_concat_av(parts, output_filepath, ext)
+            print('Merged into %s' % output_filename)
+            if ret == 0:
+                for part in parts: os.remove(part)
+
+    elif ext in ['flv', 'f4v']:
+        try:
+            from .processor.ffmpeg import has_ffmpeg_installed
+            if has_ffmpeg_installed('mp4'):
+                from .processor.ffmpeg import ffmpeg_concat_flv_to_mp4
+                ffmpeg_concat_flv_to_mp4(parts, output_filepath)
+            else:
+                from .processor.join_flv import concat_flv
+                concat_flv(parts, output_filepath)
+            print('Merged into %s' % output_filename)
+        except:
+            raise
+        else:
+            for part in parts:
+                os.remove(part)
+
+    elif ext == 'mp4':
+        try:
+            from .processor.join_mp4 import concat_mp4
+            try:
+                concat_mp4(parts, output_filepath)
+            except Exception:
+                # a layout the built-in joiner can't handle
+                from .processor.ffmpeg import has_ffmpeg_installed
+                if not has_ffmpeg_installed():
+                    raise
+                logging.debug('join_mp4 failed, merging with ffmpeg', exc_info=True)
+                from .processor.ffmpeg import ffmpeg_concat_mp4_to_mp4
+                ffmpeg_concat_mp4_to_mp4(parts, output_filepath)
+            print('Merged into %s' % output_filename)
+        except:
+            raise
+        else:
+            for part in parts:
+                os.remove(part)
+
+    elif ext == "ts":
+        try:
+            from .processor.ffmpeg import has_ffmpeg_installed
+            if has_ffmpeg_installed('matroska'):
+                from .processor.ffmpeg import ffmpeg_concat_ts_to_mkv
+                ffmpeg_concat_ts_to_mkv(parts, output_filepath)
+            else:
+                from .processor.join_ts import concat_ts
+                concat_ts(parts, output_filepath, repair=True)
+            print('Merged into %s' % output_filename)
+        except:
+            raise
+        else:
+            for part in parts:
+                os.remove(part)
+
+    else:
+        print("Can't merge %s files" % ext)
+
+def part_writer(output_filepath, ext, parts):
+    """Returns a writer that merges parts into output_filepath as they are
+    appended, or None if parts of ext can't be merged that way."""
+    if ext in ['flv', 'f4v']:
+        from .processor.join_flv import FLVWriter
+        return FLVWriter(output_filepath, parts=parts)
+    elif ext == 'mp4':
+        from .processor.join_mp4 import MP4Writer
+        return MP4Writer(output_filepath)
+    elif ext == 'ts':
+        from .processor.join_ts import TSWriter
+        return TSWriter(output_filepath, repair=True)
+
+def download_urls(urls, title, ext, total_size, output_dir='.', refer=None, merge=True, faker=False, headers = {}, ctx = None, **kwargs):
     assert urls
-    if json_output:
+    if ctx is not None:
+        with ctx.activate():
+            return download_urls(urls, title, ext, total_size, output_dir=output_dir, refer=refer,
+                                 merge=merge, faker=faker, headers=headers, **kwargs)
+    ctx = get_context()
+    if ctx.json_output:
         json_output_.download_urls(urls=urls, title=title, ext=ext, total_size=total_size, refer=refer)
         return
-    if dry_run:
+    if ctx.dry_run:
         print('Real URLs:\n%s' % '\n'.join(urls))
         return
 
-    if player:
-        launch_player(player, urls)
+    if ctx.player:
+        launch_player(ctx.player, urls)
         return
 
+    file_sizes = None
     if not total_size:
         try:
-            total_size = urls_size(urls, faker=faker, headers=headers)
+            file_sizes = map_urls(url_size, urls, faker=faker, headers=headers)
+            total_size = sum(file_sizes)
         except:
             import traceback
             traceback.print_exc(file=sys.stdout)
             pass
+    elif len(urls) == 1:
+        file_sizes = [total_size]
 
     title = tr(get_filename(title))
     output_filename = get_output_filename(urls, title, ext, output_dir, merge)
     output_filepath = os.path.join(output_dir, output_filename)
 
     if total_size:
-        if not force and os.path.exists(output_filepath) and os.path.getsize(output_filepath) >= total_size * 0.9:
+        if not ctx.force and os.path.exists(output_filepath) and os.path.getsize(output_filepath) >= total_size * 0.9:
             print('Skipping %s: file already exists' % output_filepath)
             print()
             return
-        bar = SimpleProgressBar(total_size, len(urls))
+        bar = SimpleProgressBar(total_size, len(urls), title=output_filename)
     else:
-        bar = PiecesProgressBar(total_size, len(urls))
+        bar = PiecesProgressBar(total_size, len(urls), title=output_filename)
 
     if len(urls) == 1:
         url = urls[0]
         print('Downloading %s ...' % tr(output_filename))
         bar.update()
-        url_save(url, output_filepath, bar, refer = refer, faker = faker, headers = headers, **kwargs)
+        url_save(url, output_filepath, bar, refer = refer, faker = faker, headers = headers,
+                 file_size = file_sizes and file_sizes[0], **kwargs)
         bar.done()
     else:
         parts = []
@@ -806,85 +1293,46 @@ def download_urls(urls, title, ext, total_size, output_dir='.', refer=None, merg
             filename = '%s[%02d].%s' % (title, i, ext)
             filepath = os.path.join(output_dir, filename)
             parts.append(filepath)
-            #print 'Downloading %s [%s/%s]...' % (tr(filename), i + 1, len(urls))
-            bar.update_piece(i + 1)
-            url_save(url, filepath, bar, refer = refer, is_part = True, faker = faker, headers = headers, **kwargs)
-        bar.done()
-
-        if not merge:
-            print()
-            return
-
-        if 'av' in kwargs and kwargs['av']:
-            from .processor.ffmpeg import has_ffmpeg_installed
-            if has_ffmpeg_installed():
-                from .processor.ffmpeg import ffmpeg_concat_av
-                ret = ffmpeg_concat_av(parts, output_filepath, ext)
-                print('Merged into %s' % output_filename)
-                if ret == 0:
-                    for part in parts: os.remove(part)
-
-        elif ext in ['flv', 'f4v']:
-            try:
-                from .processor.ffmpeg import has_ffmpeg_installed
-                if has_ffmpeg_installed():
-                    from .processor.ffmpeg import ffmpeg_concat_flv_to_mp4
-                    ffmpeg_concat_flv_to_mp4(parts, output_filepath)
-                else:
-                    from .processor.join_flv import concat_flv
-                    concat_flv(parts, output_filepath)
-                print('Merged into %s' % output_filename)
-            except:
-                raise
-            else:
-                for part in parts:
-                    os.remove(part)
 
-        elif ext == 'mp4':
+        writer = None
+        if merge and ctx.incremental_merge and not kwargs.get('av'):
+            writer = part_writer(output_filepath, ext, len(parts))
+        if writer:
+            def on_saved(part):
+                writer.append(part)
+                os.remove(part)
             try:
-                from .processor.ffmpeg import has_ffmpeg_installed
-                if has_ffmpeg_installed():
-                    from .processor.ffmpeg import ffmpeg_concat_mp4_to_mp4
-                    ffmpeg_concat_mp4_to_mp4(parts, output_filepath)
-                else:
-                    from .processor.join_mp4 import concat_mp4
-                    concat_mp4(parts, output_filepath)
-                print('Merged into %s' % output_filename)
+                url_save_parts(urls, parts, bar, file_sizes = file_sizes, on_saved = on_saved, refer = refer, faker = faker, headers = headers, **kwargs)
+                bar.done()
+                writer.close()
             except:
+                # merged parts are gone, so the output can't be resumed
+                writer.out.close()
+                os.remove(output_filepath)
                 raise
-            else:
-                for part in parts:
-                    os.remove(part)
+            print('Merged into %s' % output_filename)
+            print()
+            return
+        url_save_parts(urls, parts, bar, file_sizes = file_sizes, refer = refer, faker = faker, headers = headers, **kwargs)
+        bar.done()
 
-        elif ext == "ts":
-            try:
-                from .processor.ffmpeg import has_ffmpeg_installed
-                if has_ffmpeg_installed():
-                    from .processor.ffmpeg import ffmpeg_concat_ts_to_mkv
-                    ffmpeg_concat_ts_to_mkv(parts, output_filepath)
-                else:
-                    from .processor.join_ts import concat_ts
-                    concat_ts(parts, output_filepath)
-                print('Merged into %s' % output_filename)
-            except:
-                raise
-            else:
-                for part in parts:
-                    os.remove(part)
+        if not merge:
+            print()
+            return
 
-        else:
-            print("Can't merge %s files" % ext)
+        merge_parts(parts, output_filepath, ext, av=kwargs.get('av'))
 
     print()
 
 def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=None, merge=True, faker=False, headers = {}, **kwargs):
     assert urls
-    if dry_run:
+    ctx = get_context()
+    if ctx.dry_run:
         print('Real URLs:\n%s\n' % urls)
         return
 
-    if player:
-        launch_player(player, urls)
+    if ctx.player:
+        launch_player(ctx.player, urls)
         return
 
     title = tr(get_filename(title))
@@ -892,13 +1340,13 @@ def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=No
     filename = '%s.%s' % (title, ext)
     filepath = os.path.join(output_dir, filename)
     if total_size:
-        if not force and os.path.exists(filepath[:-3] + '.mkv'):
+        if not ctx.force and os.path.exists(filepath[:-3] + '.mkv'):
             print('Skipping %s: file already exists' % filepath[:-3] + '.mkv')
             print()
             return
-        bar = SimpleProgressBar(total_size, len(urls))
+        bar = SimpleProgressBar(total_size, len(urls), title=filename)
     else:
-        bar = PiecesProgressBar(total_size, len(urls))
+        bar = PiecesProgressBar(total_size, len(urls), title=filename)
 
     if len(urls) == 1:
         parts = []
@@ -914,7 +1362,7 @@ def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=No
             return
         if ext == 'ts':
             from .processor.ffmpeg import has_ffmpeg_installed
-            if has_ffmpeg_installed():
+            if has_ffmpeg_installed('matroska'):
                 from .processor.ffmpeg import ffmpeg_convert_ts_to_mkv
                 if ffmpeg_convert_ts_to_mkv(parts, os.path.join(output_dir, title + '.mkv')):
                     for part in parts:
@@ -942,7 +1390,7 @@ def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=No
             return
         if ext == 'ts':
             from .processor.ffmpeg import has_ffmpeg_installed
-            if has_ffmpeg_installed():
+            if has_ffmpeg_installed('matroska'):
                 from .processor.ffmpeg import ffmpeg_concat_ts_to_mkv
                 if ffmpeg_concat_ts_to_mkv(parts, os.path.join(output_dir, title + '.mkv')):
                     for part in parts:
@@ -950,7 +1398,10 @@ def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=No
                 else:
                     os.remove(os.path.join(output_dir, title + '.mkv'))
             else:
-                print('No ffmpeg is found. Merging aborted.')
+                from .processor.join_ts import concat_ts
+                concat_ts(parts, os.path.join(output_dir, title + '.ts'), repair=True)
+                for part in parts:
+                    os.remove(part)
         else:
             print("Can't merge %s files" % ext)
 
@@ -958,15 +1409,16 @@ def download_urls_chunked(urls, title, ext, total_size, output_dir='.', refer=No
 
 def download_rtmp_url(url,title, ext,params={}, total_size=0, output_dir='.', refer=None, merge=True, faker=False):
     assert url
-    if dry_run:
+    ctx = get_context()
+    if ctx.dry_run:
         print('Real URL:\n%s\n' % [url])
         if params.get("-y",False): #None or unset ->False
             print('Real Playpath:\n%s\n' % [params.get("-y")])
         return
 
-    if player:
+    if ctx.player:
         from .processor.rtmpdump import play_rtmpdump_stream
-        play_rtmpdump_stream(player, url, params)
+        play_rtmpdump_stream(ctx.player, url, params)
         return
 
     from .processor.rtmpdump import has_rtmpdump_installed, download_rtmpdump_stream
@@ -975,20 +1427,21 @@ def download_rtmp_url(url,title, ext,params={}, total_size=0, output_dir='.', re
 
 def download_url_ffmpeg(url,title, ext,params={}, total_size=0, output_dir='.', refer=None, merge=True, faker=False):
     assert url
-    if dry_run:
+    ctx = get_context()
+    if ctx.dry_run:
         print('Real URL:\n%s\n' % [url])
         if params.get("-y",False): #None or unset ->False
             print('Real Playpath:\n%s\n' % [params.get("-y")])
         return
 
-    if player:
-        launch_player(player, [url])
+    if ctx.player:
+        launch_player(ctx.player, [url])
         return
 
     from .processor.ffmpeg import has_ffmpeg_installed, ffmpeg_download_stream
     assert has_ffmpeg_installed(), "FFmpeg not installed."
 
-    global output_filename
+    output_filename = ctx.output_filename
     if output_filename:
         dotPos = output_filename.rfind(".")
         title = output_filename[:dotPos]
@@ -1004,7 +1457,7 @@ def playlist_not_supported(name):
     return f
 
 def print_info(site_info, title, type, size):
-    if json_output:
+    if get_context().json_output:
         json_output_.print_info(site_info=site_info, title=title, type=type, size=size)
         return
     if type:
@@ -1107,13 +1560,18 @@ def set_proxy(proxy):
         'http': '%s:%s' % proxy,
         'https': '%s:%s' % proxy,
     })
-    opener = request.build_opener(proxy_handler)
-    request.install_opener(opener)
+    opener = build_opener(proxy_handler)
+    install_opener(opener)
 
 def unset_proxy():
-    proxy_handler = request.ProxyHandler({})
-    opener = request.build_opener(proxy_handler)
-    request.install_opener(opener)
+    ctx = get_context()
+    if isinstance(ctx, GlobalContext):
+        proxy_handler = request.ProxyHandler({})
+        opener = build_opener(proxy_handler)
+    else:
+        # back to the job's own proxy
+        opener = ctx.copy(proxy=ctx.proxy).opener
+    install_opener(opener)
 
 # DEPRECATED in favor of set_proxy() and unset_proxy()
 def set_http_proxy(proxy):
@@ -1123,7 +1581,7 @@ def set_http_proxy(proxy):
         proxy_support = request.ProxyHandler({})
     else: # Use proxy
         proxy_support = request.ProxyHandler({'http': '%s' % proxy, 'https': '%s' % proxy})
-    opener = request.build_opener(proxy_support)
+    opener = build_opener(proxy_support)
     request.install_opener(opener)
 
 def print_more_compatible(*args, **kwargs):
@@ -1144,17 +1602,45 @@ def print_more_compatible(*args, **kwargs):
 
 
 
-def download_main(download, download_playlist, urls, playlist, **kwargs):
+def url_site(url):
+    """Returns the extractor name of a URL, or its host if unknown."""
+    host = parse.urlsplit(url).hostname or ''
+    found = _index.lookup(host) if host else []
+    return found[0].name if found else host
+
+def download_main(download, download_playlist, urls, playlist, ctx=None,
+                  batch_jobs=1, site_jobs=None, **kwargs):
+    """Downloads urls one by one, or with batch_jobs > 1, up to batch_jobs
+    at once and site_jobs from one site (see util.batch). In a batch, a
+    failed URL does not stop the others; the finished Batch is returned."""
+    if ctx is not None:
+        with ctx.activate():
+            return download_main(download, download_playlist, urls, playlist,
+                                 batch_jobs=batch_jobs, site_jobs=site_jobs,
+                                 **kwargs)
+    normalized = []
     for url in urls:
         if url.startswith('https://'):
             url = url[8:]
         if not url.startswith('http://'):
             url = 'http://' + url
-
-        if playlist:
-            download_playlist(url, **kwargs)
-        else:
-            download(url, **kwargs)
+        normalized.append(url)
+    fn = download_playlist if playlist else download
+
+    if batch_jobs > 1 and len(normalized) > 1:
+        jobs = batch.Batch(batch_jobs, site_jobs)
+        for url in normalized:
+            # every job gets its own context, so that an extractor that
+            # replaces the opener (or the proxy) only affects its own job
+            jobs.add(url_site(url), url, run_in_context, get_context().copy(),
+                     fn, url, **kwargs)
+        jobs.run()
+        for line in jobs.summary():
+            log.i(line)
+        return jobs
+
+    for url in normalized:
+        fn(url, **kwargs)
 
 def script_main(script_name, download, download_playlist, **kwargs):
     def version():
@@ -1191,10 +1677,23 @@ def script_main(script_name, download, download_playlist, **kwargs):
     -t | --timeout <SECONDS>            Set socket timeout.
     -d | --debug                        Show traceback and other debug info.
     -I | --input-file                   Read non-playlist urls from file.
+         --batch-jobs <N>               Download up to N of the URLs at once.
+         --site-jobs <N>                Download up to N URLs from one site
+                                        at once, in a batch (default: 2).
+    -j | --jobs <N>                     Download up to N video parts at once.
+         --connections <N>              Download a file over N connections.
+         --incremental-merge            Merge video parts as they are
+                                        downloaded, removing each right away.
+         --http-cache                   Cache web pages and API responses
+                                        on disk, for repeated runs.
+         --limit-rate <[HOST=]RATE>     Limit download speed to RATE bytes/s
+                                        (e.g. 500K, 2M), in total or per HOST.
+         --progress <bar|json|none>     Show progress as bars, as JSON lines
+                                        on stderr (for logs), or not at all.
     '''
 
-    short_opts = 'Vhfiuc:ndF:O:o:p:x:y:s:t:I:'
-    opts = ['version', 'help', 'force', 'info', 'url', 'cookies', 'no-caption', 'no-merge', 'no-proxy', 'debug', 'json', 'format=', 'stream=', 'itag=', 'output-filename=', 'output-dir=', 'player=', 'http-proxy=', 'socks-proxy=', 'extractor-proxy=', 'lang=', 'timeout=', 'input-file=']
+    short_opts = 'Vhfiuc:ndF:O:o:p:x:y:s:t:I:j:'
+    opts = ['version', 'help', 'force', 'info', 'url', 'cookies', 'no-caption', 'no-merge', 'no-proxy', 'debug', 'json', 'format=', 'stream=', 'itag=', 'output-filename=', 'output-dir=', 'player=', 'http-proxy=', 'socks-proxy=', 'extractor-proxy=', 'lang=', 'timeout=', 'input-file=', 'jobs=', 'connections=', 'incremental-merge', 'http-cache', 'batch-jobs=', 'site-jobs=', 'limit-rate=', 'progress=']
 #dead code? download_playlist is a function and always True
 #if download_playlist:
     short_opts = 'l' + short_opts
@@ -1207,14 +1706,21 @@ def script_main(script_name, download, download_playlist, **kwargs):
         log.e("try 'you-get --help' for more options")
         sys.exit(2)
 
-    global force
-    global dry_run
-    global json_output
-    global player
-    global extractor_proxy
-    global cookies
-    global output_filename
-
+    force = False
+    dry_run = False
+    json_output = False
+    player = None
+    cookies = None
+    output_filename = None
+    jobs = 1
+    connections = 1
+    incremental_merge = False
+    http_cache = False
+    batch_jobs = 1
+    site_jobs = 2
+    limit_rate = None
+    host_limit_rates = {}
+    progress_format = 'bar'
     info_only = False
     playlist = False
     caption = True
@@ -1306,6 +1812,33 @@ def script_main(script_name, download, download_playlist, **kwargs):
             lang = a
         elif o in ('-t', '--timeout'):
             timeout = int(a)
+        elif o in ('-j', '--jobs'):
+            jobs = max(int(a), 1)
+        elif o in ('--connections',):
+            connections = max(int(a), 1)
+        elif o in ('--incremental-merge',):
+            incremental_merge = True
+        elif o in ('--http-cache',):
+            http_cache = True
+        elif o in ('--batch-jobs',):
+            batch_jobs = max(int(a), 1)
+        elif o in ('--site-jobs',):
+            site_jobs = max(int(a), 1)
+        elif o in ('--limit-rate',):
+            try:
+                if '=' in a:
+                    host, rate = a.split('=', 1)
+                    host_limit_rates[host] = ratelimit.parse_rate(rate)
+                else:
+                    limit_rate = ratelimit.parse_rate(a)
+            except ValueError as err:
+                log.e(err)
+                sys.exit(2)
+        elif o in ('--progress',):
+            if a not in ('bar', 'json', 'none'):
+                log.e('invalid progress format: %s' % a)
+                sys.exit(2)
+            progress_format = a
         elif o in ('-I', '--input-file'):
             logging.debug('you are trying to load urls from {}'.format(a))
             if playlist:
@@ -1340,21 +1873,36 @@ def script_main(script_name, download, download_playlist, **kwargs):
                 'In order to use use socks proxy, please install PySocks.')
     else:
         import socket
-        set_http_proxy(proxy)
 
     socket.setdefaulttimeout(timeout)
+    # keep a connection for every part or range being downloaded at once
+    keepalive.pool.max_idle = max(keepalive.pool.max_idle,
+                                  batch_jobs * max(jobs, connections))
+    ratelimit.limiter.configure(limit_rate, host_limit_rates)
+    progress.configure(progress_format)
+
+    ctx = DownloadContext(force=force, dry_run=dry_run,
+                          json_output=json_output, player=player,
+                          cookies=cookies, output_filename=output_filename,
+                          extractor_proxy=extractor_proxy,
+                          proxy=None if socks_proxy else proxy,
+                          timeout=timeout, jobs=jobs, connections=connections,
+                          incremental_merge=incremental_merge,
+                          http_cache=http_cache)
 
     try:
         if stream_id:
             if not extractor_proxy:
-                download_main(download, download_playlist, args, playlist, stream_id=stream_id, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
+                jobs = download_main(download, download_playlist, args, playlist, ctx=ctx, batch_jobs=batch_jobs, site_jobs=site_jobs, stream_id=stream_id, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
             else:
-                download_main(download, download_playlist, args, playlist, stream_id=stream_id, extractor_proxy=extractor_proxy, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
+                jobs = download_main(download, download_playlist, args, playlist, ctx=ctx, batch_jobs=batch_jobs, site_jobs=site_jobs, stream_id=stream_id, extractor_proxy=extractor_proxy, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
         else:
             if not extractor_proxy:
-                download_main(download, download_playlist, args, playlist, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
+                jobs = download_main(download, download_playlist, args, playlist, ctx=ctx, batch_jobs=batch_jobs, site_jobs=site_jobs, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
             else:
-                download_main(download, download_playlist, args, playlist, extractor_proxy=extractor_proxy, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
+                jobs = download_main(download, download_playlist, args, playlist, ctx=ctx, batch_jobs=batch_jobs, site_jobs=site_jobs, extractor_proxy=extractor_proxy, output_dir=output_dir, merge=merge, info_only=info_only, json_output=json_output, caption=caption)
+        if jobs is not None and any(job.error is not None for job in jobs.all):
+            sys.exit(1)
     except KeyboardInterrupt:
         if traceback:
             raise
@@ -1403,7 +1951,43 @@ def google_search(url):
     print("Best matched result:")
     return(videos[0][0])
 
-def url_to_module(url):
+def resolve_redirect(url):
+    """Returns where url redirects to, by a HEAD request, or None.
+
+    Answers are cached, in memory and on disk, for redirect_ttl seconds;
+    failures are not.
+    """
+    global _redirects
+    if _redirects is None:
+        _redirects = cache.load('redirects') or {}
+    now = time.time()
+    entry = _redirects.get(url)
+    if entry and entry[1] > now:
+        return entry[0]
+
+    import http.client
+    host = r1(r'https?://([^/]+)', url)
+    path = r1(r'https?://[^/]+(.*)', url) or '/'
+    if url.startswith('https'):
+        conn = http.client.HTTPSConnection(host, timeout=redirect_timeout)
+    else:
+        conn = http.client.HTTPConnection(host, timeout=redirect_timeout)
+    try:
+        conn.request("HEAD", path, headers=fake_headers)
+        location = conn.getresponse().getheader('location')
+    except (OSError, http.client.HTTPException) as e:
+        logging.debug('HEAD %s failed: %s' % (url, e))
+        return None
+    finally:
+        conn.close()
+
+    # drop expired entries, which also keeps the cache small
+    _redirects = {k: v for k, v in _redirects.items() if v[1] > now}
+    _redirects[url] = [location, now + redirect_ttl]
+    cache.save('redirects', _redirects)
+    return location
+
+def url_to_module(url, redirects=max_redirects):
     try:
         video_host = r1(r'https?://([^/]+)/', url)
         video_url = r1(r'https?://[^/]+(.*)', url)
@@ -1413,30 +1997,31 @@ def url_to_module(url):
         video_host = r1(r'https?://([^/]+)/', url)
         video_url = r1(r'https?://[^/]+(.*)', url)
 
-    if video_host.endswith('.com.cn') or video_host.endswith('.ac.cn'):
-        video_host = video_host[:-3]
-    domain = r1(r'(\.[^.]+\.[^.]+)$', video_host) or video_host
-    assert domain, 'unsupported url: ' + url
+    # without user info and port
+    host = r1(r'([^@:]+)(:\d+)?$', video_host) or video_host
+    found = _index.lookup(host)
+    for extractor in found:
+        if extractor.accepts(url):
+            return extractor.load(), url
 
-    k = r1(r'([^.]+)', domain)
-    if k in SITES:
-        return import_module('.'.join(['you_get', 'extractors', SITES[k]])), url
-    else:
-        import http.client
-        conn = http.client.HTTPConnection(video_host)
-        conn.request("HEAD", video_url, headers=fake_headers)
-        res = conn.getresponse()
-        location = res.getheader('location')
+    # only unknown hosts are worth a round trip
+    if not found and redirects:
+        location = resolve_redirect(url)
         if location and location != url and not location.startswith('/'):
-            return url_to_module(location)
-        else:
-            return import_module('you_get.extractors.universal'), url
+            return url_to_module(location, redirects - 1)
+    return _extractors['universal'].load(), url
 
-def any_download(url, **kwargs):
+def any_download(url, ctx=None, **kwargs):
+    if ctx is not None:
+        with ctx.activate():
+            return any_download(url, **kwargs)
     m, url = url_to_module(url)
     m.download(url, **kwargs)
 
-def any_download_playlist(url, **kwargs):
+def any_download_playlist(url, ctx=None, **kwargs):
+    if ctx is not None:
+        with ctx.activate():
+            return any_download_playlist(url, **kwargs)
     m, url = url_to_module(url)
     m.download_playlist(url, **kwargs)
 
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from .common import match1, maybe_print, download_urls, get_filename, parse_host, set_proxy, unset_proxy
+from .common import match1, maybe_print, download_urls, get_filename, parse_host, get_context
 from .common import print_more_compatible as print
 from .util import log
 from . import json_output
@@ -37,10 +37,11 @@ class VideoExtractor():
         self.vid = None
 
         if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            set_proxy(parse_host(kwargs['extractor_proxy']))
-        self.prepare(**kwargs)
-        if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            unset_proxy()
+            proxy = '%s:%s' % parse_host(kwargs['extractor_proxy'])
+            with get_context().copy(proxy=proxy).activate():
+                self.prepare(**kwargs)
+        else:
+            self.prepare(**kwargs)
 
         try:
             self.streams_sorted = [dict([('id', stream_type['id'])] + list(self.streams[stream_type['id']].items())) for stream_type in self.__class__.stream_types if stream_type['id'] in self.streams]
@@ -56,10 +57,11 @@ class VideoExtractor():
         self.vid = vid
 
         if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            set_proxy(parse_host(kwargs['extractor_proxy']))
-        self.prepare(**kwargs)
-        if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            unset_proxy()
+            proxy = '%s:%s' % parse_host(kwargs['extractor_proxy'])
+            with get_context().copy(proxy=proxy).activate():
+                self.prepare(**kwargs)
+        else:
+            self.prepare(**kwargs)
 
         try:
             self.streams_sorted = [dict([('id', stream_type['id'])] + list(self.streams[stream_type['id']].items())) for stream_type in self.__class__.stream_types if stream_type['id'] in self.streams]
@@ -1,84 +1,216 @@
 #!/usr/bin/env python
 
-from .acfun import *
-from .alive import *
-from .archive import *
-from .baidu import *
-from .bandcamp import *
-from .bigthink import *
-from .bilibili import *
-from .bokecc import *
-from .cbs import *
-from .ckplayer import *
-from .cntv import *
-from .dailymotion import *
-from .dilidili import *
-from .douban import *
-from .douyutv import *
-from .ehow import *
-from .facebook import *
-from .fc2video import *
-from .flickr import *
-from .freesound import *
-from .funshion import *
-from .google import *
-from .heavymusic import *
-from .huaban import *
-from .icourses import *
-from .ifeng import *
-from .imgur import *
-from .infoq import *
-from .instagram import *
-from .interest import *
-from .iqilu import *
-from .iqiyi import *
-from .joy import *
-from .ku6 import *
-from .kugou import *
-from .kuwo import *
-from .le import *
-from .lizhi import *
-from .magisto import *
-from .metacafe import *
-from .mgtv import *
-from .miaopai import *
-from .miomio import *
-from .mixcloud import *
-from .mtv81 import *
-from .musicplayon import *
-from .nanagogo import *
-from .naver import *
-from .netease import *
-from .nicovideo import *
-from .panda import *
-from .pinterest import *
-from .pixnet import *
-from .pptv import *
-from .qie import *
-from .qq import *
-from .showroom import *
-from .sina import *
-from .sohu import *
-from .soundcloud import *
-from .suntv import *
-from .theplatform import *
-from .tucao import *
-from .tudou import *
-from .tumblr import *
-from .twitter import *
-from .ucas import *
-from .veoh import *
-from .videomega import *
-from .vimeo import *
-from .vine import *
-from .vk import *
-from .w56 import *
-from .wanmen import *
-from .xiami import *
-from .yinyuetai import *
-from .yixia import *
-from .youku import *
-from .youtube import *
-from .ted import *
-from .khan import *
-from .zhanqi import *
+"""Extractors, one module per site or family of sites.
+
+The modules are only imported when needed: by url_to_module() for the site
+of a URL (see HostIndex), as attributes of this package (`extractors.youtube`),
+or all at once by `from you_get.extractors import *`.
+"""
+
+import re
+from importlib import import_module
+
+class Extractor:
+    """An extractor module, and the URLs it handles.
+
+    sites are second-level domain labels, under any top-level domain
+    ('youku' for v.youku.com). hosts are domain names, which also cover
+    their subdomains. If patterns are given, the extractor only takes URLs
+    that match one of them (re.search).
+    """
+
+    def __init__(self, name, *sites, hosts=(), patterns=()):
+        self.name = name
+        self.module_name = __name__ + '.' + name
+        self.sites = sites
+        self.hosts = hosts
+        self.patterns = [re.compile(p) for p in patterns]
+
+    def load(self):
+        return import_module(self.module_name)
+
+    def accepts(self, url):
+        return not self.patterns or any(p.search(url) for p in self.patterns)
+
+    def __repr__(self):
+        return 'Extractor(%r)' % self.name
+
+registry = {x.name: x for x in [
+    Extractor('acfun', 'acfun'),
+    Extractor('alive', 'in'),
+    Extractor('archive', 'archive'),
+    Extractor('baidu', 'baidu'),
+    Extractor('bandcamp', 'bandcamp'),
+    Extractor('baomihua', 'baomihua'),
+    Extractor('bigthink', 'bigthink'),
+    Extractor('bilibili', 'bilibili', 'kankanews', 'smgbb'),
+    Extractor('bokecc'),
+    Extractor('cbs', 'cbs'),
+    Extractor('ckplayer'),
+    Extractor('cntv', 'cctv', 'cntv'),
+    Extractor('dailymotion', 'dailymotion'),
+    Extractor('dilidili', 'dilidili'),
+    Extractor('douban', 'douban'),
+    Extractor('douyutv', 'douyu'),
+    Extractor('ehow', 'ehow'),
+    Extractor('embed'),
+    Extractor('facebook', 'facebook'),
+    Extractor('fc2video', 'fc2', 'xiaojiadianvideo'),
+    Extractor('flickr', 'flickr'),
+    Extractor('freesound', 'freesound'),
+    Extractor('funshion', 'fun'),
+    Extractor('google', 'google'),
+    Extractor('heavymusic', 'heavy-music'),
+    Extractor('huaban', 'huaban'),
+    Extractor('huomaotv', 'huomao'),
+    Extractor('icourses', 'icourses'),
+    Extractor('ifeng', 'ifeng'),
+    Extractor('imgur', 'imgur'),
+    Extractor('infoq', 'infoq'),
+    Extractor('instagram', 'instagram'),
+    Extractor('interest', 'interest'),
+    Extractor('iqilu', 'iqilu'),
+    Extractor('iqiyi', 'iqiyi'),
+    Extractor('joy', 'joy'),
+    Extractor('khan', 'khanacademy'),
+    Extractor('ku6', 'ku6'),
+    Extractor('kugou', 'kugou'),
+    Extractor('kuwo', 'kuwo'),
+    Extractor('le', 'le', 'letv'),
+    Extractor('lizhi', 'lizhi'),
+    Extractor('magisto', 'magisto'),
+    Extractor('metacafe', 'metacafe'),
+    Extractor('mgtv', 'mgtv'),
+    Extractor('miaopai', 'weibo',
+              patterns=[r'\?fid=\d{4}:\w{32}', r'/p/230444\w+']),
+    Extractor('miomio', 'miomio'),
+    Extractor('mixcloud', 'mixcloud'),
+    Extractor('mtv81', 'mtv81'),
+    Extractor('musicplayon', 'musicplayon'),
+    Extractor('nanagogo', '7gogo'),
+    Extractor('naver', 'naver'),
+    Extractor('netease', '163'),
+    Extractor('nicovideo', 'nicovideo'),
+    Extractor('panda', 'panda'),
+    Extractor('pinterest', 'pinterest'),
+    Extractor('pixnet', 'pixnet'),
+    Extractor('pptv', 'pptv'),
+    Extractor('qie', hosts=['live.qq.com']),
+    Extractor('qq', 'qq'),
+    Extractor('quanmin', 'quanmin'),
+    Extractor('showroom', 'showroom-live'),
+    Extractor('sina', 'iask', 'sina'),
+    Extractor('sohu', 'sohu'),
+    Extractor('soundcloud', 'soundcloud'),
+    Extractor('suntv', 'isuntv'),
+    Extractor('ted', 'ted'),
+    Extractor('theplatform', 'theplatform'),
+    Extractor('tucao', 'tucao'),
+    Extractor('tudou', 'tudou'),
+    Extractor('tumblr', 'tumblr'),
+    Extractor('twitter', 'twimg', 'twitter'),
+    Extractor('ucas', 'ucas'),
+    Extractor('universal'),
+    Extractor('veoh', 'veoh'),
+    Extractor('videomega', 'videomega'),
+    Extractor('vidto', 'vidto'),
+    Extractor('vimeo', 'vimeo'),
+    Extractor('vine', 'vine'),
+    Extractor('vk', 'vk'),
+    Extractor('w56', '56'),
+    Extractor('wanmen', 'wanmen'),
+    Extractor('xiami', 'xiami'),
+    Extractor('ximalaya', 'ximalaya'),
+    Extractor('yinyuetai', 'yinyuetai'),
+    Extractor('yixia', 'xiaokaxiu', 'miaopai'),
+    Extractor('yizhibo', 'yizhibo'),
+    Extractor('youku', 'youku'),
+    Extractor('youtube', 'youtu', 'youtube'),
+    Extractor('zhanqi', 'zhanqi'),
+]}
+
+class HostIndex:
+    """Finds the extractors for a host, in time linear in its length.
+
+    Hosts are kept in a trie of their labels, from the top-level domain
+    down, and sites in a dict keyed by the label that url_to_module() has
+    always used: the second-level one, looking through .com.cn and .ac.cn.
+    """
+
+    def __init__(self, extractors):
+        self.sites = {}
+        self.hosts = {}
+        for x in extractors:
+            for site in x.sites:
+                self.sites[site] = x
+            for host in x.hosts:
+                node = self.hosts
+                for label in reversed(host.split('.')):
+                    node = node.setdefault(label, {})
+                # '' is never a label, so it marks the end of a host
+                node.setdefault('', []).append(x)
+
+    def lookup(self, host):
+        """Returns the extractors for host, the most specific first."""
+        labels = host.lower().rstrip('.').split('.')
+        found = []
+        node = self.hosts
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get('', []) + found
+
+        if labels[-2:] in (['com', 'cn'], ['ac', 'cn']):
+            labels.pop()
+        site = labels[-2] if len(labels) > 1 else labels[0]
+        if site in self.sites:
+            found.append(self.sites[site])
+        return found
+
+index = HostIndex(registry.values())
+
+# the modules (and order) of `from you_get.extractors import *`
+_exported = [
+    'acfun', 'alive', 'archive', 'baidu', 'bandcamp', 'bigthink',
+    'bilibili', 'bokecc', 'cbs', 'ckplayer', 'cntv', 'dailymotion',
+    'dilidili', 'douban', 'douyutv', 'ehow', 'facebook', 'fc2video',
+    'flickr', 'freesound', 'funshion', 'google', 'heavymusic', 'huaban',
+    'icourses', 'ifeng', 'imgur', 'infoq', 'instagram', 'interest', 'iqilu',
+    'iqiyi', 'joy', 'ku6', 'kugou', 'kuwo', 'le', 'lizhi', 'magisto',
+    'metacafe', 'mgtv', 'miaopai', 'miomio', 'mixcloud', 'mtv81',
+    'musicplayon', 'nanagogo', 'naver', 'netease', 'nicovideo', 'panda',
+    'pinterest', 'pixnet', 'pptv', 'qie', 'qq', 'showroom', 'sina', 'sohu',
+    'soundcloud', 'suntv', 'theplatform', 'tucao', 'tudou', 'tumblr',
+    'twitter', 'ucas', 'veoh', 'videomega', 'vimeo', 'vine', 'vk', 'w56',
+    'wanmen', 'xiami', 'yinyuetai', 'yixia', 'youku', 'youtube', 'ted',
+    'khan', 'zhanqi'
+]
+
+def _import_all():
+    """Imports the exported modules, and their names into this package."""
+    names = []
+    for name in _exported:
+        module = registry[name].load()
+        public = getattr(module, '__all__', None)
+        if public is None:
+            public = [k for k in vars(module) if not k.startswith('_')]
+        for k in public:
+            globals()[k] = getattr(module, k)
+        names.extend(public)
+    # submodules that were imported along the way
+    names.extend(k for k in registry if k in globals())
+    return list(dict.fromkeys(names))
+
+def __getattr__(name):
+    if name in registry:
+        return registry[name].load()
+    if name == '__all__':
+        globals()['__all__'] = _import_all()
+        return globals()['__all__']
+    if not name.startswith('__'):
+        # any other name exported by an extractor
+        _import_all()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
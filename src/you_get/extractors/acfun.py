@@ -56,7 +56,7 @@ def acfun_download_by_vid(vid, title, output_dir='.', merge=True, info_only=Fals
     else:
         raise NotImplementedError(sourceType)
 
-    if not info_only and not dry_run:
+    if not info_only and not get_context().dry_run:
         if not kwargs['caption']:
             print('Skipping danmaku.')
             return
@@ -163,7 +163,7 @@ def baidu_pan_download(url):
         'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:13.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47.0.2500.0 Safari/537.36',
         'Referer': refer_url
     }
-    if cookies:
+    if get_context().cookies:
         print('Use user specified cookies')
     else:
         print('Generating cookies...')
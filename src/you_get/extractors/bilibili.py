@@ -76,8 +76,7 @@ def bilibili_download_by_cids(cids, title, output_dir='.', merge=True, info_only
 
     type_ = ''
     size = 0
-    for url in urls:
-        _, type_, temp = url_info(url)
+    for _, type_, temp in urls_info(urls):
         size += temp
 
     print_info(site_info, title, type_, size)
@@ -97,8 +96,7 @@ def bilibili_download_by_cid(cid, title, output_dir='.', merge=True, info_only=F
 
             type_ = ''
             size = 0
-            for url in urls:
-                _, type_, temp = url_info(url, headers={'Referer': 'http://www.bilibili.com/'})
+            for _, type_, temp in urls_info(urls, headers={'Referer': 'http://www.bilibili.com/'}):
                 size += temp or 0
 
             print_info(site_info, title, type_, size)
@@ -195,7 +193,7 @@ def bilibili_download(url, output_dir='.', merge=True, info_only=False, **kwargs
         else:
             raise NotImplementedError(flashvars)
 
-    if not info_only and not dry_run:
+    if not info_only and not get_context().dry_run:
         if not kwargs['caption']:
             print('Skipping danmaku.')
             return
@@ -32,7 +32,7 @@ def douban_download(url, output_dir = '.', merge = True, info_only = False, **kw
             }
             post_params = urllib.parse.urlencode(datas).encode('utf-8')
             try:
-                resp = urllib.request.urlopen(get_song_url, post_params)
+                resp = get_opener().open(get_song_url, post_params)
                 resp_data = json.loads(resp.read().decode('utf-8'))
                 real_url = resp_data['r']
                 type, ext, size = url_info(real_url)
@@ -81,7 +81,7 @@ def google_download(url, output_dir = '.', merge = True, info_only = False, **kw
             title = r1(r'<title[^>]*>([^<\n]+)', post_html)
 
             if title is None:
-                response = request.urlopen(request.Request(real_url))
+                response = get_opener().open(request.Request(real_url))
                 if response.headers['content-disposition']:
                     filename = parse.unquote(r1(r'filename="?(.+)"?', response.headers['content-disposition'])).split('.')
                     title = ''.join(filename[:-1])
@@ -106,9 +106,9 @@ def google_download(url, output_dir = '.', merge = True, info_only = False, **kw
 
         docid = r1(r'"docid":"([^"]*)"', html)
 
-        request.install_opener(request.build_opener(request.HTTPCookieProcessor()))
+        install_opener(request.build_opener(request.HTTPCookieProcessor()))
 
-        request.urlopen(request.Request("https://docs.google.com/uc?id=%s&export=download" % docid))
+        get_opener().open(request.Request("https://docs.google.com/uc?id=%s&export=download" % docid))
         real_url ="https://docs.google.com/uc?export=download&confirm=no_antivirus&id=%s" % docid
 
         type, ext, size = url_info(real_url)
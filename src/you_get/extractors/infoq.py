@@ -38,7 +38,7 @@ class Infoq(VideoExtractor):
             ('Cookie',
              'CloudFront-Policy=%s;CloudFront-Signature=%s;CloudFront-Key-Pair-Id=%s' % (scp, scs, sck))
         ]
-        request.install_opener(opener)
+        install_opener(opener)
 
         if s: self.streams['video'] = {'url': s }
         if mp3: self.streams['audio'] = { 'url': mp3 }
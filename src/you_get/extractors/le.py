@@ -95,8 +95,7 @@ def video_info(vid,**kwargs):
 def letv_download_by_vid(vid,title, output_dir='.', merge=True, info_only=False,**kwargs):
     ext , urls = video_info(vid,**kwargs)
     size = 0
-    for i in urls:
-        _, _, tmp = url_info(i)
+    for _, _, tmp in urls_info(urls):
         size += tmp
 
     print_info(site_info, title, ext, size)
@@ -111,7 +110,7 @@ def letvcloud_download_by_vu(vu, uu, title=None, output_dir='.', merge=True, inf
     str2Hash = ''.join([i + argumet_dict[i] for i in sorted(argumet_dict)]) + sign_key
     sign = hashlib.md5(str2Hash.encode('utf-8')).hexdigest()
     request_info = urllib.request.Request('http://api.letvcloud.com/gpc.php?' + '&'.join([i + '=' + argumet_dict[i] for i in argumet_dict]) + '&sign={sign}'.format(sign = sign))
-    response = urllib.request.urlopen(request_info)
+    response = get_opener().open(request_info)
     data = response.read()
     info = json.loads(data.decode('utf-8'))
     type_available = []
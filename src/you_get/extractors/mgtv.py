@@ -142,6 +142,7 @@ class MGTV(VideoExtractor):
         stream_info = self.streams[stream_id]
 
         if not kwargs['info_only']:
+            player = get_context().player
             if player:
                 # with m3u8 format because some video player can process urls automatically (e.g. mpv)
                 launch_player(player, [stream_info['m3u8_url']])
@@ -6,7 +6,7 @@ from ..common import *
 
 def nicovideo_login(user, password):
     data = "current_form=login&mail=" + user +"&password=" + password + "&login_submit=Log+In"
-    response = request.urlopen(request.Request("https://secure.nicovideo.jp/secure/login?site=niconico", headers=fake_headers, data=data.encode('utf-8')))
+    response = get_opener().open(request.Request("https://secure.nicovideo.jp/secure/login?site=niconico", headers=fake_headers, data=data.encode('utf-8')))
     return response.headers
 
 def nicovideo_download(url, output_dir='.', merge=True, info_only=False, **kwargs):
@@ -15,7 +15,7 @@ def nicovideo_download(url, output_dir='.', merge=True, info_only=False, **kwarg
 context=ssl.SSLContext(ssl.PROTOCOL_TLSv1))
     cookie_handler = request.HTTPCookieProcessor()
     opener = request.build_opener(ssl_context, cookie_handler)
-    request.install_opener(opener)
+    install_opener(opener)
 
     import netrc, getpass
     try:
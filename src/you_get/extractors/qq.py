@@ -50,10 +50,12 @@ def qq_download_by_vid(vid, title, output_dir='.', merge=True, info_only=False):
                     vkey = key_json['key']
                     url = '%s/%s?vkey=%s' % (parts_prefix, filename, vkey)
                     part_urls.append(url)
-                    _, ext, size = url_info(url, faker=True)
-                    total_size += size
             except:
                 pass
+            for part_info in urls_info(part_urls, faker=True, ignore_errors=True):
+                if part_info:
+                    _, ext, size = part_info
+                    total_size += size
             print_info(site_info, parts_ti, ext, total_size)
             if not info_only:
                 download_urls(part_urls, parts_ti, ext, total_size, output_dir=output_dir, merge=merge)
@@ -17,7 +17,7 @@ def suntv_download(url, output_dir = '.', merge = True, info_only = False, **kwa
         data = data.encode('utf-8')
         req = urllib.request.Request(API_URL, data)
         req.add_header('AjaxPro-Method', 'ToPlay')  #important!
-        resp = urllib.request.urlopen(req)
+        resp = get_opener().open(req)
         respData = resp.read()
         respData = respData.decode('ascii').strip('"')  #Ahhhhhhh!
     
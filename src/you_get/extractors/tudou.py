@@ -4,7 +4,6 @@ __all__ = ['tudou_download', 'tudou_download_playlist', 'tudou_download_by_id',
 
 from ..common import *
 from xml.dom.minidom import parseString
-import you_get.extractors.acfun
 
 def tudou_download_by_iid(iid, title, output_dir = '.', merge = True, info_only = False):
     data = json.loads(get_decoded_html('http://www.tudou.com/outplay/goto/getItemSegs.action?iid=%s' % iid))
@@ -35,9 +34,9 @@ def tudou_download_by_id(id, title, output_dir = '.', merge = True, info_only =
 def tudou_download(url, output_dir = '.', merge = True, info_only = False, **kwargs):
     if 'acfun.tudou.com' in url:  #wrong way!
         url = url.replace('acfun.tudou.com', 'www.acfun.tv')
-        you_get.extractors.acfun.acfun_download(url, output_dir,
-                                               merge,
-                                               info_only)
+        # acfun imports this module, so import it late
+        from .acfun import acfun_download
+        acfun_download(url, output_dir, merge, info_only)
         return  #throw you back
 
     # Embedded player
@@ -26,13 +26,12 @@ def tumblr_download(url, output_dir='.', merge=True, info_only=False, **kwargs):
                re.findall(r'(https?://[^;"&]+/tumblr_[^";]+_\d+\.gif)', html)
 
         tuggles = {}
-        for url in urls:
+        for url, size in zip(urls, map_urls(url_size, urls)):
             filename = parse.unquote(url.split('/')[-1])
             title = '.'.join(filename.split('.')[:-1])
             tumblr_id = r1(r'^tumblr_(.+)_\d+$', title)
             quality = int(r1(r'^tumblr_.+_(\d+)$', title))
             ext = filename.split('.')[-1]
-            size = int(get_head(url)['Content-Length'])
             if tumblr_id not in tuggles or tuggles[tumblr_id]['quality'] < quality:
                 tuggles[tumblr_id] = {
                     'title': title,
@@ -68,9 +68,11 @@ def universal_download(url, output_dir='.', merge=True, info_only=False, **kwarg
             candies.append({'url': url,
                             'title': title})
 
-        for candy in candies:
+        candy_infos = urls_info([candy['url'] for candy in candies],
+                                faker=True, ignore_errors=True)
+        for candy, candy_info in zip(candies, candy_infos):
             try:
-                mime, ext, size = url_info(candy['url'], faker=True)
+                mime, ext, size = candy_info
                 if not size: size = float('Int')
             except:
                 continue
@@ -13,7 +13,7 @@ def videomega_download(url, output_dir='.', merge=True, info_only=False, **kwarg
     opener = request.build_opener(ssl_context, cookie_handler)
     opener.addheaders = [('Referer', url),
                          ('Cookie', 'noadvtday=0')]
-    request.install_opener(opener)
+    install_opener(opener)
 
     if re.search(r'view\.php', url):
         php_url = url
@@ -19,7 +19,7 @@ def vidto_download(url, output_dir='.', merge=True, info_only=False, **kwargs):
     print("Please wait for 6 seconds...")
     time.sleep(6)
     print("Starting")
-    new_html = request.urlopen(req, data).read().decode('utf-8', 'replace')
+    new_html = get_opener().open(req, data).read().decode('utf-8', 'replace')
     new_stff = re.search('lnk_download" href="(.*?)">', new_html)
     if(new_stff):
         url = new_stff.group(1)
@@ -127,24 +127,19 @@ class Youku(VideoExtractor):
                 traceback.print_exception(exc_type, exc_value, exc_traceback)
 
     def prepare(self, **kwargs):
-        # Hot-plug cookie handler
-        ssl_context = request.HTTPSHandler(
-            context=ssl.SSLContext(ssl.PROTOCOL_TLSv1))
-        cookie_handler = request.HTTPCookieProcessor()
+        # The API calls go through an opener of their own, with a cookie
+        # handler, TLS 1.0 and the extractor proxy, so that none of these
+        # stick to the opener of the job
         if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            proxy = parse_host(kwargs['extractor_proxy'])
-            proxy_handler = request.ProxyHandler({
-                'http': '%s:%s' % proxy,
-                'https': '%s:%s' % proxy,
-            })
+            proxy = '%s:%s' % parse_host(kwargs['extractor_proxy'])
+            self.api_context = get_context().copy(proxy=proxy)
         else:
-            proxy_handler = request.ProxyHandler({})
-        if not request._opener:
-            opener = request.build_opener(proxy_handler)
-            request.install_opener(opener)
-        for handler in (ssl_context, cookie_handler, proxy_handler):
-            request._opener.add_handler(handler)
-        request._opener.addheaders = [('Cookie','__ysuid={}'.format(time.time()))]
+            self.api_context = get_context().copy()
+        opener = self.api_context.opener
+        opener.add_handler(request.HTTPSHandler(
+            context=ssl.SSLContext(ssl.PROTOCOL_TLSv1)))
+        opener.add_handler(request.HTTPCookieProcessor())
+        opener.addheaders = [('Cookie','__ysuid={}'.format(time.time()))]
 
         assert self.url or self.vid
 
@@ -167,14 +162,10 @@ class Youku(VideoExtractor):
             api12_url = 'http://play.youku.com/play/get.json?vid=%s&ct=12' % self.vid
 
         try:
-            meta = json.loads(get_content(
-                api_url,
-                headers={'Referer': 'http://static.youku.com/'}
-            ))
-            meta12 = json.loads(get_content(
-                api12_url,
-                headers={'Referer': 'http://static.youku.com/'}
-            ))
+            meta = json.loads(self.get_api(
+                api_url, headers={'Referer': 'http://static.youku.com/'}))
+            meta12 = json.loads(self.get_api(
+                api12_url, headers={'Referer': 'http://static.youku.com/'}))
             data = meta['data']
             data12 = meta12['data']
             assert 'stream' in data
@@ -186,14 +177,10 @@ class Youku(VideoExtractor):
                     self.password = input(log.sprint('Password: ', log.YELLOW))
                     api_url += '&pwd={}'.format(self.password)
                     api12_url += '&pwd={}'.format(self.password)
-                    meta = json.loads(get_content(
-                        api_url,
-                        headers={'Referer': 'http://static.youku.com/'}
-                    ))
-                    meta12 = json.loads(get_content(
-                        api12_url,
-                        headers={'Referer': 'http://static.youku.com/'}
-                    ))
+                    meta = json.loads(self.get_api(
+                        api_url, headers={'Referer': 'http://static.youku.com/'}))
+                    meta12 = json.loads(self.get_api(
+                        api12_url, headers={'Referer': 'http://static.youku.com/'}))
                     data = meta['data']
                     data12 = meta12['data']
                 else:
@@ -261,6 +248,10 @@ class Youku(VideoExtractor):
             for i in self.audiolang:
                 i['url'] = 'http://v.youku.com/v_show/id_{}'.format(i['vid'])
 
+    def get_api(self, url, headers={}):
+        with self.api_context.activate():
+            return get_content(url, headers=headers)
+
     def extract(self, **kwargs):
         if 'stream_id' in kwargs and kwargs['stream_id']:
             # Extract the stream
@@ -313,7 +304,7 @@ class Youku(VideoExtractor):
                                 fileid    = fileid,
                                 q         = q
                             )
-                        ksegs += [i['server'] for i in json.loads(get_content(u))]
+                        ksegs += [i['server'] for i in json.loads(self.get_api(u))]
             except error.HTTPError as e:
                 # Use fallback stream data in case of HTTP 404
                 log.e('[Error] ' + str(e))
@@ -374,10 +365,6 @@ class Youku(VideoExtractor):
 
         self.prepare(api_url = api85_url, api12_url = api86_url, ctype = 86, **kwargs)
 
-        #exact copy from original VideoExtractor
-        if 'extractor_proxy' in kwargs and kwargs['extractor_proxy']:
-            unset_proxy()
-
         try:
             self.streams_sorted = [dict([('id', stream_type['id'])] + list(self.streams[stream_type['id']].items())) for stream_type in self.__class__.stream_types if stream_type['id'] in self.streams]
         except:
@@ -2,9 +2,16 @@
 
 from ..common import *
 from ..extractor import VideoExtractor
+from ..util import cache
 
+import hashlib
 from xml.dom.minidom import parseString
 
+# decipher functions, by html5player URL and by SHA-1 of the player JS
+deciphers = {}
+# how many translated players to keep on disk
+max_cached_players = 16
+
 class YouTube(VideoExtractor):
     name = "YouTube"
 
@@ -36,7 +43,9 @@ class YouTube(VideoExtractor):
         {'itag': '17', 'container': '3GP', 'video_resolution': '144p', 'video_encoding': 'MPEG-4 Visual', 'video_profile': 'Simple', 'video_bitrate': '0.05', 'audio_encoding': 'AAC', 'audio_bitrate': '24'},
     ]
 
-    def decipher(js, s):
+    def translate_decipher(js):
+        """Translates the signature decipher function of a player JS into
+        Python. Returns the code, and the name of the function in it."""
         def tr_js(code):
             code = re.sub(r'function', r'def', code)
             code = re.sub(r'(\W)(as|if|in|is|or)\(', r'\1_\2(', code)
@@ -73,9 +82,37 @@ class YouTube(VideoExtractor):
 
         f1 = re.sub(r'(as|if|in|is|or)', r'_\1', f1)
         f1 = re.sub(r'\$', '_dollar', f1)
-        code = code + 'sig=%s(s)' % f1
-        exec(code, globals(), locals())
-        return locals()['sig']
+        return code, f1
+
+    def compile_decipher(js):
+        """Returns the decipher function of a player JS. Each version of the
+        player is only translated once, and the translation is cached on
+        disk."""
+        key = hashlib.sha1(js.encode('utf-8')).hexdigest()
+        if key not in deciphers:
+            players = cache.load('youtube-players') or {}
+            if key not in players:
+                players[key] = YouTube.translate_decipher(js)
+                # keep the latest players, in the order they were added
+                players = dict(list(players.items())[-max_cached_players:])
+                cache.save('youtube-players', players)
+            code, name = players[key]
+            namespace = {}
+            exec(code, namespace)
+            deciphers[key] = namespace[name]
+        return deciphers[key]
+
+    def decipher(js, s):
+        return YouTube.compile_decipher(js)(s)
+
+    def get_decipher(self):
+        """Returns the decipher function of self.html5player, fetching the
+        player at most once per process."""
+        if self.html5player not in deciphers:
+            if not hasattr(self, 'js'):
+                self.js = get_content(self.html5player)
+            deciphers[self.html5player] = self.__class__.compile_decipher(self.js)
+        return deciphers[self.html5player]
 
     def get_url_from_vid(vid):
         return 'https://youtu.be/{}'.format(vid)
@@ -322,7 +359,6 @@ class YouTube(VideoExtractor):
         except:
             # VEVO
             if not self.html5player: return
-            self.js = get_content(self.html5player)
             if 'adaptive_fmts' in ytplayer_config['args']:
                 streams = [dict([(i.split('=')[0],
                                   parse.unquote(i.split('=')[1]))
@@ -332,13 +368,13 @@ class YouTube(VideoExtractor):
                     if stream['type'].startswith('audio/mp4'):
                         dash_mp4_a_url = stream['url']
                         if 's' in stream:
-                            sig = self.__class__.decipher(self.js, stream['s'])
+                            sig = self.get_decipher()(stream['s'])
                             dash_mp4_a_url += '&signature={}'.format(sig)
                         dash_mp4_a_size = stream['clen']
                     elif stream['type'].startswith('audio/webm'):
                         dash_webm_a_url = stream['url']
                         if 's' in stream:
-                            sig = self.__class__.decipher(self.js, stream['s'])
+                            sig = self.get_decipher()(stream['s'])
                             dash_webm_a_url += '&signature={}'.format(sig)
                         dash_webm_a_size = stream['clen']
                 for stream in streams: # video
@@ -347,7 +383,7 @@ class YouTube(VideoExtractor):
                             mimeType = 'video/mp4'
                             dash_url = stream['url']
                             if 's' in stream:
-                                sig = self.__class__.decipher(self.js, stream['s'])
+                                sig = self.get_decipher()(stream['s'])
                                 dash_url += '&signature={}'.format(sig)
                             dash_size = stream['clen']
                             itag = stream['itag']
@@ -364,7 +400,7 @@ class YouTube(VideoExtractor):
                             mimeType = 'video/webm'
                             dash_url = stream['url']
                             if 's' in stream:
-                                sig = self.__class__.decipher(self.js, stream['s'])
+                                sig = self.get_decipher()(stream['s'])
                                 dash_url += '&signature={}'.format(sig)
                             dash_size = stream['clen']
                             itag = stream['itag']
@@ -400,10 +436,8 @@ class YouTube(VideoExtractor):
                 sig = self.streams[stream_id]['sig']
                 src += '&signature={}'.format(sig)
             elif self.streams[stream_id]['s'] is not None:
-                if not hasattr(self, 'js'):
-                    self.js = get_content(self.html5player)
                 s = self.streams[stream_id]['s']
-                sig = self.__class__.decipher(self.js, s)
+                sig = self.get_decipher()(s)
                 src += '&signature={}'.format(sig)
 
             self.streams[stream_id]['src'] = [src]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import os
+
+buffer_size = 1024 * 1024
+# the most to hand to the kernel in one call
+max_count = 1 << 30
+
+def _copy_file_range(in_fd, out_fd, in_offset, out_offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, in_offset, out_offset)
+
+def _sendfile(in_fd, out_fd, in_offset, out_offset, count):
+    # sendfile writes at the position of out_fd
+    if out_offset is not None:
+        os.lseek(out_fd, out_offset, os.SEEK_SET)
+    return os.sendfile(out_fd, in_fd, in_offset, count)
+
+kernel_copies = []
+if hasattr(os, 'copy_file_range'):
+    kernel_copies.append(_copy_file_range)
+if hasattr(os, 'sendfile'):
+    kernel_copies.append(_sendfile)
+
+def copy_stream(source, target, n=None):
+    """Copies n bytes (the rest of the file by default) from the position of
+    source to the position of target, both binary files, advancing both.
+    The target may also be a pipe.
+
+    The data is copied in the kernel where possible (copy_file_range, then
+    sendfile), and otherwise through one reused buffer.
+    """
+    start = source.tell()
+    if n is None:
+        n = os.fstat(source.fileno()).st_size - start
+    target.flush()
+    position = target.tell() if target.seekable() else None
+    in_fd, out_fd = source.fileno(), target.fileno()
+    copied = 0
+    for copy in kernel_copies:
+        try:
+            while copied < n:
+                count = copy(in_fd, out_fd, start + copied,
+                             None if position is None else position + copied,
+                             min(n - copied, max_count))
+                if not count:
+                    break
+                copied += count
+            break
+        except OSError:
+            # not supported between these files, try the next way
+            continue
+    source.seek(start + copied)
+    if position is not None:
+        target.seek(position + copied)
+
+    if copied < n:
+        buffer = bytearray(min(buffer_size, n - copied))
+        view = memoryview(buffer)
+        while copied < n:
+            count = source.readinto(view[:n - copied])
+            assert count, 'no enough data'
+            target.write(view[:count])
+            copied += count
@@ -2,9 +2,12 @@
 
 import logging
 import os.path
+import re
 import subprocess
+from ..util import cache
 from ..util.strings import parameterize
 from ..common import print_more_compatible as print
+from .fastcopy import copy_stream
 
 try:
     from subprocess import DEVNULL
@@ -32,7 +35,54 @@ def get_usable_ffmpeg(cmd):
     except:
         return None
 
-FFMPEG, FFMPEG_VERSION = get_usable_ffmpeg('ffmpeg') or get_usable_ffmpeg('avconv') or (None, None)
+def get_ffmpeg_names(cmd, option, pattern):
+    """Lists what `cmd option` prints (bitstream filters, formats), one
+    name per line matching pattern."""
+    try:
+        p = subprocess.Popen([cmd, '-hide_banner', option], stdin=DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+    except OSError:
+        return []
+    names = []
+    for line in str(out, 'utf-8', 'replace').splitlines():
+        m = re.match(pattern, line)
+        if m:
+            names.extend(m.group(1).split(','))
+    return names
+
+def probe_ffmpeg(cmd):
+    """Returns what a usable ffmpeg (or avconv) can do, as a dict of its
+    'cmd', 'version', 'bsfs' (bitstream filters) and 'muxers'; or None."""
+    usable = get_usable_ffmpeg(cmd)
+    if not usable:
+        return None
+    return {
+        'cmd': cmd,
+        'version': usable[1],
+        'bsfs': get_ffmpeg_names(cmd, '-bsfs', r'^(\w+)$'),
+        # ' E mp4  MP4 (MPEG-4 Part 14)', ' DE flv  FLV (Flash Video)'
+        'muxers': get_ffmpeg_names(cmd, '-formats', r'^\s*D?E\s+(\S+)'),
+    }
+
+_ffmpeg = []
+
+def get_ffmpeg():
+    """Returns what probe_ffmpeg() found for ffmpeg, or else avconv. Only
+    probed when first needed, then remembered."""
+    if not _ffmpeg:
+        _ffmpeg.append(cache.probe_binary('ffmpeg', probe_ffmpeg, 'ffmpeg') or
+                       cache.probe_binary('avconv', probe_ffmpeg, 'ffmpeg'))
+    return _ffmpeg[0]
+
+def __getattr__(name):
+    # FFMPEG and FFMPEG_VERSION used to be probed at import time
+    if name in ('FFMPEG', 'FFMPEG_VERSION'):
+        ffmpeg = get_ffmpeg()
+        if ffmpeg is None:
+            return None
+        return ffmpeg['cmd'] if name == 'FFMPEG' else ffmpeg['version']
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 if logging.getLogger().isEnabledFor(logging.DEBUG):
     LOGLEVEL = ['-loglevel', 'info']
     STDIN = None
@@ -40,8 +90,66 @@ else:
     LOGLEVEL = ['-loglevel', 'quiet']
     STDIN = DEVNULL
 
-def has_ffmpeg_installed():
-    return FFMPEG is not None
+def has_ffmpeg_installed(muxer=None):
+    """Checks for ffmpeg, and that it can write the format `muxer` if given."""
+    ffmpeg = get_ffmpeg()
+    if ffmpeg is None:
+        return False
+    # an older cache or a failed listing has no names, assume it can
+    return muxer is None or not ffmpeg['muxers'] or muxer in ffmpeg['muxers']
+
+def has_concat_demuxer(ffmpeg):
+    # FFmpeg >= 1.1
+    version = ffmpeg['version']
+    return ffmpeg['cmd'] == 'ffmpeg' and (version[0] >= 2 or (version[0] == 1 and version[1] >= 1))
+
+def has_bsf(ffmpeg, name):
+    return not ffmpeg['bsfs'] or name in ffmpeg['bsfs']
+
+def remux_parts(ffmpeg, files, ext, args):
+    """Remuxes every existing file to file.ext with `ffmpeg -i file args`,
+    running up to one ffmpeg per core at once. Yields the remuxed files in
+    order, each as soon as it and the ones before it are done; raises
+    CalledProcessError if one can't be remuxed."""
+    from concurrent.futures import ThreadPoolExecutor
+    files = [file for file in files if os.path.isfile(file)]
+    # the work is done in the ffmpeg processes, threads only wait for them
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        futures = [executor.submit(subprocess.call,
+                                   [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-i', file] + args + [file + '.' + ext],
+                                   stdin=STDIN)
+                   for file in files]
+        for file, future in zip(files, futures):
+            code = future.result()
+            if code != 0:
+                raise subprocess.CalledProcessError(code, ffmpeg['cmd'])
+            yield file + '.' + ext
+
+def concat_ts_stream(ffmpeg, ts_files, output):
+    """Remuxes MPEG-TS files (in order, as they are yielded) into output,
+    feeding them to one ffmpeg through a pipe. Each file is removed once it
+    is fed. Returns the exit code of ffmpeg."""
+    params = [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-f', 'mpegts', '-i', 'pipe:0']
+    if ffmpeg['cmd'] == 'avconv' or not has_bsf(ffmpeg, 'aac_adtstoasc'):
+        params += ['-c', 'copy', output]
+    else:
+        params += ['-c', 'copy', '-absf', 'aac_adtstoasc', output]
+    p = subprocess.Popen(params, stdin=subprocess.PIPE)
+    try:
+        for f in ts_files:
+            if os.path.isfile(f):
+                with open(f, 'rb') as input:
+                    copy_stream(input, p.stdin)
+                os.remove(f)
+        p.stdin.close()
+    except BrokenPipeError:
+        # ffmpeg gave up, its exit code tells why
+        pass
+    except:
+        p.kill()
+        p.wait()
+        raise
+    return p.wait()
 
 # Given a list of segments and the output path, generates the concat
 # list and returns the path to the concat list.
@@ -56,8 +164,9 @@ def generate_concat_list(files, output):
     return concat_list_path
 
 def ffmpeg_concat_av(files, output, ext):
+    ffmpeg = get_ffmpeg()
     print('Merging video parts... ', end="", flush=True)
-    params = [FFMPEG] + LOGLEVEL
+    params = [ffmpeg['cmd']] + LOGLEVEL
     for file in files:
         if os.path.isfile(file): params.extend(['-i', file])
     params.extend(['-c:v', 'copy'])
@@ -70,53 +179,47 @@ def ffmpeg_concat_av(files, output, ext):
     return subprocess.call(params, stdin=STDIN)
 
 def ffmpeg_convert_ts_to_mkv(files, output='output.mkv'):
+    ffmpeg = get_ffmpeg()
     for file in files:
         if os.path.isfile(file):
-            params = [FFMPEG] + LOGLEVEL
+            params = [ffmpeg['cmd']] + LOGLEVEL
             params.extend(['-y', '-i', file, output])
             subprocess.call(params, stdin=STDIN)
 
     return
 
 def ffmpeg_concat_mp4_to_mpg(files, output='output.mpg'):
+    ffmpeg = get_ffmpeg()
     # Use concat demuxer on FFmpeg >= 1.1
-    if FFMPEG == 'ffmpeg' and (FFMPEG_VERSION[0] >= 2 or (FFMPEG_VERSION[0] == 1 and FFMPEG_VERSION[1] >= 1)):
+    if has_concat_demuxer(ffmpeg):
         concat_list = generate_concat_list(files, output)
-        params = [FFMPEG] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
-                                        '-i', concat_list, '-c', 'copy', output]
-        if subprocess.call(params, stdin=STDIN) == 0:
-            os.remove(output + '.txt')
-            return True
-        else:
-            raise
-
-    for file in files:
-        if os.path.isfile(file):
-            params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
-            params.extend([file, file + '.mpg'])
-            subprocess.call(params, stdin=STDIN)
+        params = [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
+                                               '-i', concat_list, '-c', 'copy', output]
+        subprocess.check_call(params, stdin=STDIN)
+        os.remove(output + '.txt')
+        return True
 
-    inputs = [open(file + '.mpg', 'rb') for file in files]
     with open(output + '.mpg', 'wb') as o:
-        for input in inputs:
-            o.write(input.read())
+        for mpg in remux_parts(ffmpeg, files, 'mpg', []):
+            with open(mpg, 'rb') as input:
+                copy_stream(input, o)
 
-    params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
+    params = [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-i']
     params.append(output + '.mpg')
     params += ['-vcodec', 'copy', '-acodec', 'copy']
     params.append(output)
 
-    if subprocess.call(params, stdin=STDIN) == 0:
-        for file in files:
+    subprocess.check_call(params, stdin=STDIN)
+    for file in files:
+        if os.path.isfile(file + '.mpg'):
             os.remove(file + '.mpg')
-        os.remove(output + '.mpg')
-        return True
-    else:
-        raise
+    os.remove(output + '.mpg')
+    return True
 
 def ffmpeg_concat_ts_to_mkv(files, output='output.mkv'):
+    ffmpeg = get_ffmpeg()
     print('Merging video parts... ', end="", flush=True)
-    params = [FFMPEG] + LOGLEVEL + ['-isync', '-y', '-i']
+    params = [ffmpeg['cmd']] + LOGLEVEL + ['-isync', '-y', '-i']
     params.append('concat:')
     for file in files:
         if os.path.isfile(file):
@@ -132,79 +235,53 @@ def ffmpeg_concat_ts_to_mkv(files, output='output.mkv'):
         return False
 
 def ffmpeg_concat_flv_to_mp4(files, output='output.mp4'):
+    ffmpeg = get_ffmpeg()
     print('Merging video parts... ', end="", flush=True)
     # Use concat demuxer on FFmpeg >= 1.1
-    if FFMPEG == 'ffmpeg' and (FFMPEG_VERSION[0] >= 2 or (FFMPEG_VERSION[0] == 1 and FFMPEG_VERSION[1] >= 1)):
+    if has_concat_demuxer(ffmpeg):
         concat_list = generate_concat_list(files, output)
-        params = [FFMPEG] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
-                                        '-i', concat_list, '-c', 'copy',
-                                        '-bsf:a', 'aac_adtstoasc', output]
+        params = [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
+                                               '-i', concat_list, '-c', 'copy']
+        if has_bsf(ffmpeg, 'aac_adtstoasc'):
+            params += ['-bsf:a', 'aac_adtstoasc']
+        params.append(output)
         subprocess.check_call(params, stdin=STDIN)
         os.remove(output + '.txt')
         return True
 
-    for file in files:
-        if os.path.isfile(file):
-            params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
-            params.append(file)
-            params += ['-map', '0', '-c', 'copy', '-f', 'mpegts', '-bsf:v', 'h264_mp4toannexb']
-            params.append(file + '.ts')
-
-            subprocess.call(params, stdin=STDIN)
-
-    params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
-    params.append('concat:')
-    for file in files:
-        f = file + '.ts'
-        if os.path.isfile(f):
-            params[-1] += f + '|'
-    if FFMPEG == 'avconv':
-        params += ['-c', 'copy', output]
-    else:
-        params += ['-c', 'copy', '-absf', 'aac_adtstoasc', output]
-
-    if subprocess.call(params, stdin=STDIN) == 0:
-        for file in files:
-            os.remove(file + '.ts')
-        return True
-    else:
-        raise
+    # remux the parts to MPEG-TS in parallel, and concatenate them while
+    # the later ones are still being remuxed
+    params = ['-map', '0', '-c', 'copy', '-f', 'mpegts']
+    if has_bsf(ffmpeg, 'h264_mp4toannexb'):
+        params += ['-bsf:v', 'h264_mp4toannexb']
+    code = concat_ts_stream(ffmpeg, remux_parts(ffmpeg, files, 'ts', params), output)
+    if code != 0:
+        raise subprocess.CalledProcessError(code, ffmpeg['cmd'])
+    return True
 
 def ffmpeg_concat_mp4_to_mp4(files, output='output.mp4'):
+    ffmpeg = get_ffmpeg()
     print('Merging video parts... ', end="", flush=True)
     # Use concat demuxer on FFmpeg >= 1.1
-    if FFMPEG == 'ffmpeg' and (FFMPEG_VERSION[0] >= 2 or (FFMPEG_VERSION[0] == 1 and FFMPEG_VERSION[1] >= 1)):
+    if has_concat_demuxer(ffmpeg):
         concat_list = generate_concat_list(files, output)
-        params = [FFMPEG] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
-                                        '-i', concat_list, '-c', 'copy',
-                                        '-bsf:a', 'aac_adtstoasc', output]
+        params = [ffmpeg['cmd']] + LOGLEVEL + ['-y', '-f', 'concat', '-safe', '-1',
+                                               '-i', concat_list, '-c', 'copy']
+        if has_bsf(ffmpeg, 'aac_adtstoasc'):
+            params += ['-bsf:a', 'aac_adtstoasc']
+        params.append(output)
         subprocess.check_call(params, stdin=STDIN)
         os.remove(output + '.txt')
         return True
 
-    for file in files:
-        if os.path.isfile(file):
-            params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
-            params.append(file)
-            params += ['-c', 'copy', '-f', 'mpegts', '-bsf:v', 'h264_mp4toannexb']
-            params.append(file + '.ts')
-
-            subprocess.call(params, stdin=STDIN)
-
-    params = [FFMPEG] + LOGLEVEL + ['-y', '-i']
-    params.append('concat:')
-    for file in files:
-        f = file + '.ts'
-        if os.path.isfile(f):
-            params[-1] += f + '|'
-    if FFMPEG == 'avconv':
-        params += ['-c', 'copy', output]
-    else:
-        params += ['-c', 'copy', '-absf', 'aac_adtstoasc', output]
-
-    subprocess.check_call(params, stdin=STDIN)
-    for file in files:
-        os.remove(file + '.ts')
+    # remux the parts to MPEG-TS in parallel, and concatenate them while
+    # the later ones are still being remuxed
+    params = ['-c', 'copy', '-f', 'mpegts']
+    if has_bsf(ffmpeg, 'h264_mp4toannexb'):
+        params += ['-bsf:v', 'h264_mp4toannexb']
+    code = concat_ts_stream(ffmpeg, remux_parts(ffmpeg, files, 'ts', params), output)
+    if code != 0:
+        raise subprocess.CalledProcessError(code, ffmpeg['cmd'])
     return True
 
 def ffmpeg_download_stream(files, title, ext, params={}, output_dir='.'):
@@ -213,16 +290,17 @@ def ffmpeg_download_stream(files, title, ext, params={}, output_dir='.'):
     You can basicly download anything with this function
     but better leave it alone with
     """
+    ffmpeg = get_ffmpeg()
     output = title + '.' + ext
 
     if not (output_dir == '.'):
         output = output_dir + '/' + output
 
     print('Downloading streaming content with FFmpeg, press q to stop recording...')
-    ffmpeg_params = [FFMPEG] + ['-y', '-re', '-i']
+    ffmpeg_params = [ffmpeg['cmd']] + ['-y', '-re', '-i']
     ffmpeg_params.append(files)  #not the same here!!!!
 
-    if FFMPEG == 'avconv':  #who cares?
+    if ffmpeg['cmd'] == 'avconv':  #who cares?
         ffmpeg_params += ['-c', 'copy', output]
     else:
         ffmpeg_params += ['-c', 'copy', '-bsf:a', 'aac_adtstoasc']
@@ -3,7 +3,11 @@
 import struct
 from io import BytesIO
 
+TAG_TYPE_VIDEO = 9
 TAG_TYPE_METADATA = 18
+VIDEO_FRAME_KEYFRAME = 1
+
+io_buffer_size = 1024 * 1024
 
 ##################################################
 # AMF0
@@ -28,6 +32,9 @@ AMF_TYPE_XML = 0x0F
 AMF_TYPE_CLASS_OBJECT = 0x10
 AMF_TYPE_AMF3_OBJECT = 0x11
 
+class LongString(str):
+    """A string written as an AMF long string, whatever its length."""
+
 class ECMAObject:
     def __init__(self, max_number):
         self.max_number = max_number
@@ -46,6 +53,12 @@ class ECMAObject:
         else:
             raise KeyError(k)
         self.map[k] = v
+    def update(self, k, v):
+        if k in self.map:
+            self.set(k, v)
+        else:
+            self.put(k, v)
+            self.max_number = len(self.data)
     def keys(self):
         return self.map.keys()
     def __str__(self):
@@ -71,6 +84,12 @@ def read_amf_string(stream):
     assert len(s) == n
     return s.decode('utf-8')
 
+def read_amf_long_string(stream):
+    n = read_uint(stream)
+    s = stream.read(n)
+    assert len(s) == n
+    return s.decode('utf-8')
+
 def read_amf_object(stream):
     obj = {}
     while True:
@@ -112,6 +131,7 @@ amf_readers = {
     AMF_TYPE_OBJECT: read_amf_object,
     AMF_TYPE_MIXED_ARRAY: read_amf_mixed_array,
     AMF_TYPE_ARRAY: read_amf_array,
+    AMF_TYPE_LONG_STRING: read_amf_long_string,
 }
 
 def read_amf(stream):
@@ -131,6 +151,11 @@ def write_amf_string(stream, s):
     stream.write(struct.pack('>H', len(s)))
     stream.write(s)
 
+def write_amf_long_string(stream, s):
+    s = s.encode('utf-8')
+    write_uint(stream, len(s))
+    stream.write(s)
+
 def write_amf_object(stream, o):
     for k in o:
         write_amf_string(stream, k)
@@ -167,11 +192,16 @@ amf_writers = {
     AMF_TYPE_OBJECT: write_amf_object,
     AMF_TYPE_MIXED_ARRAY: write_amf_mixed_array,
     AMF_TYPE_ARRAY: write_amf_array,
+    AMF_TYPE_LONG_STRING: write_amf_long_string,
 }
 
 def write_amf(stream, v):
     if isinstance(v, ECMAObject):
         tag = amf_writers_tags[ECMAObject]
+    elif isinstance(v, str):
+        tag = AMF_TYPE_STRING
+        if isinstance(v, LongString) or len(v.encode('utf-8')) > 0xffff:
+            tag = AMF_TYPE_LONG_STRING
     else:
         tag = amf_writers_tags[type(v)]
     write_byte(stream, tag)
@@ -200,45 +230,94 @@ def read_unsigned_medium_int(stream):
     x1, x2, x3 = struct.unpack('BBB', stream.read(3))
     return (x1 << 16) | (x2 << 8) | x3
 
+# previous tag size, tag type and body size, timestamp (lower 24 bits, then
+# upper 8 bits), stream id
+tag_header = struct.Struct('>IIIBH')
+assert tag_header.size == 15
+
+def unpack_tag_header(header):
+    previous_tag_size, type_size, timestamp, stream_id_hi, stream_id = tag_header.unpack(header)
+    body_size = type_size & 0xffffff
+    assert body_size < 1024 * 1024 * 128, 'tag body size too big (> 128MB)'
+    assert stream_id_hi == 0 and stream_id == 0
+    timestamp = timestamp >> 8 | (timestamp & 0xff) << 24
+    return previous_tag_size, type_size >> 24, body_size, timestamp
+
+def pack_tag_header(buffer, previous_tag_size, data_type, body_size, timestamp):
+    tag_header.pack_into(buffer, 0, previous_tag_size, data_type << 24 | body_size,
+                         (timestamp & 0xffffff) << 8 | timestamp >> 24 & 0xff, 0, 0)
+
 def read_tag(stream):
     # header size: 15 bytes
     header = stream.read(15)
     if len(header) == 4:
         return
-    x = struct.unpack('>IBBBBBBBBBBB', header)
-    previous_tag_size = x[0]
-    data_type = x[1]
-    body_size = (x[2] << 16) | (x[3] << 8) | x[4]
-    assert body_size < 1024 * 1024 * 128, 'tag body size too big (> 128MB)'
-    timestamp = (x[5] << 16) | (x[6] << 8) | x[7]
-    timestamp += x[8] << 24
-    assert x[9:] == (0, 0, 0)
+    previous_tag_size, data_type, body_size, timestamp = unpack_tag_header(header)
     body = stream.read(body_size)
     return (data_type, timestamp, body_size, body, previous_tag_size)
-    #previous_tag_size = read_uint(stream)
-    #data_type = read_byte(stream)
-    #body_size = read_unsigned_medium_int(stream)
-    #assert body_size < 1024*1024*128, 'tag body size too big (> 128MB)'
-    #timestamp = read_unsigned_medium_int(stream)
-    #timestamp += read_byte(stream) << 24
-    #assert read_unsigned_medium_int(stream) == 0
-    #body = stream.read(body_size)
-    #return (data_type, timestamp, body_size, body, previous_tag_size)
 
 def write_tag(stream, tag):
     data_type, timestamp, body_size, body, previous_tag_size = tag
-    write_uint(stream, previous_tag_size)
-    write_byte(stream, data_type)
-    write_byte(stream, body_size>>16 & 0xff)
-    write_byte(stream, body_size>>8  & 0xff)
-    write_byte(stream, body_size     & 0xff)
-    write_byte(stream, timestamp>>16 & 0xff)
-    write_byte(stream, timestamp>>8  & 0xff)
-    write_byte(stream, timestamp     & 0xff)
-    write_byte(stream, timestamp>>24 & 0xff)
-    stream.write(b'\0\0\0')
+    header = bytearray(15)
+    pack_tag_header(header, previous_tag_size, data_type, body_size, timestamp)
+    stream.write(header)
     stream.write(body)
 
+def count_keyframes(stream):
+    """Counts the video keyframes in the remaining tags of stream, reading
+    only tag headers. The stream position is left unchanged."""
+    start = stream.tell()
+    # the header and the first byte of the body, which holds the frame type
+    header = bytearray(16)
+    unpack = tag_header.unpack_from
+    readinto = stream.readinto
+    seek = stream.seek
+    count = 0
+    while readinto(header) == 16:
+        type_size = unpack(header)[1]
+        if type_size >> 24 == TAG_TYPE_VIDEO and type_size & 0xffffff \
+                and header[15] >> 4 == VIDEO_FRAME_KEYFRAME:
+            count += 1
+        seek((type_size & 0xffffff) - 1, 1)
+    seek(start)
+    return count
+
+def copy_tags(stream, out, timestamp_start, previous_tag_size, keyframes=None):
+    """Copies the remaining tags of stream to out, shifting their timestamps
+    by timestamp_start. Bodies go through one reused buffer.
+
+    If keyframes is a pair of lists, the file positions and times (in
+    seconds) of video keyframes are appended to them.
+
+    Returns the last timestamp written and the size of the last tag, which
+    the next tag (or the end of the file) has to refer to.
+    """
+    header = bytearray(15)
+    buffer = bytearray(64 * 1024)
+    view = memoryview(buffer)
+    readinto = stream.readinto
+    write = out.write
+    timestamp = timestamp_start
+    # the tag itself starts after the previous tag size
+    position = out.tell() + 4
+    while readinto(header) == 15:
+        _, data_type, body_size, timestamp = unpack_tag_header(header)
+        timestamp += timestamp_start
+        pack_tag_header(header, previous_tag_size, data_type, body_size, timestamp)
+        write(header)
+        if body_size > len(buffer):
+            buffer = bytearray(body_size)
+            view = memoryview(buffer)
+        n = readinto(view[:body_size])
+        write(view[:n])
+        if data_type == TAG_TYPE_VIDEO and n and keyframes is not None \
+                and buffer[0] >> 4 == VIDEO_FRAME_KEYFRAME:
+            keyframes[0].append(float(position))
+            keyframes[1].append(timestamp / 1000)
+        position += 15 + body_size
+        previous_tag_size = 11 + body_size
+    return timestamp, previous_tag_size
+
 def read_flv_header(stream):
     assert stream.read(3) == b'FLV'
     header_version = read_byte(stream)
@@ -279,13 +358,110 @@ def write_meta_tag(stream, meta_type, meta_data):
     write_tag(stream, (TAG_TYPE_METADATA, 0, len(body), body, 0))
 
 
+def open_flv(flv):
+    """Opens an FLV file, returning the stream (at the first tag after the
+    metadata), the metadata type and the metadata."""
+    stream = open(flv, 'rb', buffering = io_buffer_size)
+    read_flv_header(stream)
+    meta_type, meta = read_meta_tag(read_tag(stream))
+    return stream, meta_type, meta
+
+def fit(values, n):
+    """Thins out a list to at most n entries."""
+    if len(values) > n:
+        return [values[i * len(values) // n] for i in range(n)]
+    return values
+
+def filler(size):
+    """Returns a string that takes up size bytes (at least 11) as the value
+    of a 'filler' property, which players ignore."""
+    # the name and the type of the value
+    size -= 2 + len('filler') + 1
+    if size - 2 <= 0xffff:
+        # a string, with a 16-bit length
+        return ' ' * (size - 2)
+    # a long string, with a 32-bit length
+    return LongString(' ' * (size - 4))
+
+class FLVWriter:
+    """Appends FLV parts to output one at a time, so that parts can be
+    merged and removed while later ones are downloading.
+
+    The metadata of the first part is written with room for `keyframes`
+    entries in the keyframe index, and filled in on close(). If the number
+    isn't known, it is guessed from the first part times `parts`, with some
+    headroom; the index is then thinned out to fit, or a filler property
+    takes up the room of the entries left unused.
+    """
+
+    def __init__(self, output, keyframes=None, parts=1):
+        self.out = open(output, 'wb', buffering = io_buffer_size)
+        self.keyframes = keyframes
+        self.parts = parts
+        self.meta_type = None
+        self.meta_data = None
+        self.duration = 0
+        self.positions = []
+        self.times = []
+        self.timestamp_start = 0
+
+    def update_meta(self, filesize=0.0, lasttimestamp=0.0):
+        # all values are numbers, so the size of the meta tag only depends
+        # on the number of keyframes
+        n = self.keyframes
+        positions, times = self.positions, self.times
+        if not positions:
+            # a placeholder, until the positions are known
+            positions = times = [0.0] * n
+        positions, times = fit(positions, n), fit(times, n)
+        self.meta_data.set('duration', self.duration)
+        self.meta_data.update('filesize', filesize)
+        self.meta_data.update('lasttimestamp', lasttimestamp)
+        self.meta_data.update('keyframes', {
+            'filepositions': positions,
+            'times': times,
+        })
+        if len(positions) < n:
+            # two numbers of 9 bytes for every entry
+            self.meta_data.update('filler', filler(18 * (n - len(positions))))
+
+    def append(self, flv):
+        stream, meta_type, meta = open_flv(flv)
+        with stream:
+            # must merge fields: duration
+            # TODO: check other meta info, update other meta info
+            self.duration += meta.get('duration')
+            if self.meta_data is None:
+                self.meta_type, self.meta_data = meta_type, meta
+                if self.keyframes is None:
+                    self.keyframes = count_keyframes(stream) * self.parts * 5 // 4
+                write_flv_header(self.out)
+                self.update_meta()
+                write_meta_tag(self.out, meta_type, self.meta_data)
+                self.meta_end = self.out.tell()
+                # the 9-byte header and the first previous tag size come before it
+                self.previous_tag_size = self.meta_end - 13
+            assert meta_type == self.meta_type
+            self.timestamp_start, self.previous_tag_size = copy_tags(
+                stream, self.out, self.timestamp_start, self.previous_tag_size,
+                (self.positions, self.times))
+
+    def close(self):
+        out = self.out
+        write_uint(out, self.previous_tag_size)
+        self.update_meta(float(out.tell()), self.timestamp_start / 1000)
+        out.seek(9)
+        write_meta_tag(out, self.meta_type, self.meta_data)
+        assert out.tell() == self.meta_end
+        out.close()
+
 ##################################################
 # main
 ##################################################
 
 def guess_output(inputs):
     import os.path
-    inputs = map(os.path.basename, inputs)
+    inputs = list(map(os.path.basename, inputs))
     n = min(map(len, inputs))
     for i in reversed(range(1, n)):
         if len(set(s[:i] for s in inputs)) == 1:
@@ -301,37 +477,17 @@ def concat_flv(flvs, output = None):
         output = os.path.join(output, guess_output(flvs))
     
     print('Merging video parts...')
-    ins = [open(flv, 'rb') for flv in flvs]
-    for stream in ins:
-        read_flv_header(stream)
-    meta_tags = map(read_tag, ins)
-    metas = list(map(read_meta_tag, meta_tags))
-    meta_types, metas = zip(*metas)
-    assert len(set(meta_types)) == 1
-    meta_type = meta_types[0]
+    # count the keyframes first, so that the index fits exactly
+    n = 0
+    for flv in flvs:
+        stream = open_flv(flv)[0]
+        with stream:
+            n += count_keyframes(stream)
     
-    # must merge fields: duration
-    # TODO: check other meta info, update other meta info
-    total_duration = sum(meta.get('duration') for meta in metas)
-    meta_data = metas[0]
-    meta_data.set('duration', total_duration)
-    
-    out = open(output, 'wb')
-    write_flv_header(out)
-    write_meta_tag(out, meta_type, meta_data)
-    timestamp_start = 0
-    for stream in ins:
-        while True:
-            tag = read_tag(stream)
-            if tag:
-                data_type, timestamp, body_size, body, previous_tag_size = tag
-                timestamp += timestamp_start
-                tag = data_type, timestamp, body_size, body, previous_tag_size
-                write_tag(out, tag)
-            else:
-                break
-        timestamp_start = timestamp
-    write_uint(out, previous_tag_size)
+    writer = FLVWriter(output, keyframes = n)
+    for flv in flvs:
+        writer.append(flv)
+    writer.close()
     
     return output
 
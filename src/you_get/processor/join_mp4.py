@@ -6,9 +6,20 @@
 # reader and writer
 ##################################################
 
+import os
 import struct
+import sys
+from array import array
 from io import BytesIO
 
+try:
+    from .fastcopy import copy_stream
+except ImportError: # run as a script
+    from fastcopy import copy_stream
+
+# sample tables are held as arrays of native uint32 (uint64 for co64)
+assert array('I').itemsize == 4 and array('Q').itemsize == 8
+
 def skip(stream, n):
     stream.seek(stream.tell() + n)
 
@@ -36,14 +47,29 @@ def read_ulong(stream):
 def read_byte(stream):
     return ord(stream.read(1))
 
-def copy_stream(source, target, n):
-    buffer_size = 1024 * 1024
-    while n > 0:
-        to_read = min(buffer_size, n)
-        s = source.read(to_read)
-        assert len(s) == to_read, 'no enough data'
-        target.write(s)
-        n -= to_read
+def read_uints(stream, n, typecode='I'):
+    table = array(typecode)
+    table.frombytes(stream.read(table.itemsize * n))
+    assert len(table) == n, 'no enough data'
+    if sys.byteorder == 'little':
+        table.byteswap()
+    return table
+
+def write_uints(stream, table):
+    if sys.byteorder == 'little':
+        table = array(table.typecode, table)
+        table.byteswap()
+    stream.write(table)
+
+def rebase(table, delta, typecode=None):
+    """Adds delta to every entry of a table, optionally into a table of
+    another type."""
+    typecode = typecode or table.typecode
+    if delta:
+        return array(typecode, map(delta.__add__, table))
+    if typecode != table.typecode:
+        return array(typecode, table)
+    return table
 
 class Atom:
     def __init__(self, type, size, body):
@@ -57,6 +83,12 @@ class Atom:
     def __repr__(self):
         return str(self)
     def write1(self, stream):
+        if self.size > 0xffffffff:
+            # 64-bit size
+            write_uint(stream, 1)
+            stream.write(self.type)
+            write_ulong(stream, self.size)
+            return
         write_uint(stream, self.size)
         stream.write(self.type)
     def write(self, stream):
@@ -84,7 +116,7 @@ class CompositeAtom(Atom):
             if a.type == k:
                 return a
         else:
-            raise Exception('atom not found: ' + k)
+            raise Exception('atom not found: %s' % k)
     def get(self, *keys):
         atom = self
         for k in keys:
@@ -133,6 +165,7 @@ class VariableAtom(Atom):
 def read_raw(stream, size, left, type):
     assert size == left + 8
     body = stream.read(left)
+    assert len(body) == left, 'no enough data'
     return Atom(type, size, body)
 
 def read_udta(stream, size, left, type):
@@ -276,7 +309,7 @@ def read_hdlr(stream, size, left, type):
     track_name = stream.read(left)
     #assert track_name[-1] == b'\x00'
     
-    return Atom(b'hdlr', size, body)
+    return VariableAtom(b'hdlr', size, body, [('handler_type', 8, handler_type, 4)])
 
 def read_vmhd(stream, size, left, type):
     body, stream = read_body_stream(stream, left)
@@ -360,12 +393,9 @@ def read_stts(stream, size, left, type):
     #assert entry_count == 1
     left -= 4
     
-    samples = []
-    for i in range(entry_count):
-        sample_count = read_uint(stream)
-        sample_duration = read_uint(stream)
-        samples.append((sample_count, sample_duration))
-        left -= 8
+    # (sample_count, sample_duration) pairs, flattened
+    samples = read_uints(stream, entry_count * 2)
+    left -= entry_count * 8
 
     assert left == 0
     #return Atom('stts', size, None)
@@ -375,13 +405,11 @@ def read_stts(stream, size, left, type):
         def write(self, stream):
             self.write1(stream)
             write_uint(stream, self.body[0])
-            write_uint(stream, len(self.body[1]))
-            for sample_count, sample_duration in self.body[1]:
-                write_uint(stream, sample_count)
-                write_uint(stream, sample_duration)
+            write_uint(stream, len(self.body[1]) // 2)
+            write_uints(stream, self.body[1])
         def calsize(self):
             #oldsize = self.size # TODO: remove
-            self.size = 8 + 4 + 4 + len(self.body[1]) * 8
+            self.size = 8 + 4 + 4 + len(self.body[1]) * 4
             #assert oldsize == self.size, '%s: %d, %d' % (self.type, oldsize, self.size) # TODO: remove
             return self.size
     return stts_atom(b'stts', size, (value, samples))
@@ -393,11 +421,8 @@ def read_stss(stream, size, left, type):
     entry_count = read_uint(stream)
     left -= 4
     
-    samples = []
-    for i in range(entry_count):
-            sample = read_uint(stream)
-            samples.append(sample)
-            left -= 4
+    samples = read_uints(stream, entry_count)
+    left -= entry_count * 4
     
     assert left == 0
     #return Atom('stss', size, None)
@@ -408,8 +433,7 @@ def read_stss(stream, size, left, type):
             self.write1(stream)
             write_uint(stream, self.body[0])
             write_uint(stream, len(self.body[1]))
-            for sample in self.body[1]:
-                write_uint(stream, sample)
+            write_uints(stream, self.body[1])
         def calsize(self):
             self.size = 8 + 4 + 4 + len(self.body[1]) * 4
             return self.size
@@ -422,14 +446,10 @@ def read_stsc(stream, size, left, type):
     entry_count = read_uint(stream)
     left -= 4
     
-    chunks = []
-    for i in range(entry_count):
-        first_chunk = read_uint(stream)
-        samples_per_chunk = read_uint(stream)
-        sample_description_index = read_uint(stream)
-        assert sample_description_index == 1 # what is it?
-        chunks.append((first_chunk, samples_per_chunk, sample_description_index))
-        left -= 12
+    # (first_chunk, samples_per_chunk, sample_description_index) triples, flattened
+    chunks = read_uints(stream, entry_count * 3)
+    assert set(chunks[2::3]) <= {1} # what is it?
+    left -= entry_count * 12
     #chunks, samples = zip(*chunks)
     #total = 0
     #for c, s in zip(chunks[1:], samples):
@@ -444,13 +464,10 @@ def read_stsc(stream, size, left, type):
         def write(self, stream):
             self.write1(stream)
             write_uint(stream, self.body[0])
-            write_uint(stream, len(self.body[1]))
-            for first_chunk, samples_per_chunk, sample_description_index in self.body[1]:
-                write_uint(stream, first_chunk)
-                write_uint(stream, samples_per_chunk)
-                write_uint(stream, sample_description_index)
+            write_uint(stream, len(self.body[1]) // 3)
+            write_uints(stream, self.body[1])
         def calsize(self):
-            self.size = 8 + 4 + 4 + len(self.body[1]) * 12
+            self.size = 8 + 4 + 4 + len(self.body[1]) * 4
             return self.size
     return stsc_atom(b'stsc', size, (value, chunks))
 
@@ -462,15 +479,11 @@ def read_stsz(stream, size, left, type):
     sample_count = read_uint(stream)
     left -= 8
     
-    assert sample_size == 0
-    total = 0
-    sizes = []
+    # sizes are only listed if they differ (sample_size == 0)
+    sizes = array('I')
     if sample_size == 0:
-        for i in range(sample_count):
-            entry_size = read_uint(stream)
-            sizes.append(entry_size)
-            total += entry_size
-            left -= 4
+        sizes = read_uints(stream, sample_count)
+        left -= sample_count * 4
     
     assert left == 0
     #return Atom('stsz', size, None)
@@ -482,25 +495,22 @@ def read_stsz(stream, size, left, type):
             write_uint(stream, self.body[0])
             write_uint(stream, self.body[1])
             write_uint(stream, self.body[2])
-            for entry_size in self.body[3]:
-                write_uint(stream, entry_size)
+            write_uints(stream, self.body[3])
         def calsize(self):
             self.size = 8 + 4 + 8 + len(self.body[3]) * 4
             return self.size
     return stsz_atom(b'stsz', size, (value, sample_size, sample_count, sizes))
 
 def read_stco(stream, size, left, type):
+    # stco or co64, which only differ in the width of the offsets
     value = read_full_atom(stream)
     left -= 4
     
     entry_count = read_uint(stream)
     left -= 4
     
-    offsets = []
-    for i in range(entry_count):
-        chunk_offset = read_uint(stream)
-        offsets.append(chunk_offset)
-        left -= 4
+    offsets = read_uints(stream, entry_count, 'Q' if type == b'co64' else 'I')
+    left -= entry_count * offsets.itemsize
     
     assert left == 0
     #return Atom('stco', size, None)
@@ -511,12 +521,11 @@ def read_stco(stream, size, left, type):
             self.write1(stream)
             write_uint(stream, self.body[0])
             write_uint(stream, len(self.body[1]))
-            for chunk_offset in self.body[1]:
-                write_uint(stream, chunk_offset)
+            write_uints(stream, rebase(self.body[1], 0, 'Q' if self.type == b'co64' else 'I'))
         def calsize(self):
-            self.size = 8 + 4 + 4 + len(self.body[1]) * 4
+            self.size = 8 + 4 + 4 + len(self.body[1]) * (8 if self.type == b'co64' else 4)
             return self.size
-    return stco_atom(b'stco', size, (value, offsets))
+    return stco_atom(type, size, (value, offsets))
 
 def read_ctts(stream, size, left, type):
     value = read_full_atom(stream)
@@ -525,12 +534,9 @@ def read_ctts(stream, size, left, type):
     entry_count = read_uint(stream)
     left -= 4
     
-    samples = []
-    for i in range(entry_count):
-        sample_count = read_uint(stream)
-        sample_offset = read_uint(stream)
-        samples.append((sample_count, sample_offset))
-        left -= 8
+    # (sample_count, sample_offset) pairs, flattened
+    samples = read_uints(stream, entry_count * 2)
+    left -= entry_count * 8
     
     assert left == 0
     class ctts_atom(Atom):
@@ -539,12 +545,10 @@ def read_ctts(stream, size, left, type):
         def write(self, stream):
             self.write1(stream)
             write_uint(stream, self.body[0])
-            write_uint(stream, len(self.body[1]))
-            for sample_count, sample_offset in self.body[1]:
-                write_uint(stream, sample_count)
-                write_uint(stream, sample_offset)
+            write_uint(stream, len(self.body[1]) // 2)
+            write_uints(stream, self.body[1])
         def calsize(self):
-            self.size = 8 + 4 + 4 + len(self.body[1]) * 8
+            self.size = 8 + 4 + 4 + len(self.body[1]) * 4
             return self.size
     return ctts_atom(b'ctts', size, (value, samples))
 
@@ -616,13 +620,14 @@ def read_mdat(stream, size, left, type):
             self.write1(stream)
             self.write2(stream)
         def write2(self, stream):
-            source, source_start, source_size = self.body
-            original = source.tell()
-            source.seek(source_start)
-            copy_stream(source, stream, source_size)
+            # reopen the source, so that only one part is open at a time
+            source_path, source_start, source_size = self.body
+            with open(source_path, 'rb') as source:
+                source.seek(source_start)
+                copy_stream(source, stream, source_size)
         def calsize(self):
             return self.size
-    return mdat_atom(b'mdat', size, (stream, source_start, source_size))
+    return mdat_atom(b'mdat', size, (stream.name, source_start, source_size))
 
 atom_readers = {
     b'mvhd': read_mvhd, # merge duration
@@ -638,6 +643,7 @@ atom_readers = {
     b'stsc': read_stsc, # merge # sample numbers
     b'stsz': read_stsz, # merge # samples
     b'stco': read_stco, # merge # chunk offsets
+    b'co64': read_stco, # merge # chunk offsets
     b'ctts': read_ctts, # merge
     b'smhd': read_smhd, # nothing
     b'mp4a': read_mp4a, # nothing
@@ -685,19 +691,21 @@ def read_atom(stream):
     assert len(header) == 8
     n = 0
     size = struct.unpack('>I', header[:4])[0]
-    assert size > 0
     n += 4
     type = header[4:8]
     n += 4
-    assert type != b'uuid'
     if size == 1:
         size = read_ulong(stream)
         n += 8
+    elif size == 0:
+        # the last atom, up to the end of the file
+        size = os.fstat(stream.fileno()).st_size - stream.tell() + n
     
     left = size - n
     if type in atom_readers:
         return atom_readers[type](stream, size, left, type)
-    raise NotImplementedError('%s: %d' % (type, left))
+    # unknown atoms (uuid, free space, metadata, ...) are passed through
+    return read_raw(stream, size, left, type)
 
 def write_atom(stream, atom):
     atom.write(stream)
@@ -728,53 +736,64 @@ def read_mp4(stream):
 ##################################################
 
 def merge_stts(samples_list):
-    sample_list = []
+    sample_list = array('I')
     for samples in samples_list:
-        #assert len(samples) == 1
-        #sample_list.append(samples[0])
-        sample_list += samples
-    counts, durations = zip(*sample_list)
+        sample_list.extend(samples)
+    counts, durations = sample_list[0::2], sample_list[1::2]
     #assert len(set(durations)) == 1, 'not all durations equal'
     if len(set(durations)) == 1:
-        return [(sum(counts), durations[0])]
+        return array('I', (sum(counts), durations[0]))
     return sample_list
 
 def merge_stss(samples, sample_number_list):
-    results = []
+    results = array('I')
     start = 0
     for samples, sample_number_list in zip(samples, sample_number_list):
-        results.extend(map(lambda x: start + x, samples))
+        results.extend(rebase(samples, start))
         start += sample_number_list
     return results
 
 def merge_stsc(chunks_list, total_chunk_number_list):
-    results = []
+    results = array('I')
     chunk_index = 1
     for chunks, total in zip(chunks_list, total_chunk_number_list):
-        for i in range(len(chunks)):
-            if i < len(chunks) - 1:
-                chunk_number = chunks[i + 1][0] - chunks[i][0]
+        for i in range(0, len(chunks), 3):
+            if i < len(chunks) - 3:
+                chunk_number = chunks[i + 3] - chunks[i]
             else:
-                chunk_number = total + 1 - chunks[i][0]
-            sample_number = chunks[i][1]
-            description = chunks[i][2]
-            results.append((chunk_index, sample_number, description))
+                chunk_number = total + 1 - chunks[i]
+            sample_number = chunks[i + 1]
+            description = chunks[i + 2]
+            results.extend((chunk_index, sample_number, description))
             chunk_index += chunk_number
     return results
 
 def merge_stco(offsets_list, mdats):
+    """Returns the chunk offsets relative to the start of the merged mdat
+    data, as uint64s; see place_moov()."""
     offset = 0
-    results = []
+    results = array('Q')
     for offsets, mdat in zip(offsets_list, mdats):
-        results.extend(offset + x - mdat.body[1] for x in offsets)
-        offset += mdat.size - 8
+        results.extend(rebase(offsets, offset - mdat.body[1], 'Q'))
+        offset += mdat.body[2]
     return results
 
-def merge_stsz(sizes_list):
-    return sum(sizes_list, [])
+def merge_stsz(stszs):
+    """Merges stsz bodies, (value, sample_size, sample_count, sizes)."""
+    sample_sizes = set(x[1] for x in stszs)
+    sample_count = sum(x[2] for x in stszs)
+    if len(sample_sizes) == 1 and 0 not in sample_sizes:
+        # all samples of the same size
+        return stszs[0][0], stszs[0][1], sample_count, array('I')
+    results = array('I')
+    for value, sample_size, count, sizes in stszs:
+        results.extend(sizes if sample_size == 0 else array('I', [sample_size]) * count)
+    return stszs[0][0], 0, sample_count, results
 
 def merge_mdats(mdats):
-    total_size = sum(x.size - 8 for x in mdats) + 8
+    total_size = sum(x.body[2] for x in mdats) + 8
+    if total_size > 0xffffffff:
+        total_size += 8 # 64-bit size
     class multi_mdat_atom(Atom):
         def __init__(self, type, size, body):
             Atom.__init__(self, type, size, body)
@@ -788,104 +807,235 @@ def merge_mdats(mdats):
             return self.size
     return multi_mdat_atom(b'mdat', total_size, mdats)
 
+def get_stco(trak):
+    for atom in trak.get(b'mdia', b'minf', b'stbl').body:
+        if atom.type in (b'stco', b'co64'):
+            return atom
+    raise Exception('atom not found: stco')
+
+def get_table(stbl, type):
+    """Returns a table of stbl, creating an empty one if it is missing."""
+    for atom in stbl.body:
+        if atom.type == type:
+            return atom
+    atom = read_atom(BytesIO(struct.pack('>I4sII', 16, type, 0, 0)))
+    # after stts, where the optional tables usually are
+    stbl.body.insert(stbl.body.index(stbl.get(b'stts')) + 1, atom)
+    return atom
+
+def has_table(stbl, type):
+    return bool(stbl.get_all(type))
+
+# sample tables that merge_trak() merges
+merged_tables = {b'stsd', b'stts', b'stss', b'stsc', b'stsz', b'stco', b'co64', b'ctts'}
+# optional per-sample hints, which are dropped rather than merged
+dropped_tables = {b'sdtp', b'sbgp', b'sgpd', b'cslg'}
+
+def check_tables(stbls):
+    """Drops the hint tables of the first part's stbl, and raises if any
+    part has a sample table that can't be merged."""
+    for stbl in stbls:
+        for atom in stbl.body:
+            if atom.type not in merged_tables | dropped_tables:
+                raise Exception('sample table can\'t be merged: %s' % atom.type)
+    stbls[0].body = [x for x in stbls[0].body if x.type not in dropped_tables]
+
+def read_elst(edts):
+    """Returns the entry format and the entries of the edit list in edts.
+    Raises unless it is a single media edit, optionally after empty edits,
+    which merge_edts() can stretch."""
+    body = edts.body
+    size, type = struct.unpack('>I4s', body[:8])
+    if type != b'elst' or size != len(body):
+        raise Exception('edit list can\'t be merged')
+    version = body[8]
+    entry_format = '>QqHH' if version == 1 else '>IiHH'
+    entry_count = struct.unpack('>I', body[12:16])[0]
+    entries = list(struct.iter_unpack(entry_format, body[16:]))
+    if len(entries) != entry_count or not entries or \
+            any(x[1] != -1 for x in entries[:-1]) or \
+            entries[-1][1] < 0 or entries[-1][2:] != (1, 0):
+        raise Exception('edit list can\'t be merged')
+    return entry_format, entries
+
+def merge_edts(edts, duration):
+    """Stretches the edit list of the first part over the merged duration
+    of the track (in the movie timescale)."""
+    body = edts.body
+    entry_format, entries = read_elst(edts)
+    segment_duration = duration - sum(x[0] for x in entries[:-1])
+    entries[-1] = (segment_duration,) + entries[-1][1:]
+    edts.body = body[:16] + b''.join(struct.pack(entry_format, *x) for x in entries)
+
+def merge_trak(traks, mdats):
+    """Merges the same track of every part into the track of the first part.
+
+    Optional tables (stss, ctts) are merged if any part has them; parts
+    without them get the default (all samples are sync samples, no
+    composition offsets). Hint tables are dropped, and the edit list is
+    stretched; other tables and edit lists raise, for ffmpeg to merge the
+    parts instead.
+    """
+    trak = traks[0]
+    duration = sum(x.get(b'tkhd').get('duration') for x in traks)
+    trak.get(b'tkhd').set('duration', duration)
+    trak.get(b'mdia', b'mdhd').set('duration', sum(x.get(b'mdia', b'mdhd').get('duration') for x in traks))
+    for edts in trak.get_all(b'edts'):
+        merge_edts(edts, duration)
+
+    stbls = [x.get(b'mdia', b'minf', b'stbl') for x in traks]
+    check_tables(stbls)
+    stbl = stbls[0]
+    sample_counts = [x.get(b'stsz').body[2] for x in stbls]
+
+    stts = merge_stts(x.get(b'stts').body[1] for x in stbls)
+    stsc = merge_stsc((x.get(b'stsc').body[1] for x in stbls),
+                      (len(get_stco(x).body[1]) for x in traks))
+    stco = merge_stco((get_stco(x).body[1] for x in traks), mdats)
+    stsz = merge_stsz([x.get(b'stsz').body for x in stbls])
+
+    if any(has_table(x, b'stss') for x in stbls):
+        stss = merge_stss((x.get(b'stss').body[1] if has_table(x, b'stss')
+                           else array('I', range(1, n + 1))
+                           for x, n in zip(stbls, sample_counts)),
+                          sample_counts)
+        stss_atom = get_table(stbl, b'stss')
+        stss_atom.body = stss_atom.body[0], stss
+
+    if any(has_table(x, b'ctts') for x in stbls):
+        ctts = array('I')
+        for x, n in zip(stbls, sample_counts):
+            ctts.extend(x.get(b'ctts').body[1] if has_table(x, b'ctts')
+                        else array('I', (n, 0)))
+        ctts_atom = get_table(stbl, b'ctts')
+        ctts_atom.body = ctts_atom.body[0], ctts
+
+    stts_atom = stbl.get(b'stts')
+    stts_atom.body = stts_atom.body[0], stts
+    stsc_atom = stbl.get(b'stsc')
+    stsc_atom.body = stsc_atom.body[0], stsc
+    stco_atom = get_stco(trak)
+    stco_atom.body = stco_atom.body[0], stco
+    stbl.get(b'stsz').body = stsz
+
+def match_traks(moovs):
+    """Groups the tracks of all parts: the n-th track of a handler type
+    (vide, soun, ...) in a part goes with the n-th track of that type in
+    every other part."""
+    def by_handler(moov):
+        traks = {}
+        for trak in moov.get_all(b'trak'):
+            handler = trak.get(b'mdia', b'hdlr').get('handler_type')
+            traks.setdefault(handler, []).append(trak)
+        return traks
+    parts = [by_handler(x) for x in moovs]
+    for traks in parts[1:]:
+        if {k: len(v) for k, v in traks.items()} != {k: len(v) for k, v in parts[0].items()}:
+            raise Exception('parts have different tracks')
+    groups = []
+    for trak in moovs[0].get_all(b'trak'):
+        handler = trak.get(b'mdia', b'hdlr').get('handler_type')
+        i = parts[0][handler].index(trak)
+        groups.append([traks[handler][i] for traks in parts])
+    return groups
+
+def check_moovs(moovs):
+    """Raises if merge_moov() can't merge the parts."""
+    for traks in match_traks(moovs):
+        for edts in traks[0].get_all(b'edts'):
+            read_elst(edts)
+        check_tables([x.get(b'mdia', b'minf', b'stbl') for x in traks])
+
 def merge_moov(moovs, mdats):
-    mvhd_duration = 0
-    for x in moovs:
-        mvhd_duration += x.get(b'mvhd').get('duration')
-    tkhd_durations = [0, 0]
-    mdhd_durations = [0, 0]
-    for x in moovs:
-        traks = x.get_all(b'trak')
-        assert len(traks) == 2
-        tkhd_durations[0] += traks[0].get(b'tkhd').get('duration')
-        tkhd_durations[1] += traks[1].get(b'tkhd').get('duration')
-        mdhd_durations[0] += traks[0].get(b'mdia', b'mdhd').get('duration')
-        mdhd_durations[1] += traks[1].get(b'mdia', b'mdhd').get('duration')
-    #mvhd_duration = min(mvhd_duration, tkhd_durations)
-    
-    trak0s = [x.get_all(b'trak')[0] for x in moovs]
-    trak1s = [x.get_all(b'trak')[1] for x in moovs]
-    
-    stts0 = merge_stts(x.get(b'mdia', b'minf', b'stbl', b'stts').body[1] for x in trak0s)
-    stts1 = merge_stts(x.get(b'mdia', b'minf', b'stbl', b'stts').body[1] for x in trak1s)
-    
-    stss = merge_stss((x.get(b'mdia', b'minf', b'stbl', b'stss').body[1] for x in trak0s), (len(x.get(b'mdia', b'minf', b'stbl', b'stsz').body[3]) for x in trak0s))
-    
-    stsc0 = merge_stsc((x.get(b'mdia', b'minf', b'stbl', b'stsc').body[1] for x in trak0s), (len(x.get(b'mdia', b'minf', b'stbl', b'stco').body[1]) for x in trak0s))
-    stsc1 = merge_stsc((x.get(b'mdia', b'minf', b'stbl', b'stsc').body[1] for x in trak1s), (len(x.get(b'mdia', b'minf', b'stbl', b'stco').body[1]) for x in trak1s))
-    
-    stco0 = merge_stco((x.get(b'mdia', b'minf', b'stbl', b'stco').body[1] for x in trak0s), mdats)
-    stco1 = merge_stco((x.get(b'mdia', b'minf', b'stbl', b'stco').body[1] for x in trak1s), mdats)
-    
-    stsz0 = merge_stsz((x.get(b'mdia', b'minf', b'stbl', b'stsz').body[3] for x in trak0s))
-    stsz1 = merge_stsz((x.get(b'mdia', b'minf', b'stbl', b'stsz').body[3] for x in trak1s))
-    
-    ctts = sum((x.get(b'mdia', b'minf', b'stbl', b'ctts').body[1] for x in trak0s), [])
-    
     moov = moovs[0]
-    
-    moov.get(b'mvhd').set('duration', mvhd_duration)
-    trak0 = moov.get_all(b'trak')[0]
-    trak1 = moov.get_all(b'trak')[1]
-    trak0.get(b'tkhd').set('duration', tkhd_durations[0])
-    trak1.get(b'tkhd').set('duration', tkhd_durations[1])
-    trak0.get(b'mdia', b'mdhd').set('duration', mdhd_durations[0])
-    trak1.get(b'mdia', b'mdhd').set('duration', mdhd_durations[1])
-    
-    stts_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stts')
-    stts_atom.body = stts_atom.body[0], stts0
-    stts_atom = trak1.get(b'mdia', b'minf', b'stbl', b'stts')
-    stts_atom.body = stts_atom.body[0], stts1
-    
-    stss_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stss')
-    stss_atom.body = stss_atom.body[0], stss
-    
-    stsc_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stsc')
-    stsc_atom.body = stsc_atom.body[0], stsc0
-    stsc_atom = trak1.get(b'mdia', b'minf', b'stbl', b'stsc')
-    stsc_atom.body = stsc_atom.body[0], stsc1
-    
-    stco_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stco')
-    stco_atom.body = stss_atom.body[0], stco0
-    stco_atom = trak1.get(b'mdia', b'minf', b'stbl', b'stco')
-    stco_atom.body = stss_atom.body[0], stco1
-    
-    stsz_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stsz')
-    stsz_atom.body = stsz_atom.body[0], stsz_atom.body[1], len(stsz0), stsz0
-    stsz_atom = trak1.get(b'mdia', b'minf', b'stbl', b'stsz')
-    stsz_atom.body = stsz_atom.body[0], stsz_atom.body[1], len(stsz1), stsz1
-    
-    ctts_atom = trak0.get(b'mdia', b'minf', b'stbl', b'ctts')
-    ctts_atom.body = ctts_atom.body[0], ctts
-    
-    old_moov_size = moov.size
-    new_moov_size = moov.calsize()
-    new_mdat_start = mdats[0].body[1] + new_moov_size - old_moov_size
-    stco0 = list(map(lambda x: x + new_mdat_start, stco0))
-    stco1 = list(map(lambda x: x + new_mdat_start, stco1))
-    stco_atom = trak0.get(b'mdia', b'minf', b'stbl', b'stco')
-    stco_atom.body = stss_atom.body[0], stco0
-    stco_atom = trak1.get(b'mdia', b'minf', b'stbl', b'stco')
-    stco_atom.body = stss_atom.body[0], stco1
-    
+    moov.get(b'mvhd').set('duration', sum(x.get(b'mvhd').get('duration') for x in moovs))
+    for traks in match_traks(moovs):
+        merge_trak(traks, mdats)
     return moov
 
+def place_moov(moov, data_start, before_data=True):
+    """Turns the relative chunk offsets of a merged moov into file offsets,
+    for media data starting at `data_start` bytes after the moov (or at
+    `data_start`, if the moov goes after the data). Offsets past 4 GiB are
+    written in co64 atoms instead of stco."""
+    atoms = [get_stco(trak) for trak in moov.get_all(b'trak')]
+    offsets_list = [atom.body[1] for atom in atoms]
+    last = max((max(offsets) for offsets in offsets_list if offsets), default=0)
+    type = b'stco'
+    while True:
+        for atom in atoms:
+            atom.type = type
+        # also updates the atom sizes
+        moov_size = moov.calsize()
+        start = (moov_size if before_data else 0) + data_start
+        # co64 only makes moov larger, and moves the data further
+        if type == b'co64' or last + start <= 0xffffffff:
+            break
+        type = b'co64'
+    for atom, offsets in zip(atoms, offsets_list):
+        atom.body = atom.body[0], rebase(offsets, start, 'Q' if type == b'co64' else 'I')
+
 def merge_mp4s(files, output):
     assert files
-    ins = [open(mp4, 'rb') for mp4 in files]
-    mp4s = list(map(read_mp4, ins))
+    mp4s = []
+    for mp4 in files:
+        # mdat data is copied later from the file path, one part at a time
+        with open(mp4, 'rb') as stream:
+            mp4s.append(read_mp4(stream))
     moovs = list(map(lambda x: x[1], mp4s))
     mdats = list(map(lambda x: x[2], mp4s))
     moov = merge_moov(moovs, mdats)
     mdat = merge_mdats(mdats)
+    # put moov before mdat (faststart), so that the file can be played
+    # while it is still being transferred
+    heads = [x for x in mp4s[0][0] if x.type not in (b'moov', b'mdat')]
+    mdat_header_size = mdat.size - sum(x.body[2] for x in mdats)
+    place_moov(moov, sum(x.calsize() for x in heads) + mdat_header_size)
     with open(output, 'wb') as output:
-        for x in mp4s[0][0]:
-            if x.type == b'moov':
-                moov.write(output)
-            elif x.type == b'mdat':
-                mdat.write(output)
-            else:
-                x.write(output)
+        for x in heads:
+            x.write(output)
+        moov.write(output)
+        mdat.write(output)
+
+class MP4Writer:
+    """Appends MP4 parts to output one at a time, so that parts can be
+    merged and removed while later ones are downloading.
+
+    The media data is copied as the parts come; the merged moov can only
+    be built from all parts, so it goes after the data, on close().
+    """
+
+    def __init__(self, output):
+        self.out = open(output, 'wb')
+        self.moovs = []
+        self.mdats = []
+
+    def append(self, mp4):
+        with open(mp4, 'rb') as stream:
+            atoms, moov, mdat = read_mp4(stream)
+        # before the part is written (and removed), rather than on close()
+        check_moovs(self.moovs[:1] + [moov])
+        if not self.moovs:
+            for x in atoms:
+                if x.type not in (b'moov', b'mdat'):
+                    x.write(self.out)
+            # a 64-bit size, filled in on close()
+            self.out.write(struct.pack('>I4sQ', 1, b'mdat', 0))
+            self.data_start = self.out.tell()
+        mdat.write2(self.out)
+        self.moovs.append(moov)
+        self.mdats.append(mdat)
+
+    def close(self):
+        out = self.out
+        data_end = out.tell()
+        out.seek(self.data_start - 8)
+        write_ulong(out, data_end - self.data_start + 16)
+        out.seek(data_end)
+        moov = merge_moov(self.moovs, self.mdats)
+        place_moov(moov, self.data_start, before_data=False)
+        moov.write(out)
+        out.close()
 
 ##################################################
 # main
@@ -1,7 +1,94 @@
 #!/usr/bin/env python
 
-import struct
-from io import BytesIO
+import os
+
+try:
+    from .fastcopy import copy_stream
+except ImportError: # run as a script
+    from fastcopy import copy_stream
+
+##################################################
+# reader and writer
+##################################################
+
+packet_size = 188
+# a whole number of packets
+block_size = packet_size * 4096
+
+def discontinuity_packet(pid, cc):
+    """Returns a packet with no payload, which only has the
+    discontinuity_indicator set in its adaptation field."""
+    return bytes([0x47, (pid >> 8) & 0x1f, pid & 0xff, 0x20 | cc, 183, 0x80]) + b'\xff' * 182
+
+def copy_packets(source, target, counters):
+    """Appends the packets of source to target, renumbering continuity
+    counters to follow on from `counters` (PID -> last counter), which is
+    updated. The first packet of every PID that was seen before is marked
+    as a discontinuity, so that decoders reset their clocks for it."""
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    seen = set()
+    while True:
+        n = source.readinto(buffer)
+        if not n:
+            break
+        start = 0
+        for i in range(0, n - n % packet_size, packet_size):
+            pid = (buffer[i + 1] & 0x1f) << 8 | buffer[i + 2]
+            if pid == 0x1fff: # null packet
+                continue
+            header = buffer[i + 3]
+            last = counters.get(pid)
+            if last is None:
+                seen.add(pid)
+                counters[pid] = header & 0x0f
+                continue
+
+            if pid not in seen:
+                seen.add(pid)
+                if header & 0x20 and buffer[i + 4]:
+                    # has an adaptation field, set discontinuity_indicator
+                    buffer[i + 5] |= 0x80
+                else:
+                    target.write(view[start:i])
+                    target.write(discontinuity_packet(pid, last))
+                    start = i
+            if header & 0x10: # has payload
+                last = (last + 1) & 0x0f
+                buffer[i + 3] = header & 0xf0 | last
+                counters[pid] = last
+            else:
+                buffer[i + 3] = header & 0xf0 | last
+        target.write(view[start:n])
+
+def is_aligned(ts):
+    """Checks that a file looks like a sequence of 188-byte packets."""
+    if os.path.getsize(ts) % packet_size:
+        return False
+    with open(ts, 'rb') as f:
+        return f.read(1) in (b'\x47', b'')
+
+class TSWriter:
+    """Appends TS parts to output one at a time (see concat_ts()), so that
+    parts can be merged and removed while later ones are downloading."""
+
+    def __init__(self, output, repair=False):
+        self.out = open(output, 'wb')
+        self.repair = repair
+        self.counters = {}
+
+    def append(self, ts):
+        with open(ts, 'rb') as stream:
+            if self.repair and is_aligned(ts):
+                copy_packets(stream, self.out, self.counters)
+            else:
+                # the counters are unknown past a part copied as it is, so
+                # the parts after it are left as they are too
+                self.repair = False
+                copy_stream(stream, self.out)
+
+    def close(self):
+        self.out.close()
 
 ##################################################
 # main
@@ -9,14 +96,20 @@ from io import BytesIO
 
 def guess_output(inputs):
     import os.path
-    inputs = map(os.path.basename, inputs)
+    inputs = list(map(os.path.basename, inputs))
     n = min(map(len, inputs))
     for i in reversed(range(1, n)):
         if len(set(s[:i] for s in inputs)) == 1:
             return inputs[0][:i] + '.ts'
     return 'output.ts'
 
-def concat_ts(ts_parts, output = None):
+def concat_ts(ts_parts, output = None, repair = False):
+    """Concatenates TS files, streaming them in blocks of whole packets.
+
+    With `repair`, continuity counters are renumbered across parts and
+    every stream is flagged as discontinuous where a new part starts, so
+    that players don't choke on the jumps in counters and timestamps.
+    """
     assert ts_parts, 'no ts files found'
     import os.path
     if not output:
@@ -26,32 +119,32 @@ def concat_ts(ts_parts, output = None):
     
     print('Merging video parts...')
     
-    ts_out_file = open(output, "wb")
+    writer = TSWriter(output, repair)
     for ts_in in ts_parts:
-        ts_in_file = open(ts_in, "rb")
-        ts_in_data = ts_in_file.read()
-        ts_in_file.close()
-        ts_out_file.write(ts_in_data)
-    ts_out_file.close()
+        writer.append(ts_in)
+    writer.close()
     return output
 
 def usage():
-    print('Usage: [python3] join_ts.py --output TARGET.ts ts...')
+    print('Usage: [python3] join_ts.py [--repair] --output TARGET.ts ts...')
 
 def main():
     import sys, getopt
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "ho:", ["help", "output="])
+        opts, args = getopt.getopt(sys.argv[1:], "ho:", ["help", "output=", "repair"])
     except getopt.GetoptError as err:
         usage()
         sys.exit(1)
     output = None
+    repair = False
     for o, a in opts:
         if o in ("-h", "--help"):
             usage()
             sys.exit()
         elif o in ("-o", "--output"):
             output = a
+        elif o in ("--repair",):
+            repair = True
         else:
             usage()
             sys.exit(1)
@@ -59,7 +152,7 @@ def main():
         usage()
         sys.exit(1)
     
-    concat_ts(args, output)
+    concat_ts(args, output, repair)
 
 if __name__ == '__main__':
     main()
@@ -2,6 +2,7 @@
 
 import os.path
 import subprocess
+from ..util import cache
 
 def get_usable_rtmpdump(cmd):
     try:
@@ -11,10 +12,23 @@ def get_usable_rtmpdump(cmd):
     except:
         return None
 
-RTMPDUMP = get_usable_rtmpdump('rtmpdump')
+_rtmpdump = []
+
+def get_rtmpdump():
+    """Returns the rtmpdump command, or None. Only probed when first needed,
+    then remembered."""
+    if not _rtmpdump:
+        _rtmpdump.append(cache.probe_binary('rtmpdump', get_usable_rtmpdump, 'rtmpdump'))
+    return _rtmpdump[0]
+
+def __getattr__(name):
+    # RTMPDUMP used to be probed at import time
+    if name == 'RTMPDUMP':
+        return get_rtmpdump()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 def has_rtmpdump_installed():
-    return RTMPDUMP is not None
+    return get_rtmpdump() is not None
 
 #
 #params ={"-y":"playlist","-q":None,}
@@ -25,7 +39,7 @@ def download_rtmpdump_stream(url, title, ext,params={},output_dir='.'):
     filename = '%s.%s' % (title, ext)
     filepath = os.path.join(output_dir, filename)
 
-    cmdline = [RTMPDUMP, '-r']
+    cmdline = [get_rtmpdump(), '-r']
     cmdline.append(url)
     cmdline.append('-o')
     cmdline.append(filepath)
@@ -45,7 +59,7 @@ def download_rtmpdump_stream(url, title, ext,params={},output_dir='.'):
 def play_rtmpdump_stream(player, url, params={}):
     
     #construct left side of pipe
-    cmdline = [RTMPDUMP, '-r']
+    cmdline = [get_rtmpdump(), '-r']
     cmdline.append(url)
     
     #append other params if exist
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""Runs a batch of jobs concurrently, taking turns between sites."""
+
+import collections
+import logging
+import threading
+import time
+
+from . import log
+
+class Job:
+    def __init__(self, site, name, fn, args, kwargs):
+        self.site = site
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.error = None
+        self.elapsed = None
+
+    @property
+    def reason(self):
+        """Describes the error of a failed job."""
+        if isinstance(self.error, SystemExit):
+            return 'exit status %s' % self.error.code
+        return str(self.error) or type(self.error).__name__
+
+class Batch:
+    """Jobs, each for a site (any hashable key), run by up to `jobs`
+    threads, with at most `site_jobs` of a site running at once.
+
+    Sites take turns, so a long queue for one site does not hold up the
+    others. A job that raises fails alone: the error is logged and kept on
+    the job, and the batch goes on.
+    """
+
+    def __init__(self, jobs, site_jobs=None):
+        self.jobs = jobs
+        self.site_jobs = site_jobs or jobs
+        # sites with queued jobs, the next to take a turn first
+        self.queues = collections.OrderedDict()
+        self.running = collections.Counter()
+        self.all = []
+        self.cond = threading.Condition()
+
+    def add(self, site, name, fn, *args, **kwargs):
+        job = Job(site, name, fn, args, kwargs)
+        self.queues.setdefault(site, collections.deque()).append(job)
+        self.all.append(job)
+        return job
+
+    def next_job(self):
+        """Takes the next job, waiting while every site with queued jobs is
+        at its cap. Returns None once nothing is queued. Called with the
+        lock held."""
+        while self.queues:
+            for site in self.queues:
+                if self.running[site] < self.site_jobs:
+                    queue = self.queues.pop(site)
+                    job = queue.popleft()
+                    if queue:
+                        # to the back of the line
+                        self.queues[site] = queue
+                    self.running[site] += 1
+                    return job
+            self.cond.wait()
+        return None
+
+    def worker(self):
+        while True:
+            with self.cond:
+                job = self.next_job()
+            if job is None:
+                return
+            start = time.time()
+            try:
+                job.fn(*job.args, **job.kwargs)
+            except (Exception, SystemExit) as e:
+                # extractors exit on some errors; that only ends the job
+                job.error = e
+                log.e('[error] %s: %s' % (job.name, job.reason))
+                logging.debug('%s failed' % job.name, exc_info=True)
+            finally:
+                job.elapsed = time.time() - start
+                with self.cond:
+                    self.running[job.site] -= 1
+                    self.cond.notify_all()
+
+    def run(self):
+        """Runs the jobs, and returns them all once they have finished."""
+        threads = [threading.Thread(target=self.worker, daemon=True)
+                   for i in range(min(self.jobs, len(self.all)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return self.all
+
+    def summary(self):
+        """Returns a report of the finished batch, as lines of text."""
+        failed = [job for job in self.all if job.error is not None]
+        lines = ['%s of %s succeeded' % (len(self.all) - len(failed),
+                                         len(self.all))]
+        for job in failed:
+            lines.append('failed: %s (%s)' % (job.name, job.reason))
+        return lines
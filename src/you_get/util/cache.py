@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import json
+import os
+import platform
+import shutil
+import tempfile
+
+def cache_dir():
+    """Returns the directory of the on-disk caches (which may not exist
+    yet), or None if $YOU_GET_CACHE_DIR is set to an empty string."""
+    path = os.environ.get('YOU_GET_CACHE_DIR')
+    if path is not None:
+        return path or None
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'you-get')
+
+def cache_path(name):
+    path = cache_dir()
+    return path and os.path.join(path, name)
+
+def load(name):
+    """Returns the JSON data cached under name, or None."""
+    path = cache_path(name + '.json')
+    if not path:
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save(name, data):
+    """Caches JSON data under name. Failures are ignored; the cache is only
+    an optimization."""
+    path = cache_path(name + '.json')
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write a new file and rename it, so that readers never see half of it
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp, path)
+        except:
+            os.remove(temp)
+            raise
+    except OSError:
+        pass
+
+def probe_binary(cmd, probe, cache_name):
+    """Returns probe(cmd), cached on disk under cache_name for the path and
+    mtime of the binary, so that it is only run again after an upgrade.
+    A probe that returns None (which may have failed for the time being) is
+    not cached. Returns None without probing if cmd is not on PATH."""
+    path = shutil.which(cmd)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = '%s %s %s' % (path, stat.st_mtime_ns, stat.st_size)
+    entries = load(cache_name) or {}
+    if entries.get(key) is None:
+        result = probe(cmd)
+        if result is None:
+            return None
+        # drop entries for older binaries at the same path
+        entries = {k: v for k, v in entries.items() if k.rsplit(' ', 2)[0] != path}
+        entries[key] = result
+        save(cache_name, entries)
+    return entries[key]
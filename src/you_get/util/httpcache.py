@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""An on-disk cache of HTTP responses, for get_content() and post_content().
+
+Every response is a file in the http directory of the cache (see
+cache.cache_dir()): a line of JSON metadata, then the body. Files are
+touched when used, and the least recently used are removed once the cache
+grows beyond max_size. Stale responses that have an ETag or Last-Modified
+are revalidated rather than fetched again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from . import cache
+
+# seconds to keep a response for, by host and its subdomains; 0 to never
+# cache. Many APIs hand out signed media URLs that soon expire, so keep
+# the default short.
+default_ttl = 10 * 60
+site_ttls = {
+    'googlevideo.com': 0,
+    'youtube.com': 30 * 60,
+    'funshion.com': 24 * 60 * 60,
+    'fun.tv': 24 * 60 * 60,
+}
+
+max_size = 64 * 1024 * 1024
+
+def ttl(host):
+    """Returns how long to keep responses from host, in seconds."""
+    host = host.lower()
+    while host:
+        if host in site_ttls:
+            return site_ttls[host]
+        host = host.partition('.')[2]
+    return default_ttl
+
+def key(method, url, headers, data=None):
+    """Returns the cache key of a request: its method, URL, headers and
+    body, hashed."""
+    h = hashlib.sha1()
+    h.update(('%s %s\n' % (method, url)).encode('utf-8'))
+    for k, v in sorted((k.lower(), v) for k, v in headers.items()):
+        h.update(('%s: %s\n' % (k, v)).encode('utf-8'))
+    if data is not None:
+        h.update(data)
+    return h.hexdigest()
+
+def path(key):
+    return cache.cache_path(os.path.join('http', key))
+
+def load(key):
+    """Returns (metadata, body) cached under key, or None."""
+    filename = path(key)
+    if not filename:
+        return None
+    try:
+        with open(filename, 'rb') as f:
+            meta = json.loads(f.readline().decode('utf-8'))
+            body = f.read()
+        # the modification time orders the entries for eviction
+        os.utime(filename)
+    except (OSError, ValueError):
+        return None
+    return meta, body
+
+def store(key, meta, body):
+    """Caches a response under key. Failures are ignored."""
+    filename = path(key)
+    if not filename:
+        return
+    directory = os.path.dirname(filename)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n')
+                f.write(body)
+            os.replace(temp, filename)
+        except:
+            os.remove(temp)
+            raise
+        evict(directory)
+    except OSError:
+        pass
+
+def evict(directory):
+    """Removes the least recently used entries until the cache fits in
+    max_size."""
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+    if total <= max_size:
+        return
+    entries.sort()
+    for mtime, size, filename in entries:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        total -= size
+        if total <= max_size:
+            break
+
+def fresh(meta, host):
+    return time.time() - meta['time'] < ttl(host)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import copy
+import http.client
+import socket
+import threading
+from urllib import request, error
+
+class PooledResponse(http.client.HTTPResponse):
+    """An HTTPResponse that hands its connection back once fully read."""
+
+    # Called with True if the connection can be reused, False otherwise.
+    release = None
+
+    def close(self):
+        if self.fp is not None:
+            # body not read to the end, the connection is unusable
+            self.will_close = True
+        super().close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        release, self.release = self.release, None
+        if release is not None:
+            release(not self.will_close)
+
+class ConnectionPool:
+    """Idle HTTP/1.1 connections, kept per host.
+
+    At most `max_idle` idle connections are kept for each host; connections
+    are checked out for the duration of a single request, so the pool can be
+    shared between threads.
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def get(self, key):
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop()
+
+    def put(self, key, conn):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def urlopen(self, http_class, req, **http_conn_args):
+        """Sends a urllib Request over a pooled connection.
+
+        Mirrors AbstractHTTPHandler.do_open(), minus the 'Connection: close'.
+        Connections are only shared between requests with the same TLS
+        settings.
+        """
+        host = req.host
+        if not host:
+            raise error.URLError('no host given')
+        key = (http_class, host, req._tunnel_host,
+               http_conn_args.get('context'), http_conn_args.get('check_hostname'))
+        timeout = req.timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items()
+                        if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+        tunnel_headers = {}
+        if req._tunnel_host and 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+
+        conn = self.get(key)
+        while True:
+            reused = conn is not None
+            if not reused:
+                conn = http_class(host, timeout=timeout, **http_conn_args)
+                conn.response_class = PooledResponse
+                if req._tunnel_host:
+                    conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            elif conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                try:
+                    conn.request(req.get_method(), req.selector, req.data, headers,
+                                 encode_chunked=req.has_header('Transfer-encoding'))
+                except OSError as err:
+                    if reused:
+                        raise http.client.RemoteDisconnected(err)
+                    raise error.URLError(err)
+                r = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine):
+                conn.close()
+                if not reused:
+                    raise
+                # the server dropped an idle connection, retry on a new one
+                conn = None
+            except:
+                conn.close()
+                raise
+
+        def release(reusable):
+            if reusable:
+                self.put(key, conn)
+            else:
+                conn.close()
+        r.release = release
+        if r.length == 0:
+            # no body to read (HEAD, 204, 304, ...)
+            r._close_conn()
+
+        r.url = req.get_full_url()
+        r.msg = r.reason
+        return r
+
+pool = ConnectionPool()
+
+class KeepAliveHandler(request.HTTPHandler):
+    def do_open(self, http_class, req, **http_conn_args):
+        return pool.urlopen(http_class, req, **http_conn_args)
+
+class KeepAliveHTTPSHandler(request.HTTPSHandler):
+    """Also takes the requests of any other HTTPSHandler of the opener (one
+    added for a TLS context of its own), with that handler's settings."""
+
+    # ahead of HTTPSHandlers added to the opener later
+    handler_order = request.HTTPSHandler.handler_order - 1
+
+    def do_open(self, http_class, req, **http_conn_args):
+        return pool.urlopen(http_class, req, **http_conn_args)
+
+    def https_open(self, req):
+        for handler in self.parent.handlers:
+            if isinstance(handler, request.HTTPSHandler) and \
+                    not isinstance(handler, KeepAliveHTTPSHandler):
+                # its own https_open(), but over a pooled connection
+                handler = copy.copy(handler)
+                handler.do_open = self.do_open
+                return type(handler).https_open(handler, req)
+        return super().https_open(req)
+
+def handlers():
+    """Returns the handlers that route urllib requests through the pool."""
+    return [KeepAliveHandler(), KeepAliveHTTPSHandler()]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import re
+import threading
+import time
+
+class TokenBucket:
+    """Allows `rate` bytes per second on average, in bursts of up to `burst`
+    bytes (one second's worth by default).
+
+    Transfers take tokens after reading; the bucket may go into debt, and
+    the reader then waits until the debt is paid back.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, n):
+        """Takes n tokens and returns the seconds to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def consume(self, n):
+        delay = self.reserve(n)
+        if delay > 0:
+            time.sleep(delay)
+
+class RateLimiter:
+    """A bandwidth limit for the whole process, plus limits per host.
+
+    A host limit set for 'example.com' also covers its subdomains; all
+    transfers from matching hosts share one bucket.
+    """
+
+    def __init__(self):
+        self.bucket = None
+        self.host_buckets = {}
+
+    def configure(self, rate=None, host_rates={}):
+        self.bucket = TokenBucket(rate) if rate else None
+        self.host_buckets = {host.lower().lstrip('.'): TokenBucket(r)
+                             for host, r in host_rates.items() if r}
+
+    def buckets(self, host):
+        buckets = [self.bucket] if self.bucket else []
+        if host and self.host_buckets:
+            labels = host.lower().split('.')
+            for i in range(len(labels)):
+                bucket = self.host_buckets.get('.'.join(labels[i:]))
+                if bucket:
+                    buckets.append(bucket)
+                    break
+        return buckets
+
+    def read_size(self, host, size):
+        """Caps a read size, so that throttled reads come about 10 times a
+        second rather than in long bursts."""
+        for bucket in self.buckets(host):
+            size = min(size, max(int(bucket.rate) // 10, 16 * 1024))
+        return size
+
+    def reserve(self, host, n):
+        """Takes n bytes from every bucket covering host, and returns the
+        seconds to wait for the slowest of them."""
+        return max([bucket.reserve(n) for bucket in self.buckets(host)], default=0)
+
+    def consume(self, host, n):
+        delay = self.reserve(host, n)
+        if delay > 0:
+            time.sleep(delay)
+
+limiter = RateLimiter()
+
+def parse_rate(s):
+    """Parses a rate such as '500K' or '2.5M' (bytes per second)."""
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)(?:i?B)?(?:/s)?\s*$', s)
+    if not m:
+        raise ValueError('invalid rate: %s' % s)
+    unit = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}[m.group(2).lower()]
+    return int(float(m.group(1)) * unit)
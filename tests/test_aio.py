@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from you_get import aio, common
+
+body = bytes(range(256)) * 4
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, data=b'', headers={}):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_CONNECT(self):
+        self.server.requests.append(('CONNECT', self.path))
+        self.send(403)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.do_GET()
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path))
+        self.server.ports.add(self.client_address[1])
+        path = self.path
+        if path.startswith('http://'):
+            # asked as a proxy
+            path = '/' + path.split('/', 3)[3]
+        if path == '/plain':
+            self.send(200, b'hello', {'Content-Type': 'text/plain; charset=utf-8'})
+        elif path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (b'hel', b'lo wor', b'ld'):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        elif path == '/redirect':
+            self.send(302, headers={'Location': '/plain'})
+        elif path == '/see-other':
+            self.send(303, headers={'Location': '/plain'})
+        elif path == '/file':
+            start = int(common.match1(self.headers.get('Range', ''), r'bytes=(\d+)-') or 0)
+            if start >= len(body):
+                self.send(416, headers={'Content-Range': 'bytes */%s' % len(body)})
+            else:
+                self.send(206, body[start:], {'Content-Range': 'bytes %s-%s/%s' % (start, len(body) - 1, len(body))})
+        else:
+            self.send(404)
+
+class TestAio(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.ports = set()
+        self.ctx = common.DownloadContext(proxy='')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_in_context(self, coro):
+        with self.ctx.activate():
+            return aio.run(coro)
+
+    def test_chunked(self):
+        self.assertEqual(self.run_in_context(aio.get_content(self.base + '/chunked')), 'hello world')
+
+    def test_redirects(self):
+        self.assertEqual(self.run_in_context(aio.get_content(self.base + '/redirect')), 'hello')
+        self.run_in_context(aio.post_content(self.base + '/see-other', post_data={'a': 1}))
+        self.assertEqual(self.server.requests[-2:], [('POST', '/see-other'), ('GET', '/plain')])
+
+    def test_keep_alive(self):
+        async def fetch():
+            return [await aio.get_content(self.base + path)
+                    for path in ('/plain', '/chunked', '/redirect')]
+        self.assertEqual(self.run_in_context(fetch()), ['hello', 'hello world', 'hello'])
+        self.assertEqual(len(self.server.ports), 1)
+
+    def test_resume(self):
+        filepath = os.path.join(self.dir, 'file')
+        with open(filepath + '.download', 'wb') as f:
+            f.write(body[:300])
+        self.run_in_context(aio.url_save(self.base + '/file', filepath, None))
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+    def test_resume_complete(self):
+        # 416 for a .download file that already has everything
+        filepath = os.path.join(self.dir, 'file')
+        with open(filepath + '.download', 'wb') as f:
+            f.write(body)
+        self.run_in_context(aio.url_save(self.base + '/file', filepath, None))
+        self.assertEqual(self.server.requests, [('GET', '/file')])
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+    def test_proxy(self):
+        self.ctx = common.DownloadContext(proxy=self.base[len('http://'):])
+        self.assertEqual(self.run_in_context(aio.get_content('http://example.invalid/plain')), 'hello')
+        self.assertEqual(self.server.requests, [('GET', 'http://example.invalid/plain')])
+        with self.assertRaises(ConnectionRefusedError):
+            self.run_in_context(aio.get_content('https://example.invalid/plain'))
+        self.assertEqual(self.server.requests[-1], ('CONNECT', 'example.invalid:443'))
+
+if __name__ == '__main__':
+    unittest.main()
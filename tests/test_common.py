@@ -1,7 +1,16 @@
 #!/usr/bin/env python
 
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from urllib import request
 
+from you_get import common
 from you_get.common import *
 
 class TestCommon(unittest.TestCase):
@@ -9,3 +18,132 @@ class TestCommon(unittest.TestCase):
     def test_match1(self):
         self.assertEqual(match1('http://youtu.be/1234567890A', r'youtu.be/([^/]+)'), '1234567890A')
         self.assertEqual(match1('http://youtu.be/1234567890A', r'youtu.be/([^/]+)', r'youtu.(\w+)'), ['1234567890A', 'be'])
+
+    def test_url_to_module(self):
+        self.assertEqual(url_to_module('http://v.youku.com/v_show/id_x.html')[0].__name__, 'you_get.extractors.youku')
+        self.assertEqual(url_to_module('http://video.sina.com.cn/v/b/1.html')[0].__name__, 'you_get.extractors.sina')
+        self.assertEqual(url_to_module('http://live.qq.com/10003715')[0].__name__, 'you_get.extractors.qie')
+        self.assertEqual(url_to_module('http://m.weibo.cn/status/1')[0].__name__, 'you_get.extractors.universal')
+
+    def test_batch_contexts(self):
+        openers = {}
+        def download(url, **kwargs):
+            install_opener(build_opener())
+            time.sleep(0.1)
+            openers[url] = get_context().opener
+        ctx = DownloadContext()
+        urls = ['http://a.example/1', 'http://b.example/2']
+        download_main(download, None, urls, False, ctx=ctx, batch_jobs=2)
+        self.assertIsNot(openers[urls[0]], openers[urls[1]])
+        self.assertNotIn(ctx.opener, openers.values())
+
+    def test_copy_opener(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ProxyHandler)
+        server.daemon_threads = True
+        server.paths = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(request.install_opener, request._opener)
+        set_http_proxy('127.0.0.1:%s' % server.server_address[1])
+        ctx = get_context().copy()
+        # the copy goes through the proxy, and can be changed on its own
+        ctx.opener.add_handler(request.HTTPCookieProcessor())
+        with ctx.activate():
+            self.assertEqual(get_content('http://example.invalid/a'), 'proxied')
+        self.assertEqual(server.paths, ['http://example.invalid/a'])
+        self.assertFalse(any(isinstance(x, request.HTTPCookieProcessor)
+                             for x in request._opener.handlers))
+        # unless it has a proxy of its own
+        self.assertTrue(any(isinstance(x, request.ProxyHandler)
+                            for x in ctx.opener.handlers))
+        self.assertFalse(any(isinstance(x, request.ProxyHandler)
+                             for x in get_context().copy(proxy='').opener.handlers))
+
+    def test_incremental_merge_error(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        def url_save_parts(urls, parts, bar, on_saved=None, **kwargs):
+            with open(parts[0], 'wb') as f:
+                f.write(b'\x47' + b'\x00' * 187)
+            on_saved(parts[0])
+            raise KeyboardInterrupt
+        ctx = DownloadContext(incremental_merge=True)
+        with mock.patch.object(common, 'url_save_parts', url_save_parts):
+            with self.assertRaises(KeyboardInterrupt):
+                download_urls(['http://a.example/1', 'http://a.example/2'],
+                              'video', 'ts', 376, output_dir, ctx=ctx)
+        self.assertEqual(os.listdir(output_dir), [])
+
+body = bytes(range(256)) * 4096
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = int(match1(self.headers.get('Range', ''), r'bytes=(\d+)-') or 0)
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, len(body) - 1, len(body)))
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '7')
+        self.end_headers()
+        self.wfile.write(b'proxied')
+
+class TestUrlSave(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%s/file' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.filepath = os.path.join(self.dir, 'file')
+
+    def save(self, **kwargs):
+        with DownloadContext(proxy='', **kwargs).activate():
+            url_save(self.url, self.filepath, None)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+    def test_resume(self):
+        with open(self.filepath + '.download', 'wb') as f:
+            f.write(body[:1000])
+        self.save()
+
+    def test_force(self):
+        # the .download file is not resumed, but overwritten
+        with open(self.filepath + '.download', 'wb') as f:
+            f.write(b'x' * 1000)
+        self.save(force=True)
+
+    def test_ranges_marker(self):
+        # left by an interrupted ranged download, in a preallocated file
+        with open(self.filepath + '.download', 'wb') as f:
+            f.write(body[:1000] + bytes(len(body) - 1000))
+        open(self.filepath + '.download.ranges', 'w').close()
+        self.save(connections=1)
+        self.assertFalse(os.path.exists(self.filepath + '.download.ranges'))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from you_get.processor import ffmpeg
+
+# an "ffmpeg" that always fails, too old for the concat demuxer
+failing = {'cmd': 'false', 'version': [1, 0], 'bsfs': [], 'muxers': []}
+
+class TestFFmpeg(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.output = os.path.join(self.dir, 'output')
+
+    def make_parts(self):
+        files = []
+        for i in range(2):
+            files.append(os.path.join(self.dir, '%s.part' % i))
+            open(files[-1], 'wb').close()
+        return files
+
+    @mock.patch.object(ffmpeg, 'get_ffmpeg', return_value=failing)
+    def test_failures(self, get_ffmpeg):
+        for concat in (ffmpeg.ffmpeg_concat_flv_to_mp4,
+                       ffmpeg.ffmpeg_concat_mp4_to_mp4,
+                       ffmpeg.ffmpeg_concat_mp4_to_mpg):
+            with self.assertRaises(subprocess.CalledProcessError):
+                concat(self.make_parts(), self.output)
+            # once the parts are remuxed
+            with mock.patch.object(ffmpeg, 'remux_parts', lambda ffmpeg, files, ext, args: files):
+                with self.assertRaises(subprocess.CalledProcessError):
+                    concat(self.make_parts(), self.output)
+
+if __name__ == '__main__':
+    unittest.main()
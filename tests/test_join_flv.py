@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from you_get.processor import join_flv
+
+def make_flv(path, tags):
+    """Writes an FLV of video and audio tags, 40 ms apart, with a keyframe
+    in every 10 video tags."""
+    meta = join_flv.ECMAObject(1)
+    meta.put('duration', tags * 0.04)
+    with open(path, 'wb') as f:
+        join_flv.write_flv_header(f)
+        join_flv.write_meta_tag(f, 'onMetaData', meta)
+        previous = f.tell() - 13
+        for i in range(tags):
+            video = (b'\x17' if i % 10 == 0 else b'\x27') + b'\x00' * 99
+            audio = b'\xaf' + b'\x00' * 9
+            join_flv.write_tag(f, (join_flv.TAG_TYPE_VIDEO, i * 40, len(video), video, previous))
+            join_flv.write_tag(f, (8, i * 40, len(audio), audio, 11 + len(video)))
+            previous = 11 + len(audio)
+        join_flv.write_uint(f, previous)
+
+class TestJoinFLV(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.parts = []
+        for i in range(3):
+            path = os.path.join(self.dir, '%s.flv' % i)
+            make_flv(path, 50)
+            self.parts.append(path)
+        self.output = os.path.join(self.dir, 'out.flv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_keyframes(self):
+        with open(self.output, 'rb') as f:
+            data = f.read()
+            f.seek(0)
+            join_flv.read_flv_header(f)
+            meta = join_flv.read_meta_tag(join_flv.read_tag(f))[1]
+        self.assertEqual(meta.get('filesize'), len(data))
+        keyframes = meta.get('keyframes')
+        for position, time in zip(keyframes['filepositions'], keyframes['times']):
+            p = int(position)
+            self.assertEqual(data[p], join_flv.TAG_TYPE_VIDEO)
+            self.assertEqual(data[p + 11] >> 4, join_flv.VIDEO_FRAME_KEYFRAME)
+            timestamp = int.from_bytes(data[p + 4:p + 7], 'big') | data[p + 7] << 24
+            self.assertEqual(timestamp, round(time * 1000))
+        return keyframes
+
+    def test_keyframes(self):
+        join_flv.concat_flv(self.parts, self.output)
+        keyframes = self.read_keyframes()
+        self.assertEqual(len(keyframes['filepositions']), 15)
+        times = keyframes['times']
+        self.assertTrue(all(a < b for a, b in zip(times, times[1:])))
+
+    def test_thinned_out(self):
+        writer = join_flv.FLVWriter(self.output, keyframes=4)
+        for part in self.parts:
+            writer.append(part)
+        writer.close()
+        self.assertEqual(len(self.read_keyframes()['filepositions']), 4)
+
+    def test_filler(self):
+        # room for 18 entries, guessed from the first part, and 100000
+        for keyframes in (None, 100000):
+            writer = join_flv.FLVWriter(self.output, keyframes=keyframes, parts=3)
+            for part in self.parts:
+                writer.append(part)
+            writer.close()
+            self.assertEqual(len(self.read_keyframes()['filepositions']), 15)
+
+    def test_filler_size(self):
+        # around the longest string with a 16-bit length
+        for size in [11, 18] + list(range(0xffff + 9, 0xffff + 16)):
+            meta = join_flv.ECMAObject(0)
+            meta.update('filler', join_flv.filler(size))
+            stream = join_flv.BytesIO()
+            join_flv.write_amf(stream, meta)
+            # the type, the count of properties and the end of the object
+            self.assertEqual(len(stream.getvalue()), 1 + 4 + size + 3)
+            stream.seek(0)
+            self.assertEqual(join_flv.read_amf(stream), meta)
+
+if __name__ == '__main__':
+    unittest.main()
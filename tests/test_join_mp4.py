@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from io import BytesIO
+
+from you_get.processor import join_mp4
+
+def box(type, body):
+    return struct.pack('>I4s', 8 + len(body), type) + body
+
+def make_moov(*tracks):
+    """Returns a moov with a video track for every list of chunk offsets,
+    which only has its hdlr and the atoms on the way to its stco."""
+    traks = b''
+    for offsets in tracks:
+        hdlr = box(b'hdlr', struct.pack('>I4s4sIII', 0, b'mhlr', b'vide', 0, 0, 0) + b'\x00')
+        stco = box(b'stco', struct.pack('>II%sI' % len(offsets), 0, len(offsets), *offsets))
+        traks += box(b'trak', box(b'mdia', hdlr + box(b'minf', box(b'stbl', stco))))
+    return join_mp4.read_atom(BytesIO(box(b'moov', traks)))
+
+def read_offsets(moov):
+    """Writes moov and reads it back, returning the type and offsets of the
+    chunk offset table of every track."""
+    out = BytesIO()
+    moov.write(out)
+    moov = join_mp4.read_atom(BytesIO(out.getvalue()))
+    assert moov.size == out.tell()
+    tables = [join_mp4.get_stco(trak) for trak in moov.get_all(b'trak')]
+    return moov.size, [(stco.type, list(stco.body[1])) for stco in tables]
+
+class TestJoinMP4(unittest.TestCase):
+    def test_stco(self):
+        moov = make_moov([0, 100], [50])
+        join_mp4.place_moov(moov, 1000)
+        size, tables = read_offsets(moov)
+        start = size + 1000
+        self.assertEqual(tables, [(b'stco', [start, start + 100]),
+                                  (b'stco', [start + 50])])
+
+    def test_co64(self):
+        moov = make_moov([0, 100], [50])
+        join_mp4.place_moov(moov, 0xffffffff)
+        size, tables = read_offsets(moov)
+        start = size + 0xffffffff
+        self.assertEqual(tables, [(b'co64', [start, start + 100]),
+                                  (b'co64', [start + 50])])
+
+    def test_boundary(self):
+        # the last offset is just within 32 bits
+        moov = make_moov([0, 100], [50])
+        stco_size = moov.calsize()
+        join_mp4.place_moov(moov, 0xffffffff - 100 - stco_size)
+        self.assertEqual(read_offsets(moov)[1][0][0], b'stco')
+
+        # just past it, with the moov after the data
+        moov = make_moov([0, 100], [50])
+        join_mp4.place_moov(moov, 0xffffffff - 99, before_data=False)
+        self.assertEqual(read_offsets(moov)[1][0], (b'co64', [0xffffffff - 99, 0xffffffff + 1]))
+
+    def test_edts(self):
+        # an empty edit, then the media from 1024 on
+        elst = box(b'elst', struct.pack('>II', 0, 2) + struct.pack('>IiHH', 100, -1, 1, 0)
+                   + struct.pack('>IiHH', 900, 1024, 1, 0))
+        edts = join_mp4.read_atom(BytesIO(box(b'edts', elst)))
+        join_mp4.merge_edts(edts, 3000)
+        self.assertEqual(edts.body[16:], struct.pack('>IiHH', 100, -1, 1, 0)
+                         + struct.pack('>IiHH', 2900, 1024, 1, 0))
+
+        # two media edits
+        elst = box(b'elst', struct.pack('>II', 1, 2) + struct.pack('>QqHH', 100, 0, 1, 0)
+                   + struct.pack('>QqHH', 900, 1024, 1, 0))
+        edts = join_mp4.read_atom(BytesIO(box(b'edts', elst)))
+        with self.assertRaises(Exception):
+            join_mp4.merge_edts(edts, 3000)
+
+    def test_tables(self):
+        def stbl(*types):
+            return join_mp4.read_atom(BytesIO(box(b'stbl', b''.join(
+                box(type, struct.pack('>II', 0, 0)) for type in types))))
+        stbls = [stbl(b'stts', b'sdtp', b'sgpd', b'sbgp'), stbl(b'stts', b'sdtp')]
+        join_mp4.check_tables(stbls)
+        self.assertEqual([x.type for x in stbls[0].body], [b'stts'])
+        with self.assertRaises(Exception):
+            join_mp4.check_tables([stbl(b'stts'), stbl(b'stts', b'subs')])
+
+    def test_writer_tracks(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        parts = []
+        for i, tracks in enumerate(([[0]], [[0], [0]])):
+            moov = BytesIO()
+            make_moov(*tracks).write(moov)
+            parts.append(os.path.join(tmp, '%s.mp4' % i))
+            with open(parts[-1], 'wb') as f:
+                f.write(moov.getvalue() + box(b'mdat', b'data'))
+        writer = join_mp4.MP4Writer(os.path.join(tmp, 'out.mp4'))
+        writer.append(parts[0])
+        size = writer.out.tell()
+        # rejected before any of it is written
+        with self.assertRaises(Exception):
+            writer.append(parts[1])
+        self.assertEqual(writer.out.tell(), size)
+        writer.out.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from you_get.processor import join_ts
+
+def packet(pid, cc, adaptation=False, payload=True):
+    flags = (0x20 if adaptation else 0) | (0x10 if payload else 0)
+    header = bytes([0x47, pid >> 8, pid & 0xff, flags | cc])
+    if adaptation:
+        # an adaptation field with no flags set
+        header += bytes([1, 0])
+    return header + b'\xaa' * (188 - len(header))
+
+def make_ts(path, packets):
+    with open(path, 'wb') as f:
+        for p in packets:
+            f.write(p)
+
+def read_packets(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert len(data) % 188 == 0
+    return [data[i:i + 188] for i in range(0, len(data), 188)]
+
+class TestJoinTS(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_repair(self):
+        parts = []
+        for i, start in enumerate((3, 9, 15)):
+            path = os.path.join(self.dir, '%s.ts' % i)
+            packets = [packet(0x100, (start + j) & 0x0f) for j in range(20)]
+            # audio starts with an adaptation field in the second part
+            packets.insert(0, packet(0x101, start, adaptation=(i == 1)))
+            packets.insert(1, packet(0x1fff, 0))
+            make_ts(path, packets)
+            parts.append(path)
+        output = join_ts.concat_ts(parts, os.path.join(self.dir, 'out.ts'), repair=True)
+
+        last = {}
+        discontinuities = {}
+        for p in read_packets(output):
+            pid = (p[1] & 0x1f) << 8 | p[2]
+            if pid == 0x1fff:
+                continue
+            cc = p[3] & 0x0f
+            if pid in last:
+                # only packets with a payload advance the counter
+                expected = (last[pid] + 1) & 0x0f if p[3] & 0x10 else last[pid]
+                self.assertEqual(cc, expected)
+            last[pid] = cc
+            if p[3] & 0x20 and p[4] and p[5] & 0x80:
+                discontinuities[pid] = discontinuities.get(pid, 0) + 1
+        # every PID is flagged where the second and third parts start
+        self.assertEqual(discontinuities, {0x100: 2, 0x101: 2})
+
+    def test_unaligned(self):
+        # left as it is
+        path = os.path.join(self.dir, '0.ts')
+        with open(path, 'wb') as f:
+            f.write(packet(0x100, 0)[:100])
+        output = join_ts.concat_ts([path, path], os.path.join(self.dir, 'out.ts'), repair=True)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), packet(0x100, 0)[:100] * 2)
+
+    def test_unaligned_part(self):
+        # parts after one that can't be repaired are copied as they are
+        parts = []
+        for i in range(3):
+            path = os.path.join(self.dir, '%s.ts' % i)
+            data = b''.join(packet(0x100, j) for j in range(5))
+            if i == 1:
+                data += b'\x00'
+            with open(path, 'wb') as f:
+                f.write(data)
+            parts.append(path)
+        output = join_ts.concat_ts(parts, os.path.join(self.dir, 'out.ts'), repair=True)
+        with open(output, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[-5 * 188:], b''.join(packet(0x100, j) for j in range(5)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import http.client
+import http.server
+import ssl
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib import request
+
+from you_get.util import keepalive
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.ports.append(self.client_address[1])
+        data = b'x' * (1024 * 1024 if self.path == '/big' else 16)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.path == '/drop':
+            # hang up without telling the client, as idle timeouts do
+            self.close_connection = True
+
+class PlainConnection(http.client.HTTPConnection):
+    """Takes the TLS arguments of an HTTPSConnection, but ignores them."""
+    def __init__(self, host, context=None, check_hostname=None, **kwargs):
+        super().__init__(host, **kwargs)
+
+class TestKeepAlive(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.ports = []
+        keepalive.pool.clear()
+        self.opener = request.build_opener(request.ProxyHandler({}),
+                                           *keepalive.handlers())
+
+    def tearDown(self):
+        keepalive.pool.clear()
+
+    def idle(self):
+        return sum(len(conns) for conns in keepalive.pool.idle.values())
+
+    def test_reuse(self):
+        for i in range(3):
+            with self.opener.open(self.base + '/small') as r:
+                self.assertEqual(len(r.read()), 16)
+            self.assertEqual(self.idle(), 1)
+        self.assertEqual(len(set(self.server.ports)), 1)
+
+    def test_early_close(self):
+        r = self.opener.open(self.base + '/big')
+        r.read(1024)
+        r.close()
+        self.assertEqual(self.idle(), 0)
+        with self.opener.open(self.base + '/small') as r:
+            r.read()
+        self.assertEqual(len(set(self.server.ports)), 2)
+
+    def test_stale_retry(self):
+        with self.opener.open(self.base + '/drop') as r:
+            r.read()
+        self.assertEqual(self.idle(), 1)
+        time.sleep(0.1)
+        # the idle connection is dead; the request is sent again, once
+        with self.opener.open(self.base + '/small') as r:
+            self.assertEqual(len(r.read()), 16)
+        self.assertEqual(len(self.server.ports), 2)
+        self.assertEqual(len(set(self.server.ports)), 2)
+
+    def test_tls_contexts(self):
+        contexts = [ssl.create_default_context(), ssl.create_default_context()]
+        for context in (contexts[0], contexts[1], contexts[0]):
+            req = request.Request(self.base + '/small')
+            req.timeout = None
+            with keepalive.pool.urlopen(PlainConnection, req, context=context) as r:
+                r.read()
+        # the third request reuses the connection of the first
+        self.assertEqual(len(self.server.ports), 3)
+        self.assertEqual(len(set(self.server.ports)), 2)
+
+    def test_custom_https_handler(self):
+        context = ssl.create_default_context()
+        self.opener.add_handler(request.HTTPSHandler(context=context))
+        with mock.patch.object(keepalive.pool, 'urlopen') as urlopen:
+            urlopen.return_value.code = 200
+            self.opener.open('https://example.invalid/')
+        self.assertIs(urlopen.call_args[1]['context'], context)
+
+if __name__ == '__main__':
+    unittest.main()
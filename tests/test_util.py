@@ -1,11 +1,224 @@
 #!/usr/bin/env python
 
+import http.cookiejar
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from urllib import request
 
 from you_get.util.fs import *
+from you_get.util import ratelimit, httpcache, batch, cache
+from you_get import common
 
 class TestUtil(unittest.TestCase):
     def test_legitimize(self):
         self.assertEqual(legitimize("1*2", os="Linux"), "1*2")
         self.assertEqual(legitimize("1*2", os="Darwin"), "1*2")
         self.assertEqual(legitimize("1*2", os="Windows"), "1-2")
+
+class TestRateLimit(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('100'), 100)
+        self.assertEqual(ratelimit.parse_rate('500K'), 500 * 1024)
+        self.assertEqual(ratelimit.parse_rate('2.5M'), int(2.5 * 1024 ** 2))
+        self.assertEqual(ratelimit.parse_rate('1 g'), 1024 ** 3)
+        self.assertEqual(ratelimit.parse_rate('64KiB/s'), 64 * 1024)
+        self.assertEqual(ratelimit.parse_rate('1MB'), 1024 ** 2)
+        for s in ('', 'fast', '1T', '-1K', '1.K'):
+            with self.assertRaises(ValueError):
+                ratelimit.parse_rate(s)
+
+    def test_host_buckets(self):
+        limiter = ratelimit.RateLimiter()
+        limiter.configure(None, {'.Example.com': 1000, 'other.com': 0})
+        bucket, = limiter.buckets('example.com')
+        self.assertEqual(limiter.buckets('cdn.EXAMPLE.com'), [bucket])
+        self.assertEqual(limiter.buckets('a.b.example.com'), [bucket])
+        self.assertEqual(limiter.buckets('notexample.com'), [])
+        self.assertEqual(limiter.buckets('other.com'), [])
+        # subdomains draw on the same tokens
+        self.assertEqual(limiter.reserve('a.example.com', 1000), 0)
+        self.assertAlmostEqual(limiter.reserve('b.example.com', 500), 0.5, places=1)
+        self.assertEqual(limiter.reserve('other.com', 10 ** 6), 0)
+
+    def test_global_bucket(self):
+        limiter = ratelimit.RateLimiter()
+        limiter.configure(10 ** 6, {'example.com': 1000})
+        self.assertEqual(len(limiter.buckets('cdn.example.com')), 2)
+        self.assertEqual(len(limiter.buckets('other.com')), 1)
+        self.assertEqual(limiter.read_size('other.com', 1 << 20), 100000)
+        self.assertEqual(limiter.read_size('cdn.example.com', 1 << 20), 16 * 1024)
+
+class CacheHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = b'hello'
+        if self.path == '/whoami':
+            body = (self.headers.get('Cookie') or 'nobody').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('ETag', '"v1"')
+        if self.path == '/no-store':
+            self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class TestHTTPCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CacheHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.dir = tempfile.mkdtemp()
+        patcher = mock.patch.dict(os.environ, {'YOU_GET_CACHE_DIR': self.dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_ttl(self):
+        self.assertEqual(httpcache.ttl('r4---sn-abc.googlevideo.com'), 0)
+        self.assertEqual(httpcache.ttl('WWW.YouTube.com'), 30 * 60)
+        self.assertEqual(httpcache.ttl('example.com'), httpcache.default_ttl)
+        host = 'www.youtube.com'
+        self.assertTrue(httpcache.fresh({'time': time.time() - 60}, host))
+        self.assertFalse(httpcache.fresh({'time': time.time() - 31 * 60}, host))
+        self.assertFalse(httpcache.fresh({'time': time.time()}, 'googlevideo.com'))
+
+    def test_revalidate(self):
+        ctx = common.DownloadContext(proxy='', http_cache=True)
+        with ctx.activate():
+            self.assertEqual(common.get_content(self.base + '/etag'), 'hello')
+            self.assertEqual(common.get_content(self.base + '/etag'), 'hello')
+            self.assertEqual(self.server.requests, [('/etag', None)])
+            with mock.patch.object(httpcache, 'fresh', return_value=False):
+                self.assertEqual(common.get_content(self.base + '/etag'), 'hello')
+            self.assertEqual(self.server.requests[1], ('/etag', '"v1"'))
+            # not cached
+            common.get_content(self.base + '/no-store')
+            common.get_content(self.base + '/no-store')
+            self.assertEqual(len(self.server.requests), 4)
+
+    def test_cookies(self):
+        def cookies(value):
+            jar = http.cookiejar.CookieJar()
+            jar.set_cookie(http.cookiejar.Cookie(
+                0, 'user', value, None, False, '127.0.0.1', False, False,
+                '/', True, False, None, False, None, None, {}))
+            return jar
+        url = self.base + '/whoami'
+        with common.DownloadContext(proxy='', http_cache=True).activate():
+            self.assertEqual(common.get_content(url), 'nobody')
+            # cookies of the context, then of a cookie handler of the opener
+            with common.get_context().copy(cookies=cookies('alice')).activate():
+                self.assertEqual(common.get_content(url), 'user=alice')
+            common.install_opener(common.build_opener(
+                request.ProxyHandler({}), request.HTTPCookieProcessor(cookies('bob'))))
+            self.assertEqual(common.get_content(url), 'user=bob')
+            self.assertEqual(common.get_content(url), 'user=bob')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_evict(self):
+        now = time.time()
+        for i, name in enumerate('abc'):
+            httpcache.store(name, {}, b'x' * 1000)
+            os.utime(httpcache.path(name), (now - 30 + i, now - 30 + i))
+        # a is the oldest, but the most recently used
+        self.assertEqual(httpcache.load('a')[1], b'x' * 1000)
+        with mock.patch.object(httpcache, 'max_size', 3100):
+            httpcache.store('d', {}, b'x' * 1000)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, 'http'))),
+                         ['a', 'c', 'd'])
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        patcher = mock.patch.dict(os.environ, {'YOU_GET_CACHE_DIR': self.dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_probe_binary(self):
+        probe = mock.Mock(side_effect=[None, 'v1', 'v2'])
+        # a failed probe is tried again, a successful one is kept
+        self.assertIsNone(cache.probe_binary('true', probe, 'probe'))
+        self.assertEqual(cache.probe_binary('true', probe, 'probe'), 'v1')
+        self.assertEqual(cache.probe_binary('true', probe, 'probe'), 'v1')
+        self.assertEqual(probe.call_count, 2)
+        self.assertIsNone(cache.probe_binary('no-such-binary', probe, 'probe'))
+
+class TestBatch(unittest.TestCase):
+    def test_site_jobs(self):
+        lock = threading.Lock()
+        running = {}
+        peaks = {}
+        def job(site):
+            with lock:
+                running[site] = running.get(site, 0) + 1
+                running[None] = running.get(None, 0) + 1
+                for k in (site, None):
+                    peaks[k] = max(peaks.get(k, 0), running[k])
+            time.sleep(0.05)
+            with lock:
+                running[site] -= 1
+                running[None] -= 1
+        jobs = batch.Batch(4, site_jobs=1)
+        for i in range(3):
+            for site in ('a', 'b', 'c'):
+                jobs.add(site, '%s%s' % (site, i), job, site)
+        jobs.run()
+        self.assertEqual(peaks, {'a': 1, 'b': 1, 'c': 1, None: 3})
+
+    def test_turns(self):
+        # one thread: the sites alternate
+        order = []
+        jobs = batch.Batch(1)
+        for name in ('a1', 'a2', 'a3', 'b1', 'b2'):
+            jobs.add(name[0], name, order.append, name)
+        jobs.run()
+        self.assertEqual(order, ['a1', 'b1', 'a2', 'b2', 'a3'])
+
+    def test_errors(self):
+        done = []
+        jobs = batch.Batch(2)
+        jobs.add('a', 'ok1', done.append, 1)
+        failed = jobs.add('a', 'bad', int, 'x')
+        exited = jobs.add('b', 'exit', sys.exit, 2)
+        jobs.add('b', 'ok2', done.append, 2)
+        with mock.patch.object(batch.log, 'e'):
+            jobs.run()
+        self.assertEqual(sorted(done), [1, 2])
+        self.assertIsInstance(failed.error, ValueError)
+        self.assertIsInstance(exited.error, SystemExit)
+        self.assertEqual(jobs.summary(), [
+            '2 of 4 succeeded',
+            'failed: bad (%s)' % failed.error,
+            'failed: exit (exit status 2)',
+        ])